@@ -14,15 +14,14 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import ClusterGetJSONEncoder
+from vmwarelib.serialize import CLUSTER_GET_SERIALIZER
 from vmwarelib.actions import BaseAction
 from pyVmomi import vim  # pylint: disable-msg=E0611
-import json
 
 
 class ClusterGet(BaseAction):
     def get_cluster_dict(self, cluster):
-        summary = json.loads(json.dumps(cluster.summary, cls=ClusterGetJSONEncoder))
+        summary = CLUSTER_GET_SERIALIZER.serialize(cluster.summary)
         return_dict = {
             'name': cluster.name,
             # extract moid from vim.ManagedEntity object
@@ -14,16 +14,14 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import DatacenterGetJSONEncoder
+from vmwarelib.serialize import DATACENTER_GET_SERIALIZER
 from vmwarelib.actions import BaseAction
 from pyVmomi import vim  # pylint: disable-msg=E0611
-import json
 
 
 class DatacenterGet(BaseAction):
     def get_datacenter_dict(self, datacenter):
-        configuration = json.loads(json.dumps(datacenter.configuration,
-                                              cls=DatacenterGetJSONEncoder))
+        configuration = DATACENTER_GET_SERIALIZER.serialize(datacenter.configuration)
         return_dict = {
             'name': datacenter.name,
             # extract moid from vim.ManagedEntity object
@@ -14,15 +14,14 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import DatastoreGetJSONEncoder
+from vmwarelib.serialize import DATASTORE_GET_SERIALIZER
 from vmwarelib.actions import BaseAction
 from pyVmomi import vim  # pylint: disable-msg=E0611
-import json
 
 
 class DatastoreGet(BaseAction):
     def get_datastore_dict(self, datastore):
-        summary = json.loads(json.dumps(datastore.summary, cls=DatastoreGetJSONEncoder))
+        summary = DATASTORE_GET_SERIALIZER.serialize(datastore.summary)
         return_dict = {
             'name': datastore.name,
             'id': summary['datastore']['_moId'],
@@ -50,7 +49,12 @@ class DatastoreGet(BaseAction):
 
         return list(results.values())
 
-    def run(self, datastore_ids, datastore_names, vsphere=None):
+    def get_datastores(self, datastore_ids, datastore_names):
+        if not datastore_ids and not datastore_names:
+            return self.get_all()
+        return self.get_by_id_or_name(datastore_ids, datastore_names)
+
+    def run(self, datastore_ids, datastore_names, vsphere=None, vspheres=None):
         """
         Retrieve summary information for given datastores (ESXi)
 
@@ -58,17 +62,16 @@ class DatastoreGet(BaseAction):
         - datastore_ids: Moid of datastore to retrieve
         - datastore_names: Name of datastore to retrieve
         - vsphere: Pre-configured vsphere connection details (config.yaml)
+        - vspheres: Several pre-configured vsphere connections to query concurrently
 
         Returns:
-        - array: Datastore objects
+        - array: Datastore objects. Keyed by vsphere connection first when
+                 vspheres is given.
         """
-        return_results = []
+        if vspheres:
+            return dict(self.run_on_vspheres(vspheres, DatastoreGet.get_datastores,
+                                             datastore_ids, datastore_names))
 
         self.establish_connection(vsphere)
 
-        if not datastore_ids and not datastore_names:
-            return_results = self.get_all()
-        else:
-            return_results = self.get_by_id_or_name(datastore_ids, datastore_names)
-
-        return return_results
+        return self.get_datastores(datastore_ids, datastore_names)
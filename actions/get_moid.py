@@ -33,16 +33,20 @@ class GetMoid(BaseAction):
 
         self.establish_connection(vsphere)
 
+        # consult vSphere once for the names of every managed entity of the specified type
+        entities = {}
+        for entity, properties in inventory.get_entity_properties(self.si_content, vimtype):
+            entities.setdefault(properties.get('name'), []).append(entity)
+
         results = {}
         for name in object_names:
-            try:
-                # consult vSphere for the managed_entity object that is the specified name and type
-                managed_entity = inventory.get_managed_entity(self.si_content, vimtype, name=name)
-
-                # extract moid from vim.ManagedEntity object
-                results[name] = str(managed_entity).split(':')[-1].replace("'", "")
-            except Exception as e:
-                self.logger.warning(str(e))
+            matches = entities.get(name, [])
+            if not matches:
+                self.logger.warning("Inventory Error: Unable to Find Object (%s): %s"
+                                    % (vimtype, name))
+            else:
+                # same as get_managed_entity, the first object with the name wins
+                results[name] = matches[0]._moId
 
         # Raise an error if no MOIDs were found for the VMs
         if not results:
@@ -16,17 +16,22 @@ from vmwarelib.actions import BaseAction
 
 
 class GetTagValueFromObjects(BaseAction):
-    def get_tags(self, category, object_id, object_type):
-        obj_tags = self.tagging.tag_association_list_attached_tags(object_type, object_id)
+    def get_tags(self, category, object_ids, object_type):
+        # fetch the tags attached to all of the objects and the tags of the category once
+        attached = self.tagging.tag_association_list_attached_tags_on_objects(object_type,
+                                                                              object_ids)
         cat_tags = self.tagging.tag_list(category['id'])
-        tags = [self.tagging.tag_get(tag_id) for tag_id in cat_tags if tag_id in obj_tags]
 
-        if not tags:
-            # if no tags found return empty array
-            return []
+        result = {}
+        for object_id in object_ids:
+            obj_tags = attached[object_id]
+            tags = [self.tagging.tag_get_cached(tag_id) for tag_id in cat_tags
+                    if tag_id in obj_tags]
 
-        # Return array of values
-        return [tag['name'] for tag in tags]
+            # Return array of values, empty if no tags found
+            result[object_id] = [tag['name'] for tag in tags]
+
+        return result
 
     def run(self, category_name, object_ids, object_type, vsphere=None):
         """
@@ -51,8 +56,4 @@ class GetTagValueFromObjects(BaseAction):
         if not category:
             raise ValueError("Category: '{}' not found!".format(category_name))
 
-        result = {}
-        for object_id in object_ids:
-            result[object_id] = self.get_tags(category, object_id, object_type)
-
-        return result
+        return self.get_tags(category, object_ids, object_type)
@@ -16,20 +16,26 @@ from vmwarelib.actions import BaseAction
 
 
 class GetTagsFromObjects(BaseAction):
-    def get_tags(self, object_id, object_type):
-        obj_tags = self.tagging.tag_association_list_attached_tags(object_type, object_id)
-        tags = {}
-        for obj in obj_tags:
-            tag = self.tagging.tag_get(obj)
-            category = self.tagging.category_get(tag['category_id'])
+    def get_tags(self, object_ids, object_type):
+        # fetch the tags attached to all of the objects at once
+        attached = self.tagging.tag_association_list_attached_tags_on_objects(object_type,
+                                                                              object_ids)
+        result = {}
+        for object_id in object_ids:
+            tags = {}
+            for tag_id in attached[object_id]:
+                tag = self.tagging.tag_get_cached(tag_id)
+                category = self.tagging.category_get_cached(tag['category_id'])
 
-            # Categories can have multiple tags associated to them
-            if category['name'] not in tags:
-                tags[category['name']] = []
-            tags[category['name']].append(tag['name'])
+                # Categories can have multiple tags associated to them
+                if category['name'] not in tags:
+                    tags[category['name']] = []
+                tags[category['name']].append(tag['name'])
 
-        # dictionary of category name: tag name
-        return tags
+            # dictionary of category name: tag name
+            result[object_id] = tags
+
+        return result
 
     def run(self, object_ids, object_type, vsphere=None):
         """
@@ -47,8 +53,4 @@ class GetTagsFromObjects(BaseAction):
         """
         self.connect_rest(vsphere)
 
-        result = {}
-        for object_id in object_ids:
-            result[object_id] = self.get_tags(object_id, object_type)
-
-        return result
+        return self.get_tags(object_ids, object_type)
@@ -15,7 +15,16 @@
 
 from pyVmomi import vim  # pylint: disable-msg=E0611
 
+from vmwarelib import inventory
 from vmwarelib.actions import BaseAction
+from vmwarelib.serialize import DEFAULT_SERIALIZER
+
+# properties returned for every VM, mapped to the key they are returned under
+DEFAULT_PROPERTIES = {
+    'name': 'name',
+    'config.guestFullName': 'os',
+    'runtime.powerState': 'runtime.powerState',
+}
 
 
 class GetVMs(BaseAction):
@@ -24,161 +33,116 @@ class GetVMs(BaseAction):
             datastore_clusters=None, resource_pools=None,
             vapps=None, hosts=None, folders=None, clusters=None,
             datacenters=None, virtual_switches=None,
-            no_recursion=False, vsphere=None):
+            no_recursion=False, properties=None, vsphere=None, vspheres=None):
         # TODO: food for thought. PowerCli contains additional
         # parameters that are not present here for the folliwing reason:
-        # <server> - we may need to bring it in if we decide to have
-        #            connections to more than 1 VC.
         # <tag>    - Tags in VC are not the same as tags you see in Web
         #            Client for the reason, that those tags are stored
         #            in Inventory Service only. PowerCli somehow can access
         #            it, from vSphere SDK there is no way.
+        selectors = dict(ids=ids, names=names, uuids=uuids, datastores=datastores,
+                         datastore_clusters=datastore_clusters,
+                         resource_pools=resource_pools, vapps=vapps, hosts=hosts,
+                         folders=folders, clusters=clusters, datacenters=datacenters,
+                         virtual_switches=virtual_switches, no_recursion=no_recursion,
+                         properties=properties)
+
+        # the <server> parameter of PowerCli, query several vCenters at once
+        if vspheres:
+            return dict(self.run_on_vspheres(vspheres, GetVMs.get_vms, **selectors))
 
         self.establish_connection(vsphere)
 
-        props = ['config.guestFullName', 'name', 'runtime.powerState']
-        moid_to_vm = {}
+        return self.get_vms(**selectors)
 
-        # getting vms by their moids
-        vms_from_moids = []
-        if ids:
-            container = self.si_content.viewManager.CreateContainerView(
-                self.si_content.rootFolder, [vim.VirtualMachine], True)
-            for vm in container.view:
-                moid = str(vm).split(':')[1].replace('\'', '')
-                if moid in ids:
-                    vms_from_moids.append(vm)
-            GetVMs.__add_vm_properties_to_map_from_vm_array(moid_to_vm,
-                                                            vms_from_moids)
-
-        # getting vms by their names
-        vms_from_names = []
-        if names:
-            container = self.si_content.viewManager.CreateContainerView(
-                self.si_content.rootFolder, [vim.VirtualMachine], True)
-            for vm in container.view:
-                if vm.name in names:
-                    vms_from_names.append(vm)
-            GetVMs.__add_vm_properties_to_map_from_vm_array(
-                moid_to_vm, vms_from_names)
-
-        # getting vms by their uuids
-        vms_from_uuids = []
-        if uuids:
-            container = self.si_content.viewManager.CreateContainerView(
-                self.si_content.rootFolder, [vim.VirtualMachine], True)
-            for vm in container.view:
-                if vm.config.uuid in uuids:
-                    vms_from_uuids.append(vm)
-            GetVMs.__add_vm_properties_to_map_from_vm_array(moid_to_vm,
-                                                            vms_from_uuids)
-
-        # getting vms from datastore objects
-        vms_from_datastores = []
-        if datastores:
-            vim_datastores = [vim.Datastore(moid, stub=self.si._stub)
-                              for moid in datastores]
-            for ds in vim_datastores:
-                vms_from_datastores.extend(ds.vm)
-            GetVMs.__add_vm_properties_to_map_from_vm_array(
-                moid_to_vm, vms_from_datastores)
-
-        # getting vms from datastore cluster objects
-        vms_from_datastore_clusters = []
-        if datastore_clusters:
-            vim_datastore_clusters = [
-                vim.StoragePod(moid, stub=self.si._stub)
-                for moid in datastore_clusters
-            ]
-            for ds_cl in vim_datastore_clusters:
-                for ds in ds_cl.childEntity:
-                    vms_from_datastore_clusters.extend(ds.vm)
-            GetVMs.__add_vm_properties_to_map_from_vm_array(
-                moid_to_vm, vms_from_datastore_clusters)
-
-        # getting vms from virtual switch objects
-        vms_from_virtual_switches = []
-        if virtual_switches:
-            vim_virtual_switches = [
-                vim.DistributedVirtualSwitch(moid, stub=self.si._stub)
-                for moid in virtual_switches
-            ]
-            for vswitch in vim_virtual_switches:
-                for pg in vswitch.portgroup:
-                    vms_from_virtual_switches.extend(pg.vm)
-            GetVMs.__add_vm_properties_to_map_from_vm_array(
-                moid_to_vm, vms_from_virtual_switches)
-
-        # getting vms from containers (location param)
-        vms_from_containers = []
-        containers = []
-
-        if resource_pools:
-            containers += [vim.ResourcePool(moid, stub=self.si._stub)
-                           for moid in resource_pools]
-
-        if vapps:
-            containers += [vim.VirtualApp(moid, stub=self.si._stub)
-                           for moid in vapps]
-
-        if hosts:
-            containers += [vim.HostSystem(moid, stub=self.si._stub)
-                           for moid in hosts]
-
-        if folders:
-            containers += [vim.Folder(moid, stub=self.si._stub)
-                           for moid in folders]
-
-        if clusters:
-            containers += [vim.ComputeResource(moid, stub=self.si._stub)
-                           for moid in clusters]
-
-        if datacenters:
-            containers += [vim.Datacenter(moid, stub=self.si._stub)
-                           for moid in datacenters]
-
-        for cont in containers:
-            objView = self.si_content.viewManager.CreateContainerView(
-                cont, [vim.VirtualMachine], not no_recursion)
-            tSpec = vim.PropertyCollector.TraversalSpec(
-                name='tSpecName', path='view', skip=False,
-                type=vim.view.ContainerView)
-            pSpec = vim.PropertyCollector.PropertySpec(
-                all=False, pathSet=props, type=vim.VirtualMachine)
-            oSpec = vim.PropertyCollector.ObjectSpec(
-                obj=objView, selectSet=[tSpec], skip=False)
-            pfSpec = vim.PropertyCollector.FilterSpec(
-                objectSet=[oSpec], propSet=[pSpec],
-                reportMissingObjectsInResults=False)
-            retOptions = vim.PropertyCollector.RetrieveOptions()
-            retProps = self.si_content.propertyCollector.RetrievePropertiesEx(
-                specSet=[pfSpec], options=retOptions)
-            vms_from_containers += retProps.objects
-            while retProps.token:
-                retProps = self.si_content.propertyCollector.\
-                    ContinueRetrievePropertiesEx(
-                        token=retProps.token)
-                vms_from_containers += retProps.objects
-            objView.Destroy()
-
-        for vm in vms_from_containers:
-            if vm.obj._GetMoId() not in moid_to_vm:
-                moid_to_vm[vm.obj._GetMoId()] = {
-                    "moid": vm.obj._GetMoId(),
-                    "name": vm.propSet[1].val,
-                    "os": vm.propSet[0].val,
-                    "runtime.powerState": vm.propSet[2].val
-                }
+    def get_vms(self, ids=None, names=None, uuids=None, datastores=None,
+                datastore_clusters=None, resource_pools=None,
+                vapps=None, hosts=None, folders=None, clusters=None,
+                datacenters=None, virtual_switches=None,
+                no_recursion=False, properties=None):
+        path_set = list(DEFAULT_PROPERTIES.keys())
+        for path in properties or []:
+            if path not in path_set:
+                path_set.append(path)
+
+        moid_to_vm = {}
+        views = []
+        object_specs = []
+        try:
+            # getting vms by their moids, names and uuids from a scan of every vm
+            # in the inventory that only reads what is needed to match them, the
+            # requested properties are then retrieved for the matching vms only
+            if ids or names or uuids:
+                scan_path_set = ['name', 'config.uuid'] if uuids else ['name']
+                for vm, props in inventory.get_entity_properties(self.si_content,
+                                                                 vim.VirtualMachine,
+                                                                 path_set=scan_path_set):
+                    if ((ids and vm._moId in ids) or
+                            (names and props.get('name') in names) or
+                            (uuids and props.get('config.uuid') in uuids)):
+                        object_specs.append(inventory.object_spec(vm, skip=False))
+
+            # getting vms from every other selector by traversing from the selected
+            # objects to their vms, all through a single property collector filter
+            object_specs += self.object_specs(vim.Datastore, datastores)
+            object_specs += self.object_specs(vim.StoragePod, datastore_clusters)
+            object_specs += self.object_specs(vim.DistributedVirtualSwitch,
+                                              virtual_switches)
+
+            # getting vms from containers (location param)
+            containers = []
+            for vimtype, moids in [(vim.ResourcePool, resource_pools),
+                                   (vim.VirtualApp, vapps),
+                                   (vim.HostSystem, hosts),
+                                   (vim.Folder, folders),
+                                   (vim.ComputeResource, clusters),
+                                   (vim.Datacenter, datacenters)]:
+                containers += [vimtype(moid, stub=self.si._stub) for moid in moids or []]
+
+            for cont in containers:
+                view = self.si_content.viewManager.CreateContainerView(
+                    cont, [vim.VirtualMachine], not no_recursion)
+                views.append(view)
+                object_specs.append(inventory.container_view_spec(view))
+
+            if object_specs:
+                vms = inventory.retrieve_properties(self.si_content, object_specs,
+                                                    vim.VirtualMachine, path_set)
+                for vm, props in vms:
+                    self.add_vm_to_map(moid_to_vm, vm, props, path_set)
+        finally:
+            for view in views:
+                view.Destroy()
 
         return list(moid_to_vm.values())
 
-    @staticmethod
-    def __add_vm_properties_to_map_from_vm_array(vm_map, vm_array):
-        for vm in vm_array:
-            if vm._GetMoId() not in vm_map:
-                vm_map[vm._GetMoId()] = {
-                    "moid": vm._GetMoId(),
-                    "name": vm.name,
-                    "os": vm.config.guestFullName,
-                    "runtime.powerState": vm.runtime.powerState
-                }
+    def object_specs(self, vimtype, moids):
+        if not moids:
+            return []
+
+        # the collector only follows the specs whose type matches the object,
+        # the rest are needed so the nested selections can be resolved by name
+        select_set = [
+            inventory.traversal_spec('datastoreToVm', vim.Datastore, 'vm'),
+            inventory.traversal_spec('storagePodToDatastore', vim.StoragePod, 'childEntity',
+                                     ['datastoreToVm']),
+            inventory.traversal_spec('portgroupToVm', vim.Network, 'vm'),
+            inventory.traversal_spec('switchToPortgroup', vim.DistributedVirtualSwitch,
+                                     'portgroup', ['portgroupToVm']),
+        ]
+        return [inventory.object_spec(vimtype(moid, stub=self.si._stub), select_set)
+                for moid in moids]
+
+    def add_vm_to_map(self, vm_map, vm, props, path_set):
+        moid = vm._moId
+        if moid in vm_map:
+            return
+
+        result = {"moid": moid}
+        for path in path_set:
+            key = DEFAULT_PROPERTIES.get(path, path)
+            value = props.get(path)
+            if path not in DEFAULT_PROPERTIES:
+                value = DEFAULT_SERIALIZER.serialize(value)
+            result[key] = value
+        vm_map[moid] = result
@@ -0,0 +1,81 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from vmwarelib.guest import GuestAction, DEFAULT_MAX_WORKERS, SHARED_UPLOAD_MAX_SIZE
+import hashlib
+import os
+
+
+class DistributeFileToGuests(GuestAction):
+
+    def run(self, username, password, guest_directory, local_path, vm_ids=None,
+            folder_id=None, cluster_id=None, overwrite=True,
+            max_workers=DEFAULT_MAX_WORKERS, vsphere=None):
+        """
+        Upload the same file to a directory inside many guests concurrently.
+
+        Args:
+        - username: username to perform the operation in every guest
+        - password: password of that user
+        - guest_directory: Directory name in the guests to store the file
+        - local_path: The full path to the local file, or a path relative to
+                      the packs directory when prefixed with pack:
+        - vm_ids: MOIDs of the Virtual Machines to upload the file to
+        - folder_id: MOID of a folder, upload to every VM beneath it instead
+        - cluster_id: MOID of a cluster, upload to every VM in it instead
+        - overwrite: replace the file in the guests if it already exists
+        - max_workers: number of guests to upload to at the same time
+        - vsphere: Pre-configured vsphere connection details (config.yaml)
+
+        Returns:
+        - dict: the guest path, size and SHA-256 of the file, the number of
+                VMs that succeeded and failed and the status and timings of
+                the upload to each VM. The action fails if any upload failed.
+        """
+        self.prepare_multi_guest_operation(vsphere, username, password)
+        vms = self.get_guest_vms(vm_ids, folder_id, cluster_id)
+
+        full_local_path = self.resolve_local_path(local_path)
+        guest_path = self.joinpath(guest_directory, os.path.basename(full_local_path))
+        size = os.path.getsize(full_local_path)
+
+        if size <= SHARED_UPLOAD_MAX_SIZE:
+            with open(full_local_path, 'rb') as local_file:
+                data = local_file.read()
+            sha256 = hashlib.sha256(data).hexdigest()
+            results = self.run_on_guests(
+                vms, lambda action: action.upload_data(data, guest_path, overwrite),
+                max_workers)
+        else:
+            results = self.run_on_guests(
+                vms, lambda action: action.upload_file(full_local_path, guest_path, overwrite),
+                max_workers)
+            sha256 = next((r['result']['sha256'] for r in results
+                           if r['status'] == 'succeeded'), None)
+
+        failed = len([r for r in results if r['status'] == 'failed'])
+        self.logger.info("Uploaded %s bytes to %s on %s of %s VMs" %
+                         (size, guest_path, len(results) - failed, len(results)))
+
+        output = {'path': guest_path,
+                  'size': size,
+                  'sha256': sha256,
+                  'succeeded': len(results) - failed,
+                  'failed': failed,
+                  'vms': results}
+        if failed:
+            return (False, output)
+        return output
@@ -20,9 +20,10 @@ import requests
 class InitiateFileTransferFromGuest(GuestAction):
 
     def run(self, vm_id, username, password, guest_directory, guest_file,
+            local_path=None, offset=0, length=None, tail_bytes=None,
             vsphere=None):
         """
-        Read the contents of a file on the guest.
+        Read the contents of a file on the guest, or download it to a local file.
 
         Args:
         - vm_id: MOID of the Virtual Machine
@@ -31,15 +32,39 @@ class InitiateFileTransferFromGuest(GuestAction):
         - guest_directory: full path to the directory containing the file
         - guest_file: full path to the file on the guest if guest_directory
         -             is None, otherwise a path relative to guest_directory
+        - local_path: stream the file to this local path and only return
+                      its metadata instead of its contents
+        - offset: first byte of the file to read
+        - length: number of bytes to read, until the end of the file if None
+        - tail_bytes: only read the last tail_bytes of the file
         - vsphere: Pre-configured vsphere connection details (config.yaml)
+
+        Returns:
+        - string: the contents of the file (or of the requested range)
+        - dict: the size, SHA-256 and transfer time of the download when
+                local_path is given
         """
         self.prepare_guest_operation(vsphere, vm_id, username, password)
         if not guest_directory:
             full_path = guest_file
         else:
             full_path = self.joinpath(guest_directory, guest_file)
+
+        if local_path:
+            result = self.download_file(full_path, local_path, offset=offset,
+                                        length=length, tail_bytes=tail_bytes)
+            self.logger.info("Downloaded %s bytes from %s to %s in %ss (%s bytes/s), sha256 %s" %
+                             (result['size'], full_path, local_path, result['seconds'],
+                              result['bytes_per_second'], result['sha256']))
+            return result
+
         dl_url = self.guest_file_manager.InitiateFileTransferFromGuest(
             self.vm, self.guest_credentials, guestFilePath=full_path)
+        if offset or length is not None or tail_bytes is not None:
+            start, end = self.get_byte_range(dl_url.size, offset, length, tail_bytes)
+            data = b''.join(self.iter_transfer_range(dl_url, start, end))
+            return data.decode('utf-8', 'replace')
+
         response = requests.get(dl_url.url, verify=False)
         response.raise_for_status()  # raise if status_code not 200
         return response.text
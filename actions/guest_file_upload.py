@@ -14,15 +14,13 @@
 # limitations under the License.
 
 from vmwarelib.guest import GuestAction
-from pyVmomi import vim  # pylint: disable-msg=E0611
 import os
-import requests
 
 
 class InitiateFileTransferToGuest(GuestAction):
 
     def run(self, vm_id, username, password, guest_directory, local_path,
-            vsphere=None):
+            verify_sha256=False, vsphere=None):
         """
         Upload a file to a directory inside a guest.
 
@@ -39,29 +37,25 @@ class InitiateFileTransferToGuest(GuestAction):
         -             relative starting point.
         -             examples: /opt/stackstorm/packs/mypack/path/to/file
         -                       pack:mypack/path-inside-pack/to/file
+        - verify_sha256: Read the file back from the guest after the upload
+        -                and fail unless its SHA-256 matches the local file
         - vsphere: Pre-configured vsphere connection details (config.yaml)
         """
         self.prepare_guest_operation(vsphere, vm_id, username, password)
 
-        if (local_path.startswith("pack:")):
-            packsdir =\
-                os.path.dirname(
-                    os.path.dirname(
-                        os.path.dirname(os.path.abspath(__file__))))
-            full_local_path = os.path.join(packsdir, local_path[5:])
-        else:
-            full_local_path = local_path
-
-        with open(full_local_path, 'rb') as myfile:
-            file_contents = myfile.read()
+        full_local_path = self.resolve_local_path(local_path)
         guest_filename = os.path.basename(full_local_path)
-
-        file_attribute = vim.vm.guest.FileManager.FileAttributes()
         full_path = self.joinpath(guest_directory, guest_filename)
-        url = self.guest_file_manager.InitiateFileTransferToGuest(
-            self.vm, self.guest_credentials, full_path, file_attribute,
-            len(file_contents), True)
 
-        response = requests.put(url, data=file_contents, verify=False)
-        response.raise_for_status()  # raise if status_code is not 200
+        upload = self.upload_file(full_local_path, full_path)
+        self.logger.info("Uploaded %s bytes to %s in %ss (%s bytes/s), sha256 %s" %
+                         (upload['size'], full_path, upload['seconds'],
+                          upload['bytes_per_second'], upload['sha256']))
+
+        if verify_sha256:
+            guest_sha256 = self.guest_file_sha256(full_path)
+            if guest_sha256 != upload['sha256']:
+                raise Exception("SHA-256 of %s in the guest (%s) does not match the "
+                                "uploaded file (%s)" % (full_path, guest_sha256,
+                                                        upload['sha256']))
         return full_path
@@ -0,0 +1,50 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from vmwarelib.guest import GuestAction
+
+
+class RunProgramInGuest(GuestAction):
+
+    def run(self, vm_id, username, password, command, arguments=None, workdir=None,
+            envvar=None, timeout=None, max_output_bytes=None, vsphere=None):
+        """
+        Run a program inside a guest and capture its exit code and output,
+        in a single action execution.
+
+        Args:
+        - vm_id: MOID of the Virtual Machine
+        - username: username to perform the operation
+        - password: password of that user
+        - command: command to run
+        - arguments: [optional] command argument(s)
+        - workdir: [optional] working directory, a temporary directory by default
+        - envvar: [optional] [array] environment variable(s)
+        - timeout: [optional] seconds to wait for the command before terminating it
+        - max_output_bytes: [optional] only return the last bytes of stdout and stderr
+        - vsphere: Pre-configured vsphere connection details (config.yaml)
+
+        Returns:
+        - dict: the exit_code, stdout and stderr of the command, with its pid
+                and the seconds it ran for. The action fails when the exit
+                code is not 0.
+        """
+        self.prepare_guest_operation(vsphere, vm_id, username, password)
+        result = self.run_program(command, arguments, workdir, envvar,
+                                  timeout=timeout, max_output_bytes=max_output_bytes)
+        self.logger.info("Process %s of %s exited with %s in %ss" %
+                         (result['pid'], command, result['exit_code'], result['seconds']))
+        return (result['exit_code'] == 0, result)
@@ -0,0 +1,113 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from vmwarelib.guest import GuestAction, DEFAULT_MAX_WORKERS
+import json
+import os
+
+
+class RunProgramInGuests(GuestAction):
+
+    def run(self, username, password, command, arguments=None, script=None,
+            script_arguments=None, vm_ids=None, folder_id=None, cluster_id=None,
+            workdir=None, envvar=None, timeout=None, max_output_bytes=None,
+            max_workers=DEFAULT_MAX_WORKERS, output_path=None, vsphere=None):
+        """
+        Run the same program or script inside many guests concurrently and
+        collect their exit codes and output.
+
+        Args:
+        - username: username to perform the operation in every guest
+        - password: password of that user
+        - command: command to run, the interpreter when a script is given
+        - arguments: [optional] command argument(s), before the script
+        - script: [optional] local path to a script to upload into each guest
+                  and run with command, or a path relative to the packs
+                  directory when prefixed with pack:
+        - script_arguments: [optional] arguments to pass into the script
+        - vm_ids: MOIDs of the Virtual Machines to run the command in
+        - folder_id: MOID of a folder, run in every VM beneath it instead
+        - cluster_id: MOID of a cluster, run in every VM in it instead
+        - workdir: [optional] working directory, a temporary directory by default
+        - envvar: [optional] [array] environment variable(s)
+        - timeout: [optional] seconds to wait for the command in each guest
+        - max_output_bytes: [optional] only keep the last bytes of stdout and stderr
+        - max_workers: number of guests to run the command in at the same time
+        - output_path: [optional] local JSON Lines file to write the result of
+                       each VM to as soon as it is known. The stdout and stderr
+                       are then only written to the file.
+        - vsphere: Pre-configured vsphere connection details (config.yaml)
+
+        Returns:
+        - dict: the number of VMs that succeeded and failed and the exit code,
+                output and timings of each VM. The action fails unless the
+                command exited with 0 in every VM.
+        """
+        self.prepare_multi_guest_operation(vsphere, username, password)
+        vms = self.get_guest_vms(vm_ids, folder_id, cluster_id)
+
+        script_file = None
+        if script:
+            full_script_path = self.resolve_local_path(script)
+            with open(full_script_path, 'rb') as local_file:
+                script_file = (os.path.basename(full_script_path), local_file.read())
+
+        def run_one(action):
+            return action.run_program(command, arguments, workdir, envvar,
+                                      timeout=timeout, max_output_bytes=max_output_bytes,
+                                      script=script_file, script_arguments=script_arguments)
+
+        results = []
+        output_file = open(output_path, 'w') if output_path else None
+        try:
+            for outcome in self.iter_on_guests(vms, run_one, max_workers):
+                outcome = self.flatten_outcome(outcome)
+                if output_file:
+                    output_file.write(json.dumps(outcome) + '\n')
+                    output_file.flush()
+                    outcome.pop('stdout', None)
+                    outcome.pop('stderr', None)
+                results.append(outcome)
+        finally:
+            if output_file:
+                output_file.close()
+
+        failed = len([r for r in results if r['status'] == 'failed'])
+        self.logger.info("Ran %s in %s VMs, %s failed" % (command, len(results), failed))
+
+        output = {'succeeded': len(results) - failed,
+                  'failed': failed,
+                  'vms': results}
+        if output_path:
+            output['output_path'] = output_path
+        if failed:
+            return (False, output)
+        return output
+
+    def flatten_outcome(self, outcome):
+        """
+        Returns the outcome of a VM with the exit code and output of the
+        program at the top level. A program that ran but exited with a code
+        other than 0 failed.
+        """
+        result = outcome.pop('result', None)
+        if result:
+            outcome['exit_code'] = result['exit_code']
+            outcome['stdout'] = result['stdout']
+            outcome['stderr'] = result['stderr']
+            if result['exit_code'] != 0:
+                outcome['status'] = 'failed'
+        return outcome
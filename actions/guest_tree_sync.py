@@ -0,0 +1,223 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from pyVmomi import vim  # pylint: disable-msg=E0611
+from vmwarelib.actions import map_concurrently
+from vmwarelib.guest import GuestAction, DEFAULT_CHUNK_SIZE, DEFAULT_MAX_WORKERS, \
+    get_http_session
+import datetime
+import hashlib
+import os
+import pytz  # pylint: disable=import-error
+import time
+
+# Modification times closer than this are equal, FAT and some guest tools
+# only keep them to the nearest 2 seconds
+MTIME_TOLERANCE = 2
+
+
+class SyncTreeToGuest(GuestAction):
+
+    def run(self, vm_id, username, password, local_directory, guest_directory,
+            compare='mtime', delete_extra=False, max_workers=DEFAULT_MAX_WORKERS,
+            vsphere=None):
+        """
+        Make a directory inside a guest match a local directory, uploading only
+        the files that are missing or changed.
+
+        Args:
+        - vm_id: MOID of the Virtual Machine
+        - username: username to perform the operation
+        - password: password of that user
+        - local_directory: The full path to the local directory, or a path
+                           relative to the packs directory when prefixed with pack:
+        - guest_directory: full path to the directory in the guest, it is
+                           created if it does not exist
+        - compare: how files of the same size are compared, 'mtime' uploads them
+                   when their modification times differ, 'sha256' when their
+                   contents differ (the guest file is read back to hash it)
+        - delete_extra: delete the files and directories in the guest that are
+                        not in the local directory
+        - max_workers: number of files to transfer at the same time
+        - vsphere: Pre-configured vsphere connection details (config.yaml)
+
+        Returns:
+        - dict: the files uploaded and deleted, the directories created, the
+                number of unchanged files, the files that failed and the
+                size and duration of the transfers. The action fails if any
+                file failed.
+        """
+        if compare not in ('mtime', 'sha256'):
+            raise ValueError("compare must be one of 'mtime' or 'sha256'")
+
+        self.prepare_guest_operation(vsphere, vm_id, username, password)
+        local_directory = self.resolve_local_path(local_directory)
+        started = time.time()
+
+        local_dirs, local_files = self.list_local_tree(local_directory)
+        try:
+            guest_tree = self.list_guest_tree(guest_directory)
+        except vim.fault.FileNotFound:
+            guest_tree = {}
+            self.make_guest_directory(guest_directory)
+
+        result = {'uploaded': [],
+                  'unchanged': 0,
+                  'deleted': [],
+                  'directories_created': [],
+                  'failed': [],
+                  'size': 0}
+
+        if delete_extra:
+            self.delete_extra(guest_directory, guest_tree, local_dirs, local_files, result)
+
+        # a directory that cannot be created, e.g. because the guest has a file
+        # at its path, fails with what is beneath it while the rest is synced
+        failed_dirs = []
+        for relpath in local_dirs:
+            if self.failed_parent(relpath, failed_dirs):
+                continue
+            info = guest_tree.get(relpath)
+            if info is None or info.type != 'directory':
+                try:
+                    self.make_guest_directory(self.guest_joinpath(guest_directory, relpath))
+                except Exception as e:
+                    result['failed'].append({'path': relpath, 'error': str(e)})
+                    failed_dirs.append(relpath)
+                    continue
+                result['directories_created'].append(relpath)
+
+        def sync_one(relpath):
+            parent = self.failed_parent(relpath, failed_dirs)
+            if parent:
+                return relpath, None, "Directory %s could not be created" % parent
+            try:
+                return relpath, self.sync_file(relpath, local_files[relpath],
+                                               guest_directory, guest_tree.get(relpath),
+                                               compare), None
+            except Exception as e:
+                return relpath, None, str(e)
+
+        get_http_session(max_workers)
+        for relpath, upload, error in map_concurrently(sync_one, sorted(local_files),
+                                                       max_workers):
+            if error:
+                result['failed'].append({'path': relpath, 'error': error})
+            elif upload:
+                result['uploaded'].append(relpath)
+                result['size'] += upload['size']
+            else:
+                result['unchanged'] += 1
+
+        result['seconds'] = round(time.time() - started, 3)
+        self.logger.info("Synced %s to %s: %s uploaded, %s unchanged, %s deleted, %s failed" %
+                         (local_directory, guest_directory, len(result['uploaded']),
+                          result['unchanged'], len(result['deleted']), len(result['failed'])))
+        if result['failed']:
+            return (False, result)
+        return result
+
+    def list_local_tree(self, local_directory):
+        """
+        Returns:
+        - list: the directories beneath local_directory, parents first
+        - dict: the files beneath local_directory -> (full path, size, modification time)
+        All paths are relative to local_directory and separated by '/'.
+        """
+        if not os.path.isdir(local_directory):
+            raise ValueError("%s is not a directory" % local_directory)
+
+        dirs = []
+        files = {}
+        for root, dirnames, filenames in os.walk(local_directory):
+            relroot = os.path.relpath(root, local_directory).replace(os.sep, '/')
+            relroot = '' if relroot == '.' else relroot + '/'
+            dirnames.sort()
+            dirs.extend(relroot + d for d in dirnames)
+            for filename in filenames:
+                full_path = os.path.join(root, filename)
+                stat = os.stat(full_path)
+                mtime = datetime.datetime.utcfromtimestamp(int(stat.st_mtime))
+                files[relroot + filename] = (full_path, stat.st_size,
+                                             mtime.replace(tzinfo=pytz.UTC))
+        return dirs, files
+
+    def sync_file(self, relpath, local_file, guest_directory, info, compare):
+        """
+        Uploads a local file unless the guest already has the same file.
+
+        Returns:
+        - dict: the result of the upload, None if the file was unchanged
+        """
+        full_path, size, mtime = local_file
+        guest_path = self.guest_joinpath(guest_directory, relpath)
+        if info is not None and info.type == 'file' and info.size == size:
+            if compare == 'sha256':
+                if self.local_file_sha256(full_path) == self.guest_file_sha256(guest_path):
+                    return None
+            elif self.same_mtime(info.attributes.modificationTime, mtime):
+                return None
+
+        # the guest file keeps the local modification time so the next sync
+        # can compare them
+        file_attribute = vim.vm.guest.FileManager.FileAttributes(modificationTime=mtime)
+        return self.upload_file(full_path, guest_path, file_attribute=file_attribute)
+
+    def delete_extra(self, guest_directory, guest_tree, local_dirs, local_files, result):
+        """Deletes what is in the guest directory but not in the local directory"""
+        local_dirs = set(local_dirs)
+        deleted_dirs = []
+        for relpath in sorted(guest_tree):
+            if relpath in local_files or relpath in local_dirs:
+                continue
+            # everything beneath a deleted directory is gone already
+            if any(relpath.startswith(d + '/') for d in deleted_dirs):
+                continue
+            guest_path = self.guest_joinpath(guest_directory, relpath)
+            if guest_tree[relpath].type == 'directory':
+                self.guest_file_manager.DeleteDirectoryInGuest(
+                    self.vm, self.guest_credentials, guest_path, True)
+                deleted_dirs.append(relpath)
+            else:
+                self.guest_file_manager.DeleteFileInGuest(
+                    self.vm, self.guest_credentials, guest_path)
+            result['deleted'].append(relpath)
+            guest_tree.pop(relpath)
+
+    def failed_parent(self, relpath, failed_dirs):
+        """Returns the failed directory relpath is beneath, if any"""
+        for failed_dir in failed_dirs:
+            if relpath.startswith(failed_dir + '/'):
+                return failed_dir
+        return None
+
+    def make_guest_directory(self, guest_path):
+        self.guest_file_manager.MakeDirectoryInGuest(
+            self.vm, self.guest_credentials, guest_path, True)
+
+    def same_mtime(self, guest_mtime, local_mtime):
+        if guest_mtime is None:
+            return False
+        if guest_mtime.tzinfo is None:
+            guest_mtime = guest_mtime.replace(tzinfo=pytz.UTC)
+        return abs((guest_mtime - local_mtime).total_seconds()) <= MTIME_TOLERANCE
+
+    def local_file_sha256(self, full_path):
+        sha256 = hashlib.sha256()
+        with open(full_path, 'rb') as local_file:
+            for chunk in iter(lambda: local_file.read(DEFAULT_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
@@ -14,15 +14,14 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import HostGetJSONEncoder
+from vmwarelib.serialize import HOST_GET_SERIALIZER
 from vmwarelib.actions import BaseAction
 from pyVmomi import vim  # pylint: disable-msg=E0611
-import json
 
 
 class GetHost(BaseAction):
 
-    def run(self, host_ids, host_names, get_all_hosts, vsphere=None):
+    def run(self, host_ids, host_names, get_all_hosts, vsphere=None, vspheres=None):
         """
         Retrieve summary information for given Hosts (ESXi)
 
@@ -30,48 +29,45 @@ class GetHost(BaseAction):
         - host_ids: Moid of Host to retrieve
         - host_names: Name of Host to retrieve
         - vsphere: Pre-configured vsphere connection details (config.yaml)
+        - vspheres: Several pre-configured vsphere connections to query concurrently
 
 
         Returns:
-        - dict: Host network hints details.
+        - dict: Host network hints details. Keyed by vsphere connection first
+                when vspheres is given.
         """
         if not get_all_hosts and not host_ids and not host_names:
             raise ValueError("No IDs nor Names provided.")
 
+        if vspheres:
+            return dict(self.run_on_vspheres(vspheres, GetHost.get_hosts,
+                                             host_ids, host_names, get_all_hosts))
+
         self.establish_connection(vsphere)
 
-        results = None
-        if get_all_hosts:
-            results = self.get_all_hosts()
-        else:
-            results = self.get_select_hosts(host_ids, host_names)
+        return self.get_hosts(host_ids, host_names, get_all_hosts)
 
-        return results
+    def get_hosts(self, host_ids, host_names, get_all_hosts):
+        if get_all_hosts:
+            return self.get_all_hosts()
+        return self.get_select_hosts(host_ids, host_names)
 
     def get_select_hosts(self, host_ids, host_names):
         results = {}
-        if host_ids:
-            for hid in host_ids:
-                host = inventory.get_hostsystem(self.si_content, moid=hid)
-                if host:
-                    if host.name not in results:
-                        results[host.name] = json.loads(json.dumps(host.summary,
-                                                                   cls=HostGetJSONEncoder))
-        if host_names:
-            for host in host_names:
-                host = inventory.get_hostsystem(self.si_content, name=host)
-                if host:
-                    if host.name not in results:
-                        results[host.name] = json.loads(json.dumps(host.summary,
-                                                                   cls=HostGetJSONEncoder))
+        hosts = inventory.find_managed_entities(self.si_content, vim.HostSystem,
+                                                moids=host_ids, names=host_names,
+                                                path_set=['summary'])
+        for host, properties in hosts:
+            if properties['name'] not in results:
+                results[properties['name']] = HOST_GET_SERIALIZER.serialize(properties['summary'])
 
         return results
 
     def get_all_hosts(self):
         results = {}
-        container = inventory.get_managed_entities(self.si_content, vim.HostSystem)
-        for host in container.view:
-            results[host.name] = json.loads(json.dumps(host.summary,
-                                                       cls=HostGetJSONEncoder))
+        hosts = inventory.get_entity_properties(self.si_content, vim.HostSystem,
+                                                path_set=['name', 'summary'])
+        for host, properties in hosts:
+            results[properties['name']] = HOST_GET_SERIALIZER.serialize(properties['summary'])
 
         return results
@@ -14,9 +14,8 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import PhysicalNicJSONEncoder
+from vmwarelib.serialize import PHYSICAL_NIC_SERIALIZER
 from vmwarelib.actions import BaseAction
-import json
 
 
 class GetHostNetworkHints(BaseAction):
@@ -47,14 +46,12 @@ class GetHostNetworkHints(BaseAction):
                 if host:
                     if host.name not in results:
                         network_hints = host.configManager.networkSystem.QueryNetworkHint()
-                        results[host.name] = json.loads(json.dumps(network_hints,
-                                                                   cls=PhysicalNicJSONEncoder))
+                        results[host.name] = PHYSICAL_NIC_SERIALIZER.serialize(network_hints)
         if host_names:
             for host in host_names:
                 host = inventory.get_hostsystem(self.si_content, name=host)
                 if host:
                     if host.name not in results:
                         network_hints = host.configManager.networkSystem.QueryNetworkHint()
-                        results[host.name] = json.loads(json.dumps(network_hints,
-                                                                   cls=PhysicalNicJSONEncoder))
+                        results[host.name] = PHYSICAL_NIC_SERIALIZER.serialize(network_hints)
         return results
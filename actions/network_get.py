@@ -14,10 +14,9 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import NetworkGetJSONEncoder
+from vmwarelib.serialize import NETWORK_GET_SERIALIZER
 from vmwarelib.actions import BaseAction
 from pyVmomi import vim  # pylint: disable-msg=E0611
-import json
 
 
 class NetworkGet(BaseAction):
@@ -26,7 +25,7 @@ class NetworkGet(BaseAction):
         if isinstance(network, vim.dvs.DistributedVirtualPortgroup):
             is_dvs = True
 
-        summary = json.loads(json.dumps(network.summary, cls=NetworkGetJSONEncoder))
+        summary = NETWORK_GET_SERIALIZER.serialize(network.summary)
         return_dict = {
             'name': network.name,
             'id': summary['network']['_moId'],
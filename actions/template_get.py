@@ -14,14 +14,13 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import TemplateGetJSONEncoder
+from vmwarelib.serialize import TEMPLATE_GET_SERIALIZER
 from vmwarelib.actions import BaseAction
-import json
 
 
 class TemplateGet(BaseAction):
     def get_template_dict(self, template):
-        summary = json.loads(json.dumps(template.summary, cls=TemplateGetJSONEncoder))
+        summary = TEMPLATE_GET_SERIALIZER.serialize(template.summary)
         return_dict = {
             'name': template.name,
             'id': summary['vm']['_moId'],
@@ -14,8 +14,22 @@
 # limitations under the License.
 from vmwarelib import inventory
 from vmwarelib.actions import BaseAction
+from pyVmomi import vim  # pylint: disable-msg=E0611
 import re
 
+HOST_PROPERTIES = ['name', 'runtime.powerState', 'runtime.inMaintenanceMode', 'vm', 'datastore',
+                   'summary.quickStats.overallCpuUsage', 'summary.quickStats.overallMemoryUsage',
+                   'summary.hardware.cpuMhz', 'summary.hardware.numCpuCores',
+                   'summary.hardware.memorySize']
+DATASTORE_PROPERTIES = ['name', 'summary.maintenanceMode', 'info.freeSpace',
+                        'summary.capacity', 'summary.uncommitted']
+
+# Relative importance of the CPU and memory usage of a host and the provisioned space
+# of a datastore when placing VMs with the 'resources' scoring
+DEFAULT_WEIGHTS = {'cpu': 1.0, 'memory': 1.0, 'storage': 1.0}
+
+MB = 1024 ** 2
+
 
 class BestFit(BaseAction):
 
@@ -26,45 +40,132 @@ class BestFit(BaseAction):
         """
         super(BestFit, self).__init__(config)
 
-    def get_host(self, datacenter_name, cluster_name):
-        """Return a host from the given cluster that's powered on and has the least number of VMs
-        :param cluster_name: Name of the cluster to retrieve a host from
-        :returns host_obj: Host object from the given cluster
+    def get_cluster(self, datacenter_name, cluster_name):
+        """Return the cluster with the given name in the given datacenter
+        Since there can be multiple clusters with the same name in different
+        datacenters the cluster is only searched for beneath its datacenter.
+        :returns cluster_obj: Cluster object
         """
-        vimtype = self.get_vim_type("HostSystem")
+        datacenter = inventory.find_managed_entities(self.si_content, vim.Datacenter,
+                                                     names=[datacenter_name])[0][0]
+        cluster = inventory.find_managed_entities(self.si_content, vim.ComputeResource,
+                                                  names=[cluster_name],
+                                                  container=datacenter)[0][0]
+        return cluster
 
-        hosts = inventory.get_managed_entities(self.si_content, vimtype)
+    def get_cluster_resources(self, cluster):
+        """Return the hosts and datastores of the cluster, with all of the properties
+        needed to place a VM on them, from a single property retrieval
+        :param cluster: Cluster object to retrieve the hosts and datastores of
+        :returns: dict with the 'hosts' list and the 'datastores' dict keyed by MOID,
+                  of (object, dict of property path -> value) tuples
+        """
+        select_set = [inventory.traversal_spec('clusterToHost', vim.ComputeResource, 'host'),
+                      inventory.traversal_spec('clusterToDatastore', vim.ComputeResource,
+                                               'datastore')]
+        objects = inventory.retrieve_type_properties(
+            self.si_content, [inventory.object_spec(cluster, select_set)],
+            [(vim.HostSystem, HOST_PROPERTIES), (vim.Datastore, DATASTORE_PROPERTIES)])
 
-        host_obj = None
-        least_vms = None
+        resources = {'hosts': [], 'datastores': {}}
+        for obj, props in objects:
+            if isinstance(obj, vim.HostSystem):
+                resources['hosts'].append((obj, props))
+            elif isinstance(obj, vim.Datastore):
+                resources['datastores'][obj._moId] = (obj, props)
+        return resources
 
-        for host in hosts.view:
-            host_cluster = host.parent
-            # The first parent of a cluster is a folder
-            # and the parent of that is the Datacenter
-            host_dc = host_cluster.parent.parent
+    def rank_hosts(self, hosts, host_load=None, scoring='least_vms', weights=None):
+        """Return the hosts that are powered on, least loaded first
+        :param hosts: list of (host object, properties) tuples of the cluster
+        :param host_load: dict of host MOID -> projected 'vms' count, allocated 'cpu' and
+                          'memory_mb', including the VMs already planned onto the host
+        :param scoring: 'least_vms' ranks the hosts by their number of VMs,
+                        'resources' by their weighted CPU and memory usage
+        :param weights: weights of the 'cpu' and 'memory' usage for the 'resources' scoring
+        :returns: list of (host object, properties) tuples
+        """
+        available = []
+        for host, props in hosts:
             # Need to verify that the host is on, connected, and not in maintenance mode
             # powerState can be 'poweredOff' 'poweredOn' 'standBy' 'unknown'
-            # Since there can be multiple hosts with the same name in different clusters
-            # and datacenters we need to verify we are getting the correct host.
-            if (host_dc.name == datacenter_name and
-                    host_cluster.name == cluster_name and
-                    host.runtime.powerState == 'poweredOn' and
-                    host.runtime.inMaintenanceMode is False):
-                # Find the host that has the least number of VMs on it
-                if (least_vms is None or len(host.vm) < least_vms):
-                    host_obj = host
-                    least_vms = len(host.vm)
-
-        if host_obj is not None:
-            return host_obj
+            if (props.get('runtime.powerState') == 'poweredOn' and
+                    props.get('runtime.inMaintenanceMode') is False):
+                available.append((host, props))
+
+        if host_load is None:
+            host_load = self.get_host_load(hosts)
+
+        def load(host_props):
+            host, props = host_props
+            if scoring == 'resources':
+                return self.score_host(props, host_load[host._moId], weights)
+            return (host_load[host._moId]['vms'], host_load[host._moId]['memory_mb'])
+
+        # Find the host that has the least number of VMs (or lowest usage) on it
+        return sorted(available, key=load)
+
+    def get_host_load(self, hosts):
+        return dict((host._moId, {'vms': len(props.get('vm') or []),
+                                  'cpu': 0,
+                                  'memory_mb': 0})
+                    for host, props in hosts)
+
+    def get_weights(self, weights):
+        result = dict(DEFAULT_WEIGHTS)
+        result.update(weights or {})
+        return result
+
+    def score_host(self, props, load, weights=None):
+        """Return the weighted CPU and memory usage of a host, including the VMs planned onto it.
+        The usage comes from the host's quickStats, each planned vCPU counts as a fully used core.
+        :returns float: score of the host, lower is better
+        """
+        weights = self.get_weights(weights)
+
+        cpu_mhz = props.get('summary.hardware.cpuMhz') or 0
+        cpu_capacity = cpu_mhz * (props.get('summary.hardware.numCpuCores') or 0)
+        cpu_used = (props.get('summary.quickStats.overallCpuUsage') or 0) + load['cpu'] * cpu_mhz
+        cpu_usage = float(cpu_used) / cpu_capacity if cpu_capacity else 1.0
+
+        memory_capacity = float(props.get('summary.hardware.memorySize') or 0) / MB
+        memory_used = (props.get('summary.quickStats.overallMemoryUsage') or 0) + load['memory_mb']
+        memory_usage = memory_used / memory_capacity if memory_capacity else 1.0
+
+        return weights['cpu'] * cpu_usage + weights['memory'] * memory_usage
+
+    def score_datastore(self, props, free_space, weights=None):
+        """Return the weighted provisioned space of a datastore, thin provisioned disks
+        count with their full size
+        :param free_space: projected free space of the datastore in bytes
+        :returns float: score of the datastore, lower is better
+        """
+        weights = self.get_weights(weights)
+
+        capacity = props.get('summary.capacity') or 0
+        if not capacity:
+            return weights['storage']
+        provisioned = capacity - free_space + (props.get('summary.uncommitted') or 0)
+        return weights['storage'] * float(provisioned) / capacity
+
+    def get_host(self, cluster_name, hosts, host_load=None, scoring='least_vms', weights=None):
+        """Return a host that's powered on and has the least number of VMs
+        :param cluster_name: Name of the cluster the hosts are in
+        :param hosts: list of (host object, properties) tuples of the cluster
+        :returns: (host object, properties) tuple
+        """
+        ranked = self.rank_hosts(hosts, host_load, scoring, weights)
+        if ranked:
+            return ranked[0]
         else:
             raise Exception("No available hosts found for cluster: {}".format(cluster_name))
 
-    def get_storage(self, host, datastore_filter_strategy, datastore_filter, disks):
+    def get_storage(self, host_props, datastores, datastore_filter_strategy,
+                    datastore_filter, disks, free_space=None, required_space=0):
         """Return a datastore on the host that is either specified in the disks variable or
         has the most free space and a name that doesn't match any filters
-        :param host: Host object to retrieve a datastore from
+        :param host_props: Properties of the host to retrieve a datastore from
+        :param datastores: dict of MOID -> (datastore object, properties) tuples of the cluster
         :param datastore_filter: Object containing list of filtersto exclude certain datastores
           :example: ["string1", "string2"]
         :param disks: Object containing a list of disks to add to the VM
@@ -76,10 +177,11 @@ class BestFit(BaseAction):
                "controller_bus": "string",
                "scsi_bus": "string"
             }]
-        :returns datastore: Datastore object from the given host
+        :param free_space: dict of datastore MOID -> projected free space in bytes,
+                           after the VMs already planned onto the datastore
+        :param required_space: bytes the datastore needs to have free
+        :returns: (datastore object, datastore name) tuple
         """
-        datastore = None
-
         # First check the disks variable for a datastore to use
         if disks is not None:
             first_disk = disks[0]
@@ -90,33 +192,144 @@ class BestFit(BaseAction):
                 vimtype = self.get_vim_type("Datastore")
                 datastore = inventory.get_managed_entity(self.si_content, vimtype,
                                                          name=datastore_name)
+                return datastore, datastore_name
 
         # If the disks variable is empty or the datastore is set to "automatic" then search
         # the available datastores on the host for the one with the most free space
-        if datastore is None:
-            storages = host.datastore
-            most_space = 0
-            for ds in storages:
-                # only allow placing onto a datastore in "normal" mode
-                # this prevents from being placed onto a datastore in "maintenance" mode
-                # Valid values are:
-                #  - enteringMaintenance
-                #  - inMaintenance
-                #  - normal
-                #
-                # https://vdc-repo.vmware.com/vmwb-repository/dcr-public/6b586ed2-655c-49d9-9029-bc416323cb22/fa0b429a-a695-4c11-b7d2-2cbc284049dc/doc/vim.Datastore.Summary.html
-                # https://vdc-repo.vmware.com/vmwb-repository/dcr-public/6b586ed2-655c-49d9-9029-bc416323cb22/fa0b429a-a695-4c11-b7d2-2cbc284049dc/doc/vim.Datastore.Summary.MaintenanceModeState.html
-                if ds.summary.maintenanceMode != 'normal':
-                    continue
-
-                # The following function returns False if the name of the datastore
-                # matches any of the regex filters
-                if self.filter_datastores(ds.name, datastore_filter_strategy, datastore_filter):
-                    if ds.info.freeSpace > most_space:
-                        datastore = ds
-                        most_space = ds.info.freeSpace
-
-        return datastore
+        best_datastore = (None, None)
+        most_space = 0
+        for ds, name, props, ds_free_space in self.get_datastores(host_props,
+                                                                  datastores,
+                                                                  datastore_filter_strategy,
+                                                                  datastore_filter,
+                                                                  free_space,
+                                                                  required_space):
+            if ds_free_space > most_space:
+                best_datastore = (ds, name)
+                most_space = ds_free_space
+
+        return best_datastore
+
+    def get_datastores(self, host_props, datastores, datastore_filter_strategy,
+                       datastore_filter, free_space=None, required_space=0):
+        """Yield the datastores of the host that a VM can be placed on
+        :returns: (datastore object, name, properties, projected free space) tuples
+        """
+        for host_ds in host_props.get('datastore') or []:
+            if host_ds._moId not in datastores:
+                continue
+            ds, props = datastores[host_ds._moId]
+
+            # only allow placing onto a datastore in "normal" mode
+            # this prevents from being placed onto a datastore in "maintenance" mode
+            # Valid values are:
+            #  - enteringMaintenance
+            #  - inMaintenance
+            #  - normal
+            #
+            # https://vdc-repo.vmware.com/vmwb-repository/dcr-public/6b586ed2-655c-49d9-9029-bc416323cb22/fa0b429a-a695-4c11-b7d2-2cbc284049dc/doc/vim.Datastore.Summary.html
+            # https://vdc-repo.vmware.com/vmwb-repository/dcr-public/6b586ed2-655c-49d9-9029-bc416323cb22/fa0b429a-a695-4c11-b7d2-2cbc284049dc/doc/vim.Datastore.Summary.MaintenanceModeState.html
+            if props.get('summary.maintenanceMode') != 'normal':
+                continue
+
+            # The following function returns False if the name of the datastore
+            # matches any of the regex filters
+            name = props.get('name')
+            if self.filter_datastores(name, datastore_filter_strategy, datastore_filter):
+                if free_space is not None:
+                    ds_free_space = free_space[host_ds._moId]
+                else:
+                    ds_free_space = props.get('info.freeSpace') or 0
+                if ds_free_space >= required_space:
+                    yield ds, name, props, ds_free_space
+
+    def get_scored_placement(self, resources, host_load, free_space, required_space,
+                             datastore_filter_strategy, datastore_filter, weights=None):
+        """Return the host and datastore pair with the lowest combined score of the host's
+        CPU and memory usage and the datastore's provisioned space
+        :returns: (host object, host properties, datastore object, datastore name) or None
+        """
+        best_placement = None
+        best_score = None
+        for host, host_props in self.rank_hosts(resources['hosts'], host_load,
+                                                'resources', weights):
+            host_score = self.score_host(host_props, host_load[host._moId], weights)
+            for ds, name, props, ds_free_space in self.get_datastores(host_props,
+                                                                      resources['datastores'],
+                                                                      datastore_filter_strategy,
+                                                                      datastore_filter,
+                                                                      free_space,
+                                                                      required_space):
+                score = host_score + self.score_datastore(props, ds_free_space - required_space,
+                                                          weights)
+                if best_score is None or score < best_score:
+                    best_placement = (host, host_props, ds, name)
+                    best_score = score
+
+        return best_placement
+
+    def plan_placements(self, cluster_name, resources, vms, datastore_filter_strategy,
+                        datastore_filter, scoring='least_vms', weights=None):
+        """Return a host and datastore for each of the VMs from a single snapshot of the
+        cluster's resources. The projected number of VMs and allocated memory of the hosts
+        and the free space of the datastores are updated after each VM is placed, so VMs
+        of the same batch are spread across the cluster instead of all landing on the same
+        host and datastore.
+        :param vms: list of VMs to place
+          :example:
+            [{
+               "name": "string",
+               "cpu": 2,
+               "memory_mb": 4096,
+               "disk_gb": 40
+            }]
+        :param scoring: 'least_vms' places each VM on the host with the fewest VMs and the
+                        datastore with the most free space, 'resources' on the host and
+                        datastore with the lowest weighted CPU, memory and storage usage
+        :param weights: weights of the 'cpu', 'memory' and 'storage' usage
+        :returns: list of (VM, host object, host properties, datastore object, datastore name)
+        """
+        host_load = self.get_host_load(resources['hosts'])
+        free_space = dict((moid, props.get('info.freeSpace') or 0)
+                          for moid, (ds, props) in resources['datastores'].items())
+
+        placements = []
+        for vm in vms:
+            required_space = int(float(vm.get('disk_gb') or 0) * 1024 ** 3)
+
+            placement = None
+            if scoring == 'resources':
+                scored = self.get_scored_placement(resources, host_load, free_space,
+                                                   required_space, datastore_filter_strategy,
+                                                   datastore_filter, weights)
+                if scored is not None:
+                    placement = (vm,) + scored
+            else:
+                for host, host_props in self.rank_hosts(resources['hosts'], host_load):
+                    datastore, datastore_name = self.get_storage(host_props,
+                                                                 resources['datastores'],
+                                                                 datastore_filter_strategy,
+                                                                 datastore_filter,
+                                                                 None,
+                                                                 free_space=free_space,
+                                                                 required_space=required_space)
+                    if datastore is not None:
+                        placement = (vm, host, host_props, datastore, datastore_name)
+                        break
+
+            if placement is None:
+                raise Exception("No host with enough datastore space found in cluster {} for "
+                                "VM: {}".format(cluster_name, vm.get('name')))
+            vm, host, host_props, datastore, datastore_name = placement
+
+            load = host_load[host._moId]
+            load['vms'] += 1
+            load['cpu'] += int(vm.get('cpu') or 0)
+            load['memory_mb'] += int(vm.get('memory_mb') or 0)
+            free_space[datastore._moId] -= required_space
+            placements.append(placement)
+
+        return placements
 
     def filter_datastores(self,
                           datastore_name,
@@ -149,35 +362,77 @@ class BestFit(BaseAction):
             datastore_filter_strategy,
             datastore_filter_regex_list,
             disks,
-            vsphere=None):
+            vsphere=None,
+            vms=None,
+            scoring='least_vms',
+            weights=None):
         """
         Returns a host and datastore name and MOID from the given cluster and filters.
         The result host will be the one with the least amount of VMs and the result
         datastore will be the one with the most free space
+        When vms is given, a host and datastore is returned for each of them instead
 
         Args:
         - cluster_name: Name of the cluster in vSphere to get a host from
         - datastore_filter_regex_list: List of regular expressions to filter the list of datastores
         - disks: List of disks to attach to a new VM
         - vsphere: Pre-Configured vsphere connection details
+        - vms: List of VMs to place at once, with their cpu, memory_mb and disk_gb
+        - scoring: 'least_vms' picks the host with the fewest VMs and the datastore with
+                   the most free space, 'resources' the host and datastore with the lowest
+                   weighted CPU, memory and provisioned storage usage
+        - weights: weights of the 'cpu', 'memory' and 'storage' usage for 'resources' scoring
 
         Returns:
         - dict: key value pairs with calculated host and datastore names and ids
+        - list: the same key value pairs and the VM name for each of the vms
         """
         self.establish_connection(vsphere)
 
-        # Return a host from the given cluster that's powered on and has the least amount of VMs
-        host = self.get_host(datacenter_name, cluster_name)
+        # Read the hosts and datastores of the cluster at once, then pick from them in memory
+        cluster = self.get_cluster(datacenter_name, cluster_name)
+        resources = self.get_cluster_resources(cluster)
+
+        if vms:
+            placements = self.plan_placements(cluster_name, resources, vms,
+                                              datastore_filter_strategy,
+                                              datastore_filter_regex_list,
+                                              scoring, weights)
+            return [{'name': vm.get('name'),
+                     'clusterName': cluster_name,
+                     'hostName': host_props.get('name'),
+                     'hostID': host._moId,
+                     'datastoreName': datastore_name,
+                     'datastoreID': datastore._moId}
+                    for vm, host, host_props, datastore, datastore_name in placements]
 
-        # Return a datastore on the host that is either specified in the disks variable or
-        # has the most free space and a name that doesn't match any filters
-        datastore = self.get_storage(host,
-                                     datastore_filter_strategy,
-                                     datastore_filter_regex_list,
-                                     disks)
+        datastore_pinned = disks is not None and disks[0]['datastore'] != "automatic"
+        if scoring == 'resources' and not datastore_pinned:
+            # Score the hosts and datastores together, as a batch of one VM
+            placement = self.plan_placements(cluster_name, resources, [{}],
+                                             datastore_filter_strategy,
+                                             datastore_filter_regex_list,
+                                             scoring, weights)[0]
+            vm, host, host_props, datastore, datastore_name = placement
+        else:
+            # Return a host from the given cluster that's powered on and has the least
+            # amount of VMs
+            host, host_props = self.get_host(cluster_name, resources['hosts'],
+                                             scoring=scoring, weights=weights)
+
+            # Return a datastore on the host that is either specified in the disks variable or
+            # has the most free space and a name that doesn't match any filters
+            datastore, datastore_name = self.get_storage(host_props,
+                                                         resources['datastores'],
+                                                         datastore_filter_strategy,
+                                                         datastore_filter_regex_list,
+                                                         disks)
+        if datastore is None:
+            raise Exception("No available datastores found for host: {}".format(
+                host_props.get('name')))
 
-        return {'clusterName': host.parent.name,
-                'hostName': host.name,
+        return {'clusterName': cluster_name,
+                'hostName': host_props.get('name'),
                 'hostID': host._moId,
-                'datastoreName': datastore.name,
+                'datastoreName': datastore_name,
                 'datastoreID': datastore._moId}
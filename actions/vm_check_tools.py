@@ -13,14 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import eventlet  # pylint: disable=import-error
-import json
-
 from pyVmomi import vim  # pylint: disable-msg=E0611
 
 from vmwarelib import inventory
+from vmwarelib import tasks
 from vmwarelib.actions import BaseAction
-from vmwarelib.serialize import MyJSONEncoder
+from vmwarelib.serialize import DEFAULT_SERIALIZER
 
 
 class VMCheckTools(BaseAction):
@@ -32,7 +30,7 @@ class VMCheckTools(BaseAction):
 
         # Get current Tools config information
         # Decode the vmware object type into json format
-        return_value = json.loads(json.dumps(vm.config.tools, cls=MyJSONEncoder))
+        return_value = DEFAULT_SERIALIZER.serialize(vm.config.tools)
 
         # To correctly understand tools status need to consult 3 properties
         # 'powerState' 'toolsVersionStatus2' and 'toolsRunningStatus'
@@ -49,10 +47,8 @@ class VMCheckTools(BaseAction):
             return return_value
 
         # Scripts still running therefore wait.
-        while vm.guest.toolsRunningStatus != \
-                vim.vm.GuestInfo.ToolsRunningStatus.guestToolsRunning:
-            eventlet.sleep(1)
-
-        # verify status is running.
-        return_value['status'] = vm.guest.toolsRunningStatus
+        running = vim.vm.GuestInfo.ToolsRunningStatus.guestToolsRunning
+        return_value['status'] = tasks.wait_for_property(self.si_content, vm,
+                                                         'guest.toolsRunningStatus',
+                                                         lambda status: status == running)
         return return_value
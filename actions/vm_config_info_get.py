@@ -14,9 +14,8 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import MyJSONEncoder
+from vmwarelib.serialize import DEFAULT_SERIALIZER
 from vmwarelib.actions import BaseAction
-import json
 
 
 class GetVMConfigInfo(BaseAction):
@@ -46,11 +45,11 @@ class GetVMConfigInfo(BaseAction):
                 vm = inventory.get_virtualmachine(self.si_content, moid=vid)
                 if vm:
                     if vm.name not in results:
-                        results[vm.name] = json.loads(json.dumps(vm.config, cls=MyJSONEncoder))
+                        results[vm.name] = DEFAULT_SERIALIZER.serialize(vm.config)
         if vm_names:
             for vm in vm_names:
                 vm = inventory.get_virtualmachine(self.si_content, name=vm)
                 if vm:
                     if vm.name not in results:
-                        results[vm.name] = json.loads(json.dumps(vm.config, cls=MyJSONEncoder))
+                        results[vm.name] = DEFAULT_SERIALIZER.serialize(vm.config)
         return results
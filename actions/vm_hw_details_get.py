@@ -14,9 +14,9 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import MyJSONEncoder
+from vmwarelib.serialize import DEFAULT_SERIALIZER
 from vmwarelib.actions import BaseAction
-import json
+from pyVmomi import vim  # pylint: disable-msg=E0611
 
 
 class GetVMDetails(BaseAction):
@@ -34,23 +34,16 @@ class GetVMDetails(BaseAction):
         - dict: Virtual machine details.
         """
 
-        # TODO review using propertspec for retrieving all VM's at onces.
         results = {}
         if not vm_ids and not vm_names:
             raise ValueError("No IDs nor Names provided.")
 
         self.establish_connection(vsphere)
 
-        if vm_ids:
-            for vid in vm_ids:
-                vm = inventory.get_virtualmachine(self.si_content, moid=vid)
-                if vm:
-                    if vm.name not in results:
-                        results[vm.name] = json.loads(json.dumps(vm.summary, cls=MyJSONEncoder))
-        if vm_names:
-            for vm in vm_names:
-                vm = inventory.get_virtualmachine(self.si_content, name=vm)
-                if vm:
-                    if vm.name not in results:
-                        results[vm.name] = json.loads(json.dumps(vm.summary, cls=MyJSONEncoder))
+        vms = inventory.find_managed_entities(self.si_content, vim.VirtualMachine,
+                                              moids=vm_ids, names=vm_names,
+                                              path_set=['summary'])
+        for vm, properties in vms:
+            if properties['name'] not in results:
+                results[properties['name']] = DEFAULT_SERIALIZER.serialize(properties['summary'])
         return results
@@ -14,12 +14,11 @@
 # limitations under the License.
 
 from pyVmomi import vim  # pylint: disable-msg=E0611
-import json
 
 from vmwarelib import inventory
 from vmwarelib import checkinputs
 from vmwarelib.actions import BaseAction
-from vmwarelib.serialize import MyJSONEncoder
+from vmwarelib.serialize import DEFAULT_SERIALIZER
 
 
 class VMGetHDDs(BaseAction):
@@ -48,4 +47,4 @@ class VMGetHDDs(BaseAction):
             if (isinstance(device, vim.vm.device.VirtualDisk)):
                 disks.append(device)
 
-        return json.loads(json.dumps(disks, cls=MyJSONEncoder))
+        return DEFAULT_SERIALIZER.serialize(disks)
@@ -13,9 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import eventlet  # pylint: disable=import-error
-from pyVmomi import vim  # pylint: disable-msg=E0611
-
 from vmwarelib import inventory
 from vmwarelib import checkinputs
 from vmwarelib.actions import BaseAction
@@ -50,6 +47,5 @@ class VMApplyPowerState(BaseAction):
             task = vm.PowerOffVM_Task()
         elif power_onoff == "poweron":
             task = vm.PowerOnVM_Task()
-        while task.info.state == vim.TaskInfo.State.running:
-            eventlet.sleep(1)
+        self._wait_for_task(task)
         return {'state': str(task.info.state)}
@@ -13,13 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
 from pyVmomi import vim  # pylint: disable-msg=E0611
 
 from vmwarelib import inventory
 from vmwarelib import checkinputs
 from vmwarelib.actions import BaseAction
-from vmwarelib.serialize import MyJSONEncoder
+from vmwarelib.serialize import DEFAULT_SERIALIZER
 
 
 class VMSCSIControllersGet(BaseAction):
@@ -51,4 +50,4 @@ class VMSCSIControllersGet(BaseAction):
                     isinstance(device, vim.vm.device.ParaVirtualSCSIController)):
                 controllers.append(device)
 
-        return json.loads(json.dumps(controllers, cls=MyJSONEncoder))
+        return DEFAULT_SERIALIZER.serialize(controllers)
@@ -14,9 +14,8 @@
 # limitations under the License.
 
 from vmwarelib import inventory
-from vmwarelib.serialize import VmRuntimeInfoJSONEncoder
+from vmwarelib.serialize import VM_RUNTIME_INFO_SERIALIZER
 from vmwarelib.actions import BaseAction
-import json
 
 
 class GetVMRuntimeInfo(BaseAction):
@@ -46,13 +45,11 @@ class GetVMRuntimeInfo(BaseAction):
                 vm = inventory.get_virtualmachine(self.si_content, moid=vid)
                 if vm:
                     if vm.name not in results:
-                        results[vm.name] = json.loads(json.dumps(vm.runtime,
-                                                                 cls=VmRuntimeInfoJSONEncoder))
+                        results[vm.name] = VM_RUNTIME_INFO_SERIALIZER.serialize(vm.runtime)
         if vm_names:
             for vm in vm_names:
                 vm = inventory.get_virtualmachine(self.si_content, name=vm)
                 if vm:
                     if vm.name not in results:
-                        results[vm.name] = json.loads(json.dumps(vm.runtime,
-                                                                 cls=VmRuntimeInfoJSONEncoder))
+                        results[vm.name] = VM_RUNTIME_INFO_SERIALIZER.serialize(vm.runtime)
         return results
@@ -15,19 +15,36 @@
 
 from vmwarelib.actions import BaseAction
 from vmwarelib import inventory
+from vmwarelib import tasks
+from pyVmomi import vim  # pylint: disable-msg=E0611
+from six.moves import queue
+import collections
 import re
 import datetime
+import time
 import pytz  # pylint: disable=import-error
 
+# Removing a snapshot consolidates its disks, which is heavy on the datastore,
+# so only a few removals run at once overall and on each datastore
+DEFAULT_MAX_CONCURRENT = 10
+DEFAULT_MAX_PER_DATASTORE = 2
+# seconds a single removal may run before it is cancelled, by default removals run
+# as long as vCenter takes to consolidate the disks
+DEFAULT_TASK_TIMEOUT = None
+
+REMOVE_TASK_PATHS = ['info.state', 'info.error', 'info.startTime', 'info.completeTime']
+
 
 class VMSnapshotsDelete(BaseAction):
-    def delete_old_snapshots(self, snapshot_list, max_age_days, name_ignore_patterns):
-        """Deletes all snapshots from the given list that are older than max_age_days.
+    def find_old_snapshots(self, snapshot_list, max_age_days, name_ignore_patterns, vm_name):
+        """Finds all snapshots in the given snapshot tree that are older than max_age_days.
         Ignorning any snapshot with a name that matches one of the name_ignore_pattern.
+        :returns: dict with the snapshot trees to delete, parents before their children,
+                  and the names of the ignored snapshots
         """
         date_now = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
 
-        deleted_snapshots = []
+        old_snapshots = []
         ignored_snapshots = []
 
         for snap in snapshot_list:
@@ -40,49 +57,217 @@ class VMSnapshotsDelete(BaseAction):
 
             # ignore if the snapshot name matches one of the regexes
             if self.matches_pattern_list(snap_name, name_ignore_patterns):
-                ignored_snapshots.append("{0}: {1}".format(snap.vm.name, snap_name))
+                ignored_snapshots.append("{0}: {1}".format(vm_name, snap_name))
 
             # Snapshots older than the max age will be deleted
             elif remove_date < date_now:
-                deleted_snapshots.append("{0}: {1}".format(snap.vm.name, snap_name))
-                snap.snapshot.RemoveSnapshot_Task(removeChildren=False, consolidate=True)
+                old_snapshots.append(snap)
 
             # Re-run this function with the child snapshot list of any children are found
             if snap.childSnapshotList:
-                child_result = self.delete_old_snapshots(snap.childSnapshotList,
-                                                         max_age_days,
-                                                         name_ignore_patterns)
+                child_result = self.find_old_snapshots(snap.childSnapshotList,
+                                                       max_age_days,
+                                                       name_ignore_patterns,
+                                                       vm_name)
 
                 # Append the results from the child snapshots
-                deleted_snapshots += child_result['deleted_snapshots']
+                old_snapshots += child_result['old_snapshots']
                 ignored_snapshots += child_result['ignored_snapshots']
 
-        return {'deleted_snapshots': deleted_snapshots,
+        return {'old_snapshots': old_snapshots,
                 'ignored_snapshots': ignored_snapshots}
 
-    def delete_all_old_snapshots(self, max_age_days, name_ignore_patterns):
-        """Deletes all snapshots from all VMs that are older than max_age_days.
-        Ignorning any snapshot with a name that matches one of the name_ignore_pattern.
+    def delete_snapshots(self, vms, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                         max_per_datastore=DEFAULT_MAX_PER_DATASTORE,
+                         task_timeout=DEFAULT_TASK_TIMEOUT):
+        """Removes snapshots through a work queue that runs at most max_concurrent
+        RemoveSnapshot tasks at once, and at most max_per_datastore on any datastore
+        of the VMs. The snapshots of a VM are removed one at a time, in order.
+        A removal still running task_timeout seconds after it started is cancelled
+        and reported as timed out, together with the remaining snapshots of its VM,
+        while the other removals go on.
+
+        :param vms: list of dicts with the 'name', the datastore MOIDs ('datastores')
+                    and the snapshot trees to remove ('snapshots') of each VM
+        :returns: list of dicts with the outcome of each removal
         """
-        # Retrieve a list of all VMs in vSphere
-        vm_list = inventory.get_virtualmachines(self.si_content)
-        deleted_snapshots = []
-        ignored_snapshots = []
-        for vm in vm_list.view:
-            # Check if any snapshots exist on the VM
-            try:
-                snapshots = vm.snapshot.rootSnapshotList
-            except:
-                self.logger.exception('No snapshots found for VM: {}.'.format(vm.name))
+        max_concurrent = max(max_concurrent or DEFAULT_MAX_CONCURRENT, 1)
+        max_per_datastore = max(max_per_datastore or DEFAULT_MAX_PER_DATASTORE, 1)
+
+        pending = collections.deque(dict(vm, snapshots=list(vm['snapshots']))
+                                    for vm in vms if vm['snapshots'])
+        running = {}
+        datastore_load = collections.Counter()
+        results = []
+
+        # the tracker's thread hands back each task as it completes
+        completed = queue.Queue()
+        tracker = tasks.TaskTracker(self.si_content,
+                                    lambda task, props: completed.put((task, props)),
+                                    path_set=REMOVE_TASK_PATHS,
+                                    logger=self.logger)
+        try:
+            while pending or running:
+                waiting = collections.deque()
+                while pending and len(running) < max_concurrent:
+                    vm = pending.popleft()
+                    if any(datastore_load[ds] >= max_per_datastore for ds in vm['datastores']):
+                        waiting.append(vm)
+                        continue
+
+                    snap = vm['snapshots'].pop(0)
+                    started = time.time()
+                    try:
+                        task = snap.snapshot.RemoveSnapshot_Task(removeChildren=False,
+                                                                 consolidate=True)
+                    except Exception as e:
+                        results.append(self._removal_result(vm, snap, 'error', started, error=e))
+                        if vm['snapshots']:
+                            waiting.append(vm)
+                        continue
+
+                    datastore_load.update(vm['datastores'])
+                    running[task._moId] = (vm, snap, started, task)
+                    tracker.track(task)
+
+                # VMs held back by a busy datastore keep their place in the queue
+                waiting.extend(pending)
+                pending = waiting
+
+                if not running:
+                    continue
+
+                # wait until the oldest running removal reaches its deadline
+                timeout = None
+                if task_timeout:
+                    oldest = min(started for _, _, started, _ in running.values())
+                    timeout = max(oldest + task_timeout - time.time(), 0)
+                try:
+                    task, props = completed.get(timeout=timeout)
+                except queue.Empty:
+                    for vm in self._cancel_expired(running, task_timeout, results):
+                        datastore_load.subtract(vm['datastores'])
+                    continue
+
+                # removals cancelled after their deadline may still report back
+                if task._moId not in running:
+                    continue
+                vm, snap, started, _ = running.pop(task._moId)
+                datastore_load.subtract(vm['datastores'])
+                results.append(self._removal_result(vm, snap, str(props.get('info.state')),
+                                                    started, props=props,
+                                                    error=props.get('info.error')))
+                if vm['snapshots']:
+                    pending.appendleft(vm)
+        finally:
+            tracker.stop()
+
+        return results
+
+    def _cancel_expired(self, running, task_timeout, results):
+        """Cancels the removals running for task_timeout seconds or more and adds
+        their results, and those of the snapshots their VMs still had to remove,
+        which are skipped
+
+        :returns: list of the VMs whose removal was cancelled
+        """
+        now = time.time()
+        expired = []
+        for moid, (vm, snap, started, task) in list(running.items()):
+            if now - started < task_timeout:
                 continue
+            del running[moid]
+            try:
+                task.CancelTask()
+            except Exception as e:
+                self.logger.warning("Unable to cancel the removal of %s on %s: %s" %
+                                    (snap.name, vm['name'], e))
+            error = 'snapshot removal did not complete within %s seconds' % task_timeout
+            results.append(self._removal_result(vm, snap, 'timeout', started, error=error))
+            for skipped in vm['snapshots']:
+                results.append(self._removal_result(
+                    vm, skipped, 'skipped', now,
+                    error='an earlier snapshot removal of the VM timed out'))
+            vm['snapshots'] = []
+            expired.append(vm)
+        return expired
+
+    def _removal_result(self, vm, snap, state, started, props=None, error=None):
+        props = props or {}
+        start_time = props.get('info.startTime')
+        complete_time = props.get('info.completeTime')
+        if start_time and complete_time:
+            duration = (complete_time - start_time).total_seconds()
+        else:
+            duration = time.time() - started
 
-            result = self.delete_old_snapshots(snapshots, max_age_days, name_ignore_patterns)
-            # Append the results from each VM
-            deleted_snapshots += result['deleted_snapshots']
+        result = {'vm': vm['name'],
+                  'snapshot': snap.name,
+                  'state': state,
+                  'duration': round(duration, 3)}
+        if error is not None:
+            result['error'] = getattr(error, 'msg', None) or str(error)
+        return result
+
+    def delete_old_snapshots(self, vms, max_age_days, name_ignore_patterns,
+                             max_concurrent=DEFAULT_MAX_CONCURRENT,
+                             max_per_datastore=DEFAULT_MAX_PER_DATASTORE,
+                             task_timeout=DEFAULT_TASK_TIMEOUT):
+        """Deletes all snapshots of the given VMs that are older than max_age_days.
+        Ignorning any snapshot with a name that matches one of the name_ignore_pattern.
+
+        :param vms: list of dicts with the 'name', the datastore MOIDs ('datastores')
+                    and the root snapshot trees ('snapshots') of each VM
+        """
+        ignored_snapshots = []
+        old_vms = []
+        for vm in vms:
+            result = self.find_old_snapshots(vm['snapshots'], max_age_days,
+                                             name_ignore_patterns, vm['name'])
             ignored_snapshots += result['ignored_snapshots']
+            old_vms.append(dict(vm, snapshots=result['old_snapshots']))
+
+        results = self.delete_snapshots(old_vms, max_concurrent, max_per_datastore,
+                                        task_timeout)
+
+        deleted_snapshots = []
+        failed_snapshots = []
+        for result in results:
+            name = "{0}: {1}".format(result['vm'], result['snapshot'])
+            if result['state'] == vim.TaskInfo.State.success:
+                deleted_snapshots.append(name)
+            else:
+                failed_snapshots.append(name)
 
         return {'deleted_snapshots': deleted_snapshots,
-                'ignored_snapshots': ignored_snapshots}
+                'ignored_snapshots': ignored_snapshots,
+                'failed_snapshots': failed_snapshots,
+                'results': results}
+
+    def delete_all_old_snapshots(self, max_age_days, name_ignore_patterns,
+                                 max_concurrent=DEFAULT_MAX_CONCURRENT,
+                                 max_per_datastore=DEFAULT_MAX_PER_DATASTORE,
+                                 task_timeout=DEFAULT_TASK_TIMEOUT):
+        """Deletes all snapshots from all VMs that are older than max_age_days.
+        Ignorning any snapshot with a name that matches one of the name_ignore_pattern.
+        """
+        # Retrieve the snapshot trees of all VMs in vSphere with a single query
+        vm_properties = inventory.get_entity_properties(self.si_content, vim.VirtualMachine,
+                                                        path_set=['name', 'datastore',
+                                                                  'snapshot'])
+        vms = []
+        for vm, props in vm_properties:
+            # VMs without any snapshots don't have the property set
+            snapshot = props.get('snapshot')
+            if not snapshot or not snapshot.rootSnapshotList:
+                continue
+
+            vms.append({'name': props.get('name'),
+                        'datastores': [ds._moId for ds in props.get('datastore') or []],
+                        'snapshots': snapshot.rootSnapshotList})
+
+        return self.delete_old_snapshots(vms, max_age_days, name_ignore_patterns,
+                                         max_concurrent, max_per_datastore, task_timeout)
 
     def compile_regexes(self, regex_list):
         """Compiles all of the regexes in the list into patterns
@@ -102,7 +287,9 @@ class VMSnapshotsDelete(BaseAction):
                 return True
         return False
 
-    def run(self, max_age_days, name_ignore_regexes, vm_id, vm_name, vsphere=None):
+    def run(self, max_age_days, name_ignore_regexes, vm_id, vm_name,
+            max_concurrent=DEFAULT_MAX_CONCURRENT, max_per_datastore=DEFAULT_MAX_PER_DATASTORE,
+            task_timeout=DEFAULT_TASK_TIMEOUT, vsphere=None):
         """
         Deletes all snapshots that are older than max_age_days on either all VMs or the given VM.
         Ignore any snapshot with a name that matches one of the name_ignore_regexes.
@@ -113,10 +300,15 @@ class VMSnapshotsDelete(BaseAction):
             will be ignored and NOT deleted
         - vm_id: Moid of Virtual Machine to retrieve
         - vm_name: Name of Virtual Machine to retrieve
+        - max_concurrent: Maximum number of snapshots removed at once
+        - max_per_datastore: Maximum number of snapshots removed at once on any datastore
+        - task_timeout: Seconds a removal may run before it is cancelled and the remaining
+            snapshots of its VM are skipped, unset or 0 waits for every removal
         - vsphere: Pre-configured vsphere connection details (config.yaml)
 
         Returns:
-        - dict: Lists of snapshots that were deleted and ignored
+        - dict: Lists of snapshots that were deleted, ignored and failed to be deleted
+                and the outcome and duration of each removal
         """
         self.establish_connection(vsphere)
 
@@ -132,7 +324,13 @@ class VMSnapshotsDelete(BaseAction):
             except:
                 return "No snapshots found for VM: {}".format(vm.name)
 
-            return self.delete_old_snapshots(snapshots, max_age_days, ignore_patterns)
+            vms = [{'name': vm.name,
+                    'datastores': [ds._moId for ds in vm.datastore],
+                    'snapshots': snapshots}]
+            return self.delete_old_snapshots(vms, max_age_days, ignore_patterns,
+                                             max_concurrent, max_per_datastore, task_timeout)
         # If no VM was given then remove snapshots from all VMs
         else:
-            return self.delete_all_old_snapshots(max_age_days, ignore_patterns)
+            return self.delete_all_old_snapshots(max_age_days, ignore_patterns,
+                                                 max_concurrent, max_per_datastore,
+                                                 task_timeout)
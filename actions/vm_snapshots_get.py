@@ -15,11 +15,19 @@
 
 from vmwarelib.actions import BaseAction
 from vmwarelib import inventory
+from pyVmomi import vim  # pylint: disable-msg=E0611
+import datetime
 import re
+import pytz  # pylint: disable=import-error
+
+# delta disks of snapshots are named <disk>-000001.vmdk, <disk>-000002.vmdk, ...
+SNAPSHOT_DISK_RE = re.compile('0000[0-9][0-9]')
+
+FLEET_PROPERTIES = ['name', 'snapshot', 'layoutEx.file']
 
 
 class VMSnapshotsGet(BaseAction):
-    def run(self, vm_id, vm_name, flat, vsphere=None):
+    def run(self, vm_id, vm_name, flat, folder_id=None, cluster_id=None, vsphere=None):
         """
         Display snapshots
 
@@ -28,11 +36,13 @@ class VMSnapshotsGet(BaseAction):
         - vm_name: Name of Virtual Machine to retrieve
         - flat: When True, returns a flattened list of snapshots.
                 When False, returns the snapshots tree
+        - folder_id: Moid of the folder to report the VMs of, when no VM is given
+        - cluster_id: Moid of the cluster to report the VMs of, when no VM is given
         - vsphere: Pre-configured vsphere connection details (config.yaml)
 
         Returns:
-        - dict: Total snapshots size in GB
-        - dict: Lists of snapshots found
+        - dict: Total snapshots size in GB and the snapshots found, for the given VM
+        - list: Snapshot count, age and size of every VM with snapshots, when no VM is given
         """
         self.establish_connection(vsphere)
 
@@ -48,6 +58,49 @@ class VMSnapshotsGet(BaseAction):
 
             return {'size_gb': self.get_snapshots_size_gb(vm),
                     'snapshots': self.get_snapshots_details(snapshots, flat)}
+        # If no VM was given then report the snapshots of all VMs
+        else:
+            return list(self.get_fleet_snapshots(folder_id, cluster_id))
+
+    def get_fleet_snapshots(self, folder_id=None, cluster_id=None):
+        """Yields the snapshot count, age and size of every VM that has snapshots,
+        reading the snapshot trees and file layouts of all VMs with a single paged
+        property retrieval.
+        """
+        if folder_id and cluster_id:
+            raise ValueError("Only one of folder_id and cluster_id can be given")
+
+        container = None
+        if folder_id:
+            container = vim.Folder(folder_id, stub=self.si._stub)
+        elif cluster_id:
+            container = vim.ComputeResource(cluster_id, stub=self.si._stub)
+
+        date_now = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
+        for vm, props in inventory.iter_entity_properties(self.si_content, vim.VirtualMachine,
+                                                          path_set=FLEET_PROPERTIES,
+                                                          container=container):
+            # VMs without any snapshots don't have the property set
+            snapshot = props.get('snapshot')
+            if not snapshot or not snapshot.rootSnapshotList:
+                continue
+
+            create_times = [s.createTime for s in self.walk_snapshots(snapshot.rootSnapshotList)]
+            oldest = min(create_times)
+            yield {'vm_moid': vm._moId,
+                   'vm_name': props.get('name'),
+                   'snapshot_count': len(create_times),
+                   'oldest_created': str(oldest),
+                   'newest_created': str(max(create_times)),
+                   'age_days': round((date_now - oldest).total_seconds() / 86400, 2),
+                   'size_gb': self.get_files_size_gb(props.get('layoutEx.file') or [])}
+
+    def walk_snapshots(self, snapshots):
+        """yields every snapshot of the given snapshot trees"""
+        for s in snapshots:
+            yield s
+            for child in self.walk_snapshots(s.childSnapshotList or []):
+                yield child
 
     def get_snapshots_details(self, snapshots, flat):
         """returns detailed information about snapshot"""
@@ -75,13 +128,13 @@ class VMSnapshotsGet(BaseAction):
 
     def get_snapshots_size_gb(self, vsphere_vm):
         """returns snapshot size, in GB for a VM"""
-        disk_list = vsphere_vm.layoutEx.file
+        return self.get_files_size_gb(vsphere_vm.layoutEx.file)
+
+    def get_files_size_gb(self, disk_list):
+        """returns the size of the snapshot files in a VM's file layout, in GB"""
         size = 0
         for disk in disk_list:
-            if disk.type == 'snapshotData':
-                size += disk.size
-            ss_disk = re.search('0000[0-9][0-9]', disk.name)
-            if ss_disk:
+            if disk.type == 'snapshotData' or SNAPSHOT_DISK_RE.search(disk.name):
                 size += disk.size
 
         size_gb = (float(size) / 1024 / 1024 / 1024)
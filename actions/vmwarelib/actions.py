@@ -13,22 +13,65 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
+import copy
+import functools
+import json
 import ssl
-import atexit
 
-import eventlet  # pylint: disable=import-error
 import requests
-from pyVim import connect
 from pyVmomi import vim  # pylint: disable-msg=E0611
 
 from st2common.runners.base_action import Action
 
+from vmwarelib import session
+from vmwarelib import tasks
 from vmwarelib.tagging import VmwareTagging
 
 CONNECTION_ITEMS = ['host', 'port', 'user', 'passwd']
 
+# datastore keys the vSphere session ids are stored under for reuse by later executions
+SESSION_KEY = 'vsphere.session.%s'
+REST_SESSION_KEY = 'vsphere.rest_session.%s'
+
+
+def _instrument_run(run):
+    """
+    Wraps the run method of an action so it logs the hit/miss counters of the
+    tag name indexes once it is done.
+    """
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return run(self, *args, **kwargs)
+        finally:
+            if getattr(self, 'tagging', None) is not None:
+                self.logger.debug("vSphere tag name indexes: %s" % self.tagging.index_stats())
+    wrapper._instrumented = True
+    return wrapper
+
+
+def map_concurrently(func, items, max_workers):
+    """
+    Yields func(item) for every item, in the order of items, calling func from
+    at most max_workers threads at once. python-script actions are not monkey
+    patched by eventlet, so only real threads run blocking vSphere and HTTP
+    calls concurrently.
+    """
+    items = list(items)
+    workers = max(min(max_workers, len(items)), 1)
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        for result in executor.map(func, items):
+            yield result
+
 
 class BaseAction(Action):
+    def __init_subclass__(cls, **kwargs):
+        super(BaseAction, cls).__init_subclass__(**kwargs)
+        run = cls.__dict__.get('run')
+        if run is not None and not getattr(run, '_instrumented', False):
+            cls.run = _instrument_run(run)
+
     def __init__(self, config):
         super(BaseAction, self).__init__(config)
         if config is None:
@@ -59,6 +102,11 @@ class BaseAction(Action):
         """
         Sets:
         - content
+
+        A session reused from the pool is checked before it is returned, and
+        replaced with a new login when it expired. Calls made later are not
+        retried on NotAuthenticated, since the action may have changed
+        things in vSphere by then.
         """
         self.si = self._connect(vsphere)
         self.si_content = self.si.RetrieveContent()
@@ -67,6 +115,31 @@ class BaseAction(Action):
     def content(self):
         return self.si_content
 
+    def run_on_vspheres(self, vspheres, func, *args, **kwargs):
+        """
+        Calls func(action, *args, **kwargs) for several vsphere connections
+        concurrently, one thread per connection. Each call gets its own
+        copy of this action connected to one of the vsphere connections.
+
+        Args:
+        - vspheres: names of the pre-configured vsphere connections (config.yaml)
+        - func: function to call, usually an unbound method of the action class
+
+        Returns:
+        - list: (vsphere, result) tuples in the order of vspheres
+        """
+        def run_one(vsphere):
+            action = copy.copy(self)
+            action.tagging = None
+
+            try:
+                action.establish_connection(vsphere)
+                return vsphere, func(action, *args, **kwargs)
+            except Exception as e:
+                raise Exception("vsphere %s: %s" % (vsphere, e))
+
+        return list(map_concurrently(run_one, vspheres, len(vspheres)))
+
     def _get_connection_info(self, vsphere):
         if vsphere:
             connection = self.config['vsphere'].get(vsphere)
@@ -84,18 +157,51 @@ class BaseAction(Action):
 
     def _connect(self, vsphere):
         connection = self._get_connection_info(vsphere)
+        name = vsphere or 'default'
+        self._session_name = name
+
+        pool_config = self.config.get('session_pool') or {}
+        persist = pool_config.get('persist', True)
+        pool = session.get_pool(idle_timeout=pool_config.get('idle_timeout'),
+                                keepalive_interval=pool_config.get('keepalive_interval'))
 
+        session_id = self._load_session_id(SESSION_KEY % name, connection) if persist else None
         try:
-            si = connect.SmartConnect(host=connection['host'],
-                                      port=connection['port'],
-                                      user=connection['user'],
-                                      pwd=connection['passwd'])
+            si = pool.get(name, connection, session_id=session_id, persistent=persist,
+                          verify=True)
         except Exception as e:
             raise Exception(e)
 
-        atexit.register(connect.Disconnect, si)
+        if persist:
+            self._save_session_id(SESSION_KEY % name, connection,
+                                  session.get_session_id(si), pool.idle_timeout)
         return si
 
+    def _load_session_id(self, key, connection):
+        try:
+            value = self.action_service.get_value(key, local=False, decrypt=True)
+            if not value:
+                return None
+            stored = json.loads(value)
+        except Exception as e:
+            self.logger.debug("Unable to load the stored vSphere session: %s" % e)
+            return None
+
+        if stored.get('host') != connection['host'] or stored.get('user') != connection['user']:
+            return None
+        return stored.get('session_id')
+
+    def _save_session_id(self, key, connection, session_id, ttl):
+        if not session_id:
+            return
+        try:
+            value = json.dumps({'host': connection['host'],
+                                'user': connection['user'],
+                                'session_id': session_id})
+            self.action_service.set_value(key, value, ttl=ttl, local=False, encrypt=True)
+        except Exception as e:
+            self.logger.debug("Unable to store the vSphere session: %s" % e)
+
     def connect_rest(self, vsphere):
         connection = self._get_connection_info(vsphere)
         port = connection['port']
@@ -108,14 +214,24 @@ class BaseAction(Action):
         else:
             raise ValueError("Port %s is invalid" % port)
 
+        pool_config = self.config.get('session_pool') or {}
+        persist = pool_config.get('persist', True)
+        key = REST_SESSION_KEY % (vsphere or 'default')
+        ttl = pool_config.get('idle_timeout') or session.DEFAULT_IDLE_TIMEOUT
+
+        on_login = None
+        if persist:
+            on_login = functools.partial(self._save_session_id, key, connection, ttl=ttl)
+
         self.tagging = VmwareTagging(server=connection['host'],
                                      username=connection['user'],
                                      password=connection['passwd'],
                                      scheme=scheme,
                                      port=port,
                                      ssl_verify=self.ssl_verify,
-                                     logger=self.logger)
-        self.tagging.login()
+                                     logger=self.logger,
+                                     on_login=on_login)
+        self.tagging.resume_session(self._load_session_id(key, connection) if persist else None)
         return self.tagging.session
 
     def _rest_api_call(self, vsphere, api_endpoint, api_verb, payload=None):
@@ -131,14 +247,28 @@ class BaseAction(Action):
         prepped = session.prepare_request(req)
 
         response = session.send(prepped)
+        if response.status_code == 401:
+            # the reused session has expired, log in again and retry once
+            self.tagging.login()
+            prepped = session.prepare_request(req)
+            response = session.send(prepped)
 
         return response.json()
 
-    def _wait_for_task(self, task):
-        while (task.info.state == vim.TaskInfo.State.queued or   # noqa: W504
-               task.info.state == vim.TaskInfo.State.running):
-            eventlet.sleep(1)
-        return task.info.state == vim.TaskInfo.State.success
+    def _wait_for_task(self, task, timeout=None):
+        states = tasks.wait_for_tasks(self.si_content, [task], timeout=timeout)
+        return states[task._moId] == vim.TaskInfo.State.success
+
+    def _wait_for_tasks(self, task_list, timeout=None):
+        """
+        Waits for several tasks at once.
+
+        Returns:
+        - dict: task moid -> True when the task succeeded
+        """
+        states = tasks.wait_for_tasks(self.si_content, task_list, timeout=timeout)
+        return dict((moid, state == vim.TaskInfo.State.success)
+                    for moid, state in states.items())
 
     def get_vim_type(self, object_type):
         try:
@@ -13,10 +13,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .actions import BaseAction
+from .actions import BaseAction, map_concurrently
 from pyVmomi import vim  # pylint: disable-msg=E0611
 from . import inventory
+from requests.adapters import HTTPAdapter
+import copy
+import hashlib
 import os
+import requests
+import threading
+import time
+
+# Files are streamed to and from guests in blocks of at most this many bytes,
+# so the memory used does not grow with the size of the file
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Files up to this size are read into memory once when they are sent to many
+# guests, larger files are streamed from disk again for every guest
+SHARED_UPLOAD_MAX_SIZE = 64 * 1024 * 1024
+
+# Guests or files operated on concurrently by the multi-guest actions, and
+# the least number of connections kept open per ESXi host for file transfers
+DEFAULT_MAX_WORKERS = 20
+
+# Programs run in a guest are polled quickly at first so short commands return
+# fast, then less and less often up to the maximum interval
+POLL_INTERVAL = 0.25
+MAX_POLL_INTERVAL = 8
+
+_http_session = None
+_http_pool_size = 0
+_http_session_lock = threading.Lock()
+
+
+def get_http_session(pool_size=DEFAULT_MAX_WORKERS):
+    """
+    Returns the process wide HTTP session used for guest file transfers, so
+    transfers to the same ESXi host reuse pooled keep-alive connections
+    instead of paying for a new TLS handshake each time.
+
+    The connection pools are grown to pool_size when they are smaller, so
+    callers transferring with more workers pass their max_workers and no
+    connection is thrown away after use.
+    """
+    global _http_session, _http_pool_size
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+        if pool_size > _http_pool_size:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _http_session.mount('https://', adapter)
+            _http_session.mount('http://', adapter)
+            _http_pool_size = pool_size
+        return _http_session
+
+
+class ChunkedReader(object):
+    """
+    File-like wrapper handed to requests as the body of an upload. It reads
+    the file in bounded chunks while counting and hashing the bytes sent, and
+    its length gives requests the Content-Length the guest file transfer needs.
+    """
+    def __init__(self, fileobj, size, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._file = fileobj
+        self.size = size
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self._sha256 = hashlib.sha256()
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        data = self._file.read(size)
+        self.bytes_read += len(data)
+        self._sha256.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+
+def transfer_stats(size, started):
+    """Returns the size, duration and throughput of a transfer started at the given time"""
+    seconds = max(time.time() - started, 0.001)
+    return {'size': size,
+            'seconds': round(seconds, 3),
+            'bytes_per_second': int(size / seconds)}
 
 
 class GuestAction(BaseAction):
@@ -45,6 +130,85 @@ class GuestAction(BaseAction):
                                                    password=password)
         self._vm = inventory.get_virtualmachine(self.content, moid=vm_id)
 
+    def prepare_multi_guest_operation(self, vsphere, username, password):
+        """
+        Same as prepare_guest_operation for the actions that operate on many
+        VMs: connects and builds the guest credentials once, the VM is set on
+        the copy of the action that run_on_guests makes for each VM.
+        """
+        self.establish_connection(vsphere)
+        self._creds = self._auth_username_password(username=username,
+                                                   password=password)
+        self._vm = None
+
+    def get_guest_vms(self, vm_ids=None, folder_id=None, cluster_id=None):
+        """
+        Resolves the VMs for a multi-guest operation with a single property
+        retrieval.
+
+        Args:
+        - vm_ids: MOIDs of the VMs
+        - folder_id: MOID of a folder to use every VM beneath instead
+        - cluster_id: MOID of a cluster to use every VM of instead
+
+        Returns:
+        - list: (VirtualMachine, name) tuples
+        """
+        if len([x for x in (vm_ids, folder_id, cluster_id) if x]) != 1:
+            raise ValueError("Exactly one of vm_ids, folder_id and cluster_id must be given")
+
+        if vm_ids:
+            vms = inventory.find_managed_entities(self.si_content, vim.VirtualMachine,
+                                                  moids=vm_ids)
+        else:
+            if folder_id:
+                container = vim.Folder(folder_id, stub=self.si._stub)
+            else:
+                container = vim.ComputeResource(cluster_id, stub=self.si._stub)
+            vms = inventory.iter_entity_properties(self.si_content, vim.VirtualMachine,
+                                                   container=container)
+        return [(vm, props.get('name')) for vm, props in vms]
+
+    def run_on_guests(self, vms, func, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Calls func(action) for many VMs concurrently, at most max_workers at
+        a time. Each call gets its own copy of this action with the VM set,
+        sharing the vSphere session and the guest credentials. A failure on
+        one VM does not stop the others.
+
+        Args:
+        - vms: (VirtualMachine, name) tuples as returned by get_guest_vms
+        - func: function to call, its return value is the result for the VM
+
+        Returns:
+        - list: one dict per VM, in the order of vms, with its vm_id, vm_name,
+                status (succeeded or failed), seconds and the result or error
+        """
+        return list(self.iter_on_guests(vms, func, max_workers))
+
+    def iter_on_guests(self, vms, func, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Same as run_on_guests, but yields the outcome of each VM as soon as
+        it and the VMs before it are done.
+        """
+        def run_one(vm_name):
+            vm, name = vm_name
+            action = copy.copy(self)
+            action._vm = vm
+            outcome = {'vm_id': vm._moId, 'vm_name': name}
+            started = time.time()
+            try:
+                outcome['result'] = func(action)
+                outcome['status'] = 'succeeded'
+            except Exception as e:
+                outcome['error'] = str(e)
+                outcome['status'] = 'failed'
+            outcome['seconds'] = round(time.time() - started, 3)
+            return outcome
+
+        get_http_session(max_workers)
+        return map_concurrently(run_one, vms, max_workers)
+
     @property
     def guest_credentials(self):
         return self._creds
@@ -65,6 +229,332 @@ class GuestAction(BaseAction):
     def vm(self):
         return self._vm
 
+    def upload_file(self, local_path, guest_path, overwrite=True,
+                    chunk_size=DEFAULT_CHUNK_SIZE, file_attribute=None):
+        """
+        Streams a local file into the guest through a pooled HTTP connection,
+        reading at most chunk_size bytes of it into memory at a time.
+
+        Args:
+        - local_path: path of the local file to upload
+        - guest_path: full path of the file in the guest
+        - overwrite: replace the file in the guest if it already exists
+        - file_attribute: FileAttributes to set on the file in the guest,
+                          for example its modification time
+
+        Returns:
+        - dict: the guest path, the size, duration and throughput of the
+                upload and the SHA-256 of the bytes sent
+        """
+        size = os.path.getsize(local_path)
+        url = self.initiate_upload(guest_path, size, overwrite, file_attribute)
+
+        started = time.time()
+        with open(local_path, 'rb') as local_file:
+            reader = ChunkedReader(local_file, size, chunk_size)
+            response = get_http_session().put(url, data=reader, verify=False)
+        response.raise_for_status()  # raise if status_code is not 200
+
+        result = transfer_stats(reader.bytes_read, started)
+        result.update({'path': guest_path, 'sha256': reader.hexdigest()})
+        return result
+
+    def upload_data(self, data, guest_path, overwrite=True):
+        """
+        Uploads bytes that are already in memory into the guest, so a file
+        sent to many guests is only read from disk once.
+
+        Returns:
+        - dict: the guest path, the size, duration and throughput of the upload
+        """
+        url = self.initiate_upload(guest_path, len(data), overwrite)
+
+        started = time.time()
+        response = get_http_session().put(url, data=data, verify=False)
+        response.raise_for_status()  # raise if status_code is not 200
+
+        result = transfer_stats(len(data), started)
+        result['path'] = guest_path
+        return result
+
+    def initiate_upload(self, guest_path, size, overwrite=True, file_attribute=None):
+        """Returns the URL to PUT a file of the given size into the guest to"""
+        if file_attribute is None:
+            file_attribute = vim.vm.guest.FileManager.FileAttributes()
+        return self.guest_file_manager.InitiateFileTransferToGuest(
+            self.vm, self.guest_credentials, guest_path, file_attribute,
+            size, overwrite)
+
+    def guest_file_sha256(self, guest_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Returns the SHA-256 of a file in the guest, streaming its contents
+        instead of holding them in memory.
+        """
+        transfer = self.guest_file_manager.InitiateFileTransferFromGuest(
+            self.vm, self.guest_credentials, guestFilePath=guest_path)
+        sha256 = hashlib.sha256()
+        for chunk in self.iter_file_range(transfer.url, 0, None, chunk_size):
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def download_file(self, guest_path, local_path, offset=0, length=None,
+                      tail_bytes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Streams a file, or a byte range of it, from the guest to a local file
+        without holding more than chunk_size bytes of it in memory.
+
+        Args:
+        - guest_path: full path of the file in the guest
+        - local_path: path of the local file to write, it is overwritten
+        - offset: first byte of the guest file to download
+        - length: number of bytes to download, until the end of the file if None
+        - tail_bytes: download only the last tail_bytes of the file, overrides
+                      offset and length
+
+        Returns:
+        - dict: the local and guest paths, the size of the guest file, the
+                offset, size, duration, throughput and SHA-256 of the bytes
+                downloaded
+        """
+        transfer = self.guest_file_manager.InitiateFileTransferFromGuest(
+            self.vm, self.guest_credentials, guestFilePath=guest_path)
+        start, end = self.get_byte_range(transfer.size, offset, length, tail_bytes)
+
+        started = time.time()
+        sha256 = hashlib.sha256()
+        size = 0
+        with open(local_path, 'wb') as local_file:
+            for chunk in self.iter_transfer_range(transfer, start, end, chunk_size):
+                local_file.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+
+        result = transfer_stats(size, started)
+        result.update({'path': local_path,
+                       'guest_path': guest_path,
+                       'file_size': transfer.size,
+                       'offset': start,
+                       'sha256': sha256.hexdigest()})
+        return result
+
+    def get_byte_range(self, file_size, offset=0, length=None, tail_bytes=None):
+        """Returns the (start, end) bytes to transfer of a file, end excluded"""
+        if tail_bytes is not None:
+            return max(file_size - tail_bytes, 0), file_size
+
+        start = min(offset or 0, file_size)
+        if length is None:
+            return start, file_size
+        return start, min(start + length, file_size)
+
+    def iter_transfer_range(self, transfer, start, end, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yields the bytes from start to end (excluded) of a FileTransferInformation
+        returned by InitiateFileTransferFromGuest, without a Range header when
+        reading up to the end of the file.
+        """
+        if end <= start:
+            return iter(())
+        if end >= transfer.size:
+            end = None
+        return self.iter_file_range(transfer.url, start, end, chunk_size)
+
+    def iter_file_range(self, url, start, end, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yields the bytes from start to end (excluded, None for the end of the
+        file) of a guest file transfer URL in chunks. The range is requested
+        from the host with a Range header, when the host sends the whole file
+        anyway the bytes outside of the range are skipped while streaming.
+        """
+        if end is not None and end <= start:
+            return
+
+        headers = {}
+        if start or end is not None:
+            headers['Range'] = 'bytes=%s-%s' % (start, '' if end is None else end - 1)
+
+        response = get_http_session().get(url, verify=False, stream=True, headers=headers)
+        try:
+            response.raise_for_status()  # raise if status_code not 200
+            # 206 is Partial Content, the host honoured the Range header
+            position = start if response.status_code == 206 else 0
+            for chunk in response.iter_content(chunk_size):
+                if position < start:
+                    skip = min(start - position, len(chunk))
+                    chunk = chunk[skip:]
+                    position += skip
+                if end is not None and position + len(chunk) > end:
+                    chunk = chunk[:end - position]
+                if chunk:
+                    position += len(chunk)
+                    yield chunk
+                if end is not None and position >= end:
+                    break
+        finally:
+            response.close()
+
+    def list_guest_tree(self, guest_directory):
+        """
+        Lists every file and directory beneath a directory in the guest.
+
+        Returns:
+        - dict: path relative to guest_directory, always separated by '/',
+                -> the vim.vm.guest.FileManager.FileInfo of the file or
+                directory. Symbolic links to directories are not followed.
+        """
+        tree = {}
+        pending = ['']
+        while pending:
+            relpath = pending.pop()
+            for info in self.iter_guest_directory(self.guest_joinpath(guest_directory, relpath)):
+                if info.path in ('.', '..'):
+                    continue
+                child = relpath + '/' + info.path if relpath else info.path
+                tree[child] = info
+                if info.type == 'directory':
+                    pending.append(child)
+        return tree
+
+    def iter_guest_directory(self, guest_path):
+        """Yields the FileInfo of each entry of a directory in the guest, one page at a time"""
+        index = 0
+        while True:
+            listing = self.guest_file_manager.ListFilesInGuest(
+                self.vm, self.guest_credentials, guest_path, index=index)
+            files = listing.files or []
+            for info in files:
+                yield info
+            index += len(files)
+            if not files or not listing.remaining:
+                break
+
+    def guest_joinpath(self, path, relpath):
+        """
+        Appends a '/' separated relative path to a path in the guest, using
+        the separator of the guest's path.
+        """
+        if not relpath:
+            return path
+        return self.joinpath(path, relpath.replace('/', self.guest_sep(path)))
+
+    def guest_sep(self, path):
+        """Returns the path separator of the guest a path comes from, see joinpath"""
+        return "\\" if ":\\" in path else os.sep
+
+    def run_program(self, command, arguments=None, workdir=None, envvar=None,
+                    timeout=None, max_output_bytes=None, script=None,
+                    script_arguments=None):
+        """
+        Runs a program in the guest and captures its exit code and output.
+        stdout and stderr are redirected to files in a temporary directory of
+        the guest, which are streamed back once the program exits and then
+        deleted with the directory.
+
+        Args:
+        - command: full path to the program in the guest
+        - arguments: arguments of the program, they are interpreted by the
+                     program (for example a shell or PowerShell), which must
+                     also handle the 1> and 2> redirections
+        - workdir: working directory of the program, defaults to the
+                   temporary directory
+        - envvar: environment variables of the program, as VARIABLE=VALUE
+        - timeout: seconds to wait for the program before terminating it
+        - max_output_bytes: only keep the last max_output_bytes of stdout and stderr
+        - script: (file name, bytes) of a script to upload into the temporary
+                  directory, its path in the guest is passed to the program
+                  after arguments
+        - script_arguments: arguments passed to the program after the script
+
+        Returns:
+        - dict: the pid, exit_code, stdout and stderr of the program and the
+                seconds it took
+        """
+        started = time.time()
+        tempdir = self.guest_file_manager.CreateTemporaryDirectoryInGuest(
+            self.vm, self.guest_credentials, "stackstorm_", "_runner")
+        try:
+            if script:
+                script_name, script_data = script
+                script_path = self.joinpath(tempdir, script_name)
+                self.upload_data(script_data, script_path)
+                arguments = ' '.join(a for a in (arguments, '"%s"' % script_path,
+                                                 script_arguments) if a)
+
+            stdout_path = self.joinpath(tempdir, 'stdout')
+            stderr_path = self.joinpath(tempdir, 'stderr')
+            cmdspec = vim.vm.guest.ProcessManager.ProgramSpec(
+                arguments='%s 1> "%s" 2> "%s"' % (arguments or '', stdout_path, stderr_path),
+                envVariables=envvar,
+                programPath=command,
+                workingDirectory=workdir or tempdir)
+            pid = self.guest_process_manager.StartProgramInGuest(
+                self.vm, self.guest_credentials, cmdspec)
+            process = self.wait_for_program(pid, timeout)
+
+            return {'pid': pid,
+                    'exit_code': process.exitCode,
+                    'stdout': self.read_guest_output(stdout_path, max_output_bytes),
+                    'stderr': self.read_guest_output(stderr_path, max_output_bytes),
+                    'seconds': round(time.time() - started, 3)}
+        finally:
+            self.guest_file_manager.DeleteDirectoryInGuest(
+                self.vm, self.guest_credentials, tempdir, True)
+
+    def wait_for_program(self, pid, timeout=None):
+        """
+        Waits for a program in the guest to exit, polling every POLL_INTERVAL
+        seconds at first and backing off up to MAX_POLL_INTERVAL. The program
+        is terminated when it runs longer than timeout seconds.
+
+        Returns:
+        - vim.vm.guest.ProcessManager.ProcessInfo: the exited process
+        """
+        started = time.time()
+        delay = POLL_INTERVAL
+        while True:
+            processes = self.guest_process_manager.ListProcessesInGuest(
+                vm=self.vm, auth=self.guest_credentials, pids=[pid])
+            if not processes:
+                raise Exception("No such process: " + str(pid))
+            if processes[0].endTime is not None:
+                return processes[0]
+
+            if timeout is not None:
+                remaining = timeout - (time.time() - started)
+                if remaining <= 0:
+                    self.guest_process_manager.TerminateProcessInGuest(
+                        self.vm, self.guest_credentials, pid)
+                    raise Exception("Process %s did not exit within %s seconds" %
+                                    (pid, timeout))
+                delay = min(delay, remaining)
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+    def read_guest_output(self, guest_path, max_bytes=None):
+        """
+        Returns the text of a file in the guest, streamed in chunks over the
+        pooled HTTP session, or only its last max_bytes.
+        """
+        transfer = self.guest_file_manager.InitiateFileTransferFromGuest(
+            self.vm, self.guest_credentials, guestFilePath=guest_path)
+        start, end = self.get_byte_range(transfer.size, tail_bytes=max_bytes)
+        data = b''.join(self.iter_transfer_range(transfer, start, end))
+        return data.decode('utf-8', 'replace')
+
+    def resolve_local_path(self, local_path):
+        """
+        Returns the full path of a local file, resolving paths prefixed with
+        pack: relative to the packs directory this pack is installed in.
+        """
+        if local_path.startswith("pack:"):
+            packsdir =\
+                os.path.dirname(
+                    os.path.dirname(
+                        os.path.dirname(
+                            os.path.dirname(os.path.abspath(__file__)))))
+            return os.path.join(packsdir, local_path[5:])
+        return local_path
+
     def joinpath(self, path, nxt):
         """
         os.path.join makes assumptions based on the OS of the
@@ -80,7 +570,7 @@ class GuestAction(BaseAction):
         Returns:
         - A full path
         """
-        sep = "\\" if ":\\" in path else os.sep
+        sep = self.guest_sep(path)
         return path.rstrip(sep) + sep + nxt.strip(sep)
 
     def _auth_username_password(self, username=None, password=None):
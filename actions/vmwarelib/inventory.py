@@ -13,7 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from pyVmomi import vim  # pylint: disable-msg=E0611
+from pyVmomi import vim, vmodl  # pylint: disable-msg=E0611
+
+# Number of objects requested per RetrievePropertiesEx page
+DEFAULT_PAGE_SIZE = 1000
 
 
 def get_managed_entity(content, vimtype, moid=None, name=None):
@@ -59,6 +62,197 @@ def get_managed_entities(content, vimtype):
     return container
 
 
+def traversal_spec(name, vimtype, path, select=None):
+    """
+    Builds a TraversalSpec following the property ``path`` of ``vimtype``
+    objects, optionally continuing with the named TraversalSpecs in ``select``.
+    """
+    select_set = [vmodl.query.PropertyCollector.SelectionSpec(name=n) for n in select or []]
+    return vmodl.query.PropertyCollector.TraversalSpec(
+        name=name, path=path, skip=False, type=vimtype, selectSet=select_set)
+
+
+def object_spec(obj, select_set=None, skip=True):
+    return vmodl.query.PropertyCollector.ObjectSpec(
+        obj=obj, skip=skip, selectSet=select_set or [])
+
+
+def container_view_spec(view):
+    return object_spec(view, [traversal_spec('traverseEntities', vim.view.ContainerView,
+                                             'view')])
+
+
+def retrieve_properties(content, object_specs, vimtype, path_set,
+                        page_size=DEFAULT_PAGE_SIZE):
+    """
+    Retrieves the given property paths for every object of a type reachable
+    from the object specs with a single paged PropertyCollector query
+    (RetrievePropertiesEx), instead of reading each property of each object
+    with a separate SOAP call.
+
+    Args:
+    - content: vSphere ServiceContent
+    - object_specs: ObjectSpecs to start the traversal from
+    - vimtype: the vim type of the objects to retrieve (ex: vim.HostSystem)
+    - path_set: property paths to retrieve for each object
+    - page_size: maximum number of objects returned per page
+
+    Returns:
+    - list: (object, dict of property path -> value) tuples
+    """
+    return list(iter_properties(content, object_specs, vimtype, path_set,
+                                page_size=page_size))
+
+
+def iter_properties(content, object_specs, vimtype, path_set,
+                    page_size=DEFAULT_PAGE_SIZE):
+    """
+    Same as retrieve_properties, but yields the objects one page at a time so
+    large inventories can be processed without holding every page in memory.
+    """
+    return _iter_retrieve(content, object_specs, [(vimtype, path_set)], page_size)
+
+
+def retrieve_type_properties(content, object_specs, type_path_sets,
+                             page_size=DEFAULT_PAGE_SIZE):
+    """
+    Retrieves the properties of objects of several types reachable from the
+    object specs with a single paged PropertyCollector query, for example
+    the hosts and datastores of a cluster.
+
+    Args:
+    - content: vSphere ServiceContent
+    - object_specs: ObjectSpecs to start the traversal from
+    - type_path_sets: list of (vim type, property paths) tuples
+    - page_size: maximum number of objects returned per page
+
+    Returns:
+    - list: (object, dict of property path -> value) tuples of every type
+    """
+    return list(_iter_retrieve(content, object_specs, type_path_sets, page_size))
+
+
+def _iter_retrieve(content, object_specs, type_path_sets, page_size):
+    prop_specs = [vmodl.query.PropertyCollector.PropertySpec(
+        type=vimtype, pathSet=list(path_set), all=False)
+        for vimtype, path_set in type_path_sets]
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=object_specs, propSet=prop_specs,
+        reportMissingObjectsInResults=False)
+    options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+
+    collector = content.propertyCollector
+    result = collector.RetrievePropertiesEx([filter_spec], options)
+    while result:
+        for obj_content in result.objects:
+            properties = dict((prop.name, prop.val) for prop in obj_content.propSet)
+            yield obj_content.obj, properties
+        if not result.token:
+            break
+        result = collector.ContinueRetrievePropertiesEx(result.token)
+
+
+def get_entity_properties(content, vimtype, path_set=None, container=None,
+                          page_size=DEFAULT_PAGE_SIZE, recursive=True):
+    """
+    Retrieves the given property paths for every entity of a type with a
+    single paged PropertyCollector query.
+
+    Args:
+    - content: vSphere ServiceContent
+    - vimtype: the vim type of the entities to retrieve (ex: vim.HostSystem)
+    - path_set: property paths to retrieve for each entity, defaults to ['name']
+    - container: managed entity to search beneath, defaults to the rootFolder
+    - page_size: maximum number of objects returned per page
+    - recursive: also search the children of the container's children
+
+    Returns:
+    - list: (entity, dict of property path -> value) tuples
+    """
+    return list(iter_entity_properties(content, vimtype, path_set=path_set,
+                                       container=container, page_size=page_size,
+                                       recursive=recursive))
+
+
+def iter_entity_properties(content, vimtype, path_set=None, container=None,
+                           page_size=DEFAULT_PAGE_SIZE, recursive=True):
+    """
+    Same as get_entity_properties, but yields the entities one page at a time.
+    The ContainerView is destroyed once the generator is exhausted or closed.
+    """
+    if path_set is None:
+        path_set = ['name']
+
+    view = content.viewManager.CreateContainerView(
+        container or content.rootFolder, [vimtype], recursive)
+    try:
+        for entity, properties in iter_properties(content, [container_view_spec(view)],
+                                                  vimtype, path_set, page_size=page_size):
+            yield entity, properties
+    finally:
+        view.Destroy()
+
+
+def find_managed_entities(content, vimtype, moids=None, names=None, path_set=None,
+                          container=None, unique_names=False):
+    """
+    Resolves many MOIDs and names at once from a single property retrieval.
+
+    Args:
+    - content: vSphere ServiceContent
+    - vimtype: the vim type of the entities to find (ex: vim.VirtualMachine)
+    - moids: list of MOIDs to find
+    - names: list of names to find
+    - path_set: additional property paths to retrieve, 'name' is always included
+    - container: managed entity to search beneath, defaults to the rootFolder
+    - unique_names: raise when several entities have a requested name instead
+                    of using the first one, like get_managed_entity does
+
+    Returns:
+    - list: (entity, dict of property path -> value) tuples in the order
+            requested, each entity only listed once
+    """
+    moids = moids or []
+    names = names or []
+    if not moids and not names:
+        return []
+
+    path_set = sorted(set(path_set or []) | set(['name']))
+    entities = get_entity_properties(content, vimtype, path_set=path_set,
+                                     container=container)
+
+    by_moid = {}
+    by_name = {}
+    for entity, properties in entities:
+        by_moid[entity._moId] = (entity, properties)
+        by_name.setdefault(properties.get('name'), []).append((entity, properties))
+
+    results = []
+    found = set()
+    for moid in moids:
+        if moid not in by_moid:
+            raise Exception("Inventory Error: Unable to Find Object (%s): %s"
+                            % (vimtype, moid))
+        if moid not in found:
+            found.add(moid)
+            results.append(by_moid[moid])
+
+    for name in names:
+        matches = by_name.get(name, [])
+        if not matches:
+            raise Exception("Inventory Error: Unable to Find Object (%s): %s"
+                            % (vimtype, name))
+        if unique_names and len(matches) > 1:
+            raise Exception("Multiple Managed Objects found, "
+                            "Check Names or IDs provided are unique")
+        entity, properties = matches[0]
+        if entity._moId not in found:
+            found.add(entity._moId)
+            results.append(matches[0])
+
+    return results
+
+
 def get_datacenter(content, moid=None, name=None):
     return get_managed_entity(content, vim.Datacenter, moid=moid, name=name)
 
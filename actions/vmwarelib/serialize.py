@@ -1,6 +1,7 @@
 import json
 
 from pyVmomi import vim, vmodl  # pylint: disable-msg=E0611
+from pyVmomi.VmomiSupport import DataObject, ManagedObject
 
 # List of classes which are not JSON serializable
 NON_JSON_SERILIZABLE_TYPES = [
@@ -120,109 +121,139 @@ NETWORK_GET_NON_JSON_SERILIZABLE_TYPES = [
 ]
 
 
-class MyJSONEncoder(json.JSONEncoder):
-    def default(self, obj):  # pylint: disable=E0202
-        try:
-            return super(MyJSONEncoder, self).default(obj)
-        except TypeError:
-            if type(obj) in NON_JSON_SERILIZABLE_TYPES:
-                return obj.__dict__
-
-            # For anything else just return the class name
-            return "__{}__".format(obj.__class__.__name__)
-
-
-class HostGetJSONEncoder(json.JSONEncoder):
-    def default(self, obj):  # pylint: disable=E0202
-        try:
-            return super(HostGetJSONEncoder, self).default(obj)
-        except TypeError:
-            if type(obj) in HOST_GET_NON_JSON_SERILIZABLE_TYPES:
-                return obj.__dict__
-
-            # For anything else just return the class name
-            return "__{}__".format(obj.__class__.__name__)
-
-
-class DatastoreGetJSONEncoder(json.JSONEncoder):
-    def default(self, obj):  # pylint: disable=E0202
-        try:
-            return super(DatastoreGetJSONEncoder, self).default(obj)
-        except TypeError:
-            if type(obj) in DATASTORE_GET_NON_JSON_SERILIZABLE_TYPES:
-                return obj.__dict__
-
-            # For anything else just return the class name
-            return "__{}__".format(obj.__class__.__name__)
-
-
-class DatacenterGetJSONEncoder(json.JSONEncoder):
-    def default(self, obj):  # pylint: disable=E0202
-        try:
-            return super(DatacenterGetJSONEncoder, self).default(obj)
-        except TypeError:
-            if type(obj) in DATACENTER_GET_NON_JSON_SERILIZABLE_TYPES:
-                return obj.__dict__
-
-            # For anything else just return the class name
-            return "__{}__".format(obj.__class__.__name__)
-
-
-class ClusterGetJSONEncoder(json.JSONEncoder):
-    def default(self, obj):  # pylint: disable=E0202
-        try:
-            return super(ClusterGetJSONEncoder, self).default(obj)
-        except TypeError:
-            if type(obj) in CLUSTER_GET_NON_JSON_SERILIZABLE_TYPES:
-                return obj.__dict__
-
-            # For anything else just return the class name
-            return "__{}__".format(obj.__class__.__name__)
-
-
-class TemplateGetJSONEncoder(json.JSONEncoder):
-    def default(self, obj):  # pylint: disable=E0202
-        try:
-            return super(TemplateGetJSONEncoder, self).default(obj)
-        except TypeError:
-            if type(obj) in TEMPLATE_GET_NON_JSON_SERILIZABLE_TYPES:
-                return obj.__dict__
-
-            # For anything else just return the class name
-            return "__{}__".format(obj.__class__.__name__)
-
-
-class NetworkGetJSONEncoder(json.JSONEncoder):
-    def default(self, obj):  # pylint: disable=E0202
-        try:
-            return super(NetworkGetJSONEncoder, self).default(obj)
-        except TypeError:
-            if type(obj) in NETWORK_GET_NON_JSON_SERILIZABLE_TYPES:
-                return obj.__dict__
-
-            # For anything else just return the class name
-            return "__{}__".format(obj.__class__.__name__)
-
-
-class PhysicalNicJSONEncoder(json.JSONEncoder):
-    def default(self, obj):  # pylint: disable=E0202
-        try:
-            return super(PhysicalNicJSONEncoder, self).default(obj)
-        except TypeError:
-            if type(obj) in PHYSICAL_NIC_NON_JSON_SERILIZABLE_TYPES:
-                return obj.__dict__
-
-            # For anything else just return the class name
-            return "__{}__".format(obj.__class__.__name__)
-
-
-class VmRuntimeInfoJSONEncoder(json.JSONEncoder):
-    def default(self, obj):  # pylint: disable=E0202
-        try:
-            return super(VmRuntimeInfoJSONEncoder, self).default(obj)
-        except TypeError:
-            if type(obj) in VM_RUNTIME_INFO_NON_JSON_SERILIZABLE_TYPES:
-                return obj.__dict__
-
-            # For anything else just return the class name
-            return "__{}__".format(obj.__class__.__name__)
+# Compiled list of field names for each pyVmomi type, built from the type
+# metadata the first time an object of that type is serialized
+_FIELD_PLANS = {}
+
+
+def _path_tree(paths):
+    """
+    Converts dotted property paths into a nested dict, where None marks the end
+    of a path: ['a.b', 'c'] -> {'a': {'b': None}, 'c': None}
+    """
+    if not paths:
+        return None
+
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.split('.')
+        for part in parts[:-1]:
+            child = node.get(part, {})
+            if child is None:
+                # a shorter path already covers everything below this one
+                break
+            node = node.setdefault(part, child)
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def _field_plan(obj):
+    obj_type = type(obj)
+    plan = _FIELD_PLANS.get(obj_type)
+    if plan is None:
+        if issubclass(obj_type, DataObject):
+            plan = tuple(prop.name for prop in obj_type._GetPropertyList())
+        elif issubclass(obj_type, ManagedObject):
+            plan = tuple(vars(obj))
+        else:
+            # plain python objects can have different attributes per instance
+            return tuple(vars(obj))
+        _FIELD_PLANS[obj_type] = plan
+    return plan
+
+
+class Serializer(object):
+    """
+    Converts pyVmomi objects into plain python dicts and lists that can be
+    returned from an action, without a json.dumps/json.loads round trip.
+
+    Objects whose type is in ``types`` are expanded into a dict of their
+    properties, in the order defined by the pyVmomi type metadata. Any other
+    object that is not a python primitive is returned as "__ClassName__".
+
+    Args:
+    - types: pyVmomi types to expand
+    - max_depth: number of nested objects to expand below the top level one,
+                 deeper objects are returned as "__ClassName__"
+    - include: dotted property paths to return, all other properties are left out
+    - exclude: dotted property paths to leave out
+    """
+    def __init__(self, types=None, max_depth=None, include=None, exclude=None):
+        self.types = frozenset(types or [])
+        self.max_depth = max_depth
+        self.include = _path_tree(include)
+        self.exclude = _path_tree(exclude)
+
+    def serialize(self, obj):
+        return self._serialize(obj, 0, self.include, self.exclude)
+
+    def _serialize(self, obj, depth, include, exclude):
+        obj_type = type(obj)
+        if obj is None or obj_type in (str, int, float, bool):
+            return obj
+
+        if isinstance(obj, (list, tuple)):
+            return [self._serialize(item, depth, include, exclude) for item in obj]
+
+        if isinstance(obj, dict):
+            return dict((self._key(key), self._serialize(value, depth, include, exclude))
+                        for key, value in obj.items())
+
+        # subclasses of the primitives, ex: pyVmomi enums and longs
+        if isinstance(obj, str):
+            return str(obj)
+        if isinstance(obj, int):
+            return int(obj)
+        if isinstance(obj, float):
+            return float(obj)
+
+        if obj_type in self.types and (self.max_depth is None or depth <= self.max_depth):
+            return self._serialize_fields(obj, depth, include, exclude)
+
+        return "__{}__".format(obj.__class__.__name__)
+
+    def _serialize_fields(self, obj, depth, include, exclude):
+        result = {}
+        for name in _field_plan(obj):
+            child_include = None
+            if include is not None:
+                if name not in include:
+                    continue
+                child_include = include[name]
+
+            child_exclude = None
+            if exclude is not None and name in exclude:
+                child_exclude = exclude[name]
+                if child_exclude is None:
+                    continue
+
+            result[name] = self._serialize(getattr(obj, name, None), depth + 1,
+                                           child_include, child_exclude)
+        return result
+
+    def _key(self, key):
+        # same conversion json.dumps does for non string keys
+        if isinstance(key, str):
+            return str(key)
+        return json.dumps(key)
+
+
+def to_dict(obj, types=NON_JSON_SERILIZABLE_TYPES, **kwargs):
+    """
+    Serialize a pyVmomi object with a one off Serializer, see Serializer for
+    the supported arguments.
+    """
+    return Serializer(types, **kwargs).serialize(obj)
+
+
+DEFAULT_SERIALIZER = Serializer(NON_JSON_SERILIZABLE_TYPES)
+HOST_GET_SERIALIZER = Serializer(HOST_GET_NON_JSON_SERILIZABLE_TYPES)
+DATASTORE_GET_SERIALIZER = Serializer(DATASTORE_GET_NON_JSON_SERILIZABLE_TYPES)
+DATACENTER_GET_SERIALIZER = Serializer(DATACENTER_GET_NON_JSON_SERILIZABLE_TYPES)
+CLUSTER_GET_SERIALIZER = Serializer(CLUSTER_GET_NON_JSON_SERILIZABLE_TYPES)
+TEMPLATE_GET_SERIALIZER = Serializer(TEMPLATE_GET_NON_JSON_SERILIZABLE_TYPES)
+NETWORK_GET_SERIALIZER = Serializer(NETWORK_GET_NON_JSON_SERILIZABLE_TYPES)
+PHYSICAL_NIC_SERIALIZER = Serializer(PHYSICAL_NIC_NON_JSON_SERILIZABLE_TYPES)
+VM_RUNTIME_INFO_SERIALIZER = Serializer(VM_RUNTIME_INFO_NON_JSON_SERILIZABLE_TYPES)
@@ -0,0 +1,222 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import functools
+import threading
+import time
+
+from pyVim import connect
+from pyVmomi import vim  # pylint: disable-msg=E0611
+
+# vCenter expires idle sessions after 30 minutes by default, stay well below that
+DEFAULT_IDLE_TIMEOUT = 900
+DEFAULT_KEEPALIVE_INTERVAL = 300
+
+
+class SessionPool(object):
+    """
+    Keeps one logged in vSphere ServiceInstance per ``vsphere`` config name for
+    the life of the process, so repeated connections reuse the existing session
+    instead of paying for a new TLS handshake and SOAP login every time.
+    """
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL):
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self._sessions = {}
+        # guards the dicts only, logins and liveness checks are network round
+        # trips and run under the lock of their name so names do not wait on
+        # each other
+        self._lock = threading.Lock()
+        self._name_locks = {}
+
+    def get(self, name, connection, session_id=None, persistent=False, verify=False):
+        """
+        Args:
+        - name: name of the vsphere connection in the config
+        - connection: dict with the host, port, user and passwd to connect with
+        - session_id: an existing vCenter session id to resume before logging in
+        - persistent: leave the session logged in when the pool is cleared so
+                      it can be resumed by another process
+        - verify: check a pooled session is still logged in before returning it,
+                  even when it was checked within the keepalive interval
+
+        Returns:
+        - ServiceInstance: a logged in service instance
+        """
+        key = self._connection_key(connection)
+        now = time.time()
+        with self._name_lock(name):
+            with self._lock:
+                entry = self._sessions.pop(name, None)
+            if entry:
+                if entry['key'] != key or self._is_idle(entry, now):
+                    self._close(entry)
+                elif self._is_alive(entry, now, verify):
+                    entry['last_used'] = now
+                    entry['persistent'] = persistent
+                    with self._lock:
+                        self._sessions[name] = entry
+                    return entry['si']
+
+            si = None
+            if session_id:
+                si = self._resume(connection, session_id)
+            if si is None:
+                si = self._login(connection)
+
+            with self._lock:
+                self._sessions[name] = {'key': key,
+                                        'si': si,
+                                        'last_used': now,
+                                        'last_checked': now,
+                                        'persistent': persistent}
+            return si
+
+    def keepalive(self):
+        """
+        Touches every pooled session that has not been checked within the
+        keepalive interval so vCenter does not expire it, and drops sessions
+        that are idle or no longer authenticated.
+        """
+        now = time.time()
+        with self._lock:
+            names = list(self._sessions)
+        for name in names:
+            with self._name_lock(name):
+                with self._lock:
+                    entry = self._sessions.get(name)
+                if entry is None:
+                    continue
+                if self._is_idle(entry, now):
+                    self._close(entry)
+                elif self._is_alive(entry, now):
+                    continue
+                with self._lock:
+                    self._sessions.pop(name, None)
+
+    def invalidate(self, name):
+        """
+        Forget the pooled session for the named connection, for example after
+        an operation failed with NotAuthenticated, so the next get() logs in again.
+        """
+        with self._lock:
+            self._sessions.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._sessions.values())
+            self._sessions = {}
+        for entry in entries:
+            self._close(entry)
+
+    def _name_lock(self, name):
+        with self._lock:
+            return self._name_locks.setdefault(name, threading.Lock())
+
+    def _connection_key(self, connection):
+        return (connection['host'], connection['port'], connection['user'])
+
+    def _is_idle(self, entry, now):
+        return now - entry['last_used'] > self.idle_timeout
+
+    def _is_alive(self, entry, now, verify=False):
+        if not verify and now - entry['last_checked'] < self.keepalive_interval:
+            return True
+        if not self._is_authenticated(entry['si']):
+            return False
+        entry['last_checked'] = now
+        return True
+
+    def _is_authenticated(self, si):
+        # reading the current session also resets vCenter's idle timer
+        try:
+            return si.content.sessionManager.currentSession is not None
+        except Exception:
+            return False
+
+    def _login(self, connection):
+        return connect.SmartConnect(host=connection['host'],
+                                    port=connection['port'],
+                                    user=connection['user'],
+                                    pwd=connection['passwd'])
+
+    def _resume(self, connection, session_id):
+        try:
+            si = connect.SmartConnect(host=connection['host'],
+                                      port=connection['port'],
+                                      sessionId=session_id)
+        except Exception:
+            return None
+
+        if not self._is_authenticated(si):
+            si._stub.DropConnections()
+            return None
+        return si
+
+    def _close(self, entry):
+        try:
+            if entry['persistent']:
+                entry['si']._stub.DropConnections()
+            else:
+                connect.Disconnect(entry['si'])
+        except Exception:
+            pass
+
+
+_pool = SessionPool()
+atexit.register(_pool.clear)
+
+
+def get_pool(idle_timeout=None, keepalive_interval=None):
+    """
+    Returns the process wide session pool, optionally updating its timeouts.
+    """
+    if idle_timeout is not None:
+        _pool.idle_timeout = idle_timeout
+    if keepalive_interval is not None:
+        _pool.keepalive_interval = keepalive_interval
+    return _pool
+
+
+def retry_not_authenticated(obj, func, *args, **kwargs):
+    """
+    Calls func, and once more if vCenter answers NotAuthenticated because the
+    pooled session expired between its last check and the call. The session
+    of obj (the name it was last connected with, see ``_session_name``) is
+    dropped from the pool first, so func logs in again when it reconnects.
+    """
+    try:
+        return func(*args, **kwargs)
+    except vim.fault.NotAuthenticated:
+        name = getattr(obj, '_session_name', None)
+        if name is None:
+            raise
+        _pool.invalidate(name)
+        return func(*args, **kwargs)
+
+
+def relogin_on_not_authenticated(method):
+    """Decorator applying retry_not_authenticated to a method of an action or sensor"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return retry_not_authenticated(self, method, self, *args, **kwargs)
+    wrapper._relogin = True
+    return wrapper
+
+
+def get_session_id(si):
+    return getattr(si._stub, 'sessionId', None)
@@ -13,7 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import argparse
+import collections
 import json
+import threading
+import time
 import requests
 
 try:
@@ -61,20 +64,152 @@ ACTIONS = [
     'detach',
 ]
 
+SESSION_ID_HEADER = "vmware-api-session-id"
+
+# vmware-api-session-id tokens shared by every VmwareTagging instance in this
+# process, keyed by (url_base, username). Each python-script action execution is
+# a new process, so this only saves logins within one execution; sessions are
+# carried over between executions through the st2 datastore instead.
+SESSION_ID_CACHE = {}
+
+# Seconds a category/tag name index is trusted before listing the ids again
+DEFAULT_INDEX_TTL = 300
+
+# category and tag name indexes shared by every VmwareTagging instance in this
+# process, keyed by (url_base, 'categories' or 'tags'). Like SESSION_ID_CACHE they
+# start empty in every action execution, they save requests for the repeated
+# lookups of one execution (bulk actions, several vSphere connections) and for
+# long lived processes such as the sensor container.
+NAME_INDEX_CACHE = {}
+NAME_INDEX_LOCK = threading.Lock()
+
+# Maximum number of objects sent in a single batch tag-association request
+DEFAULT_BATCH_SIZE = 500
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class NameIndex(object):
+    """
+    In-memory name -> object index of the tag categories or tags of one
+    vCenter. For each scope (ex: a category id for tags) the object ids are
+    listed once, then objects are fetched one at a time only until the
+    requested name is found, so a single lookup stops as early as a plain scan
+    would and later lookups are served from memory until the index expires or
+    is invalidated.
+    """
+    def __init__(self, ttl=DEFAULT_INDEX_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._scopes = {}
+        self._lock = threading.RLock()
+
+    def find(self, scope, name, list_ids, get_object):
+        """
+        Args:
+        - scope: key of the set of objects searched, ex: a category id
+        - name: name of the object to find
+        - list_ids: function returning the ids of the objects in the scope
+        - get_object: function returning the object with the given id
+
+        Returns:
+        - dict: the first object with the name, None if there is none
+        """
+        with self._lock:
+            state = self._scopes.get(scope)
+            fresh = state is None or time.time() - state["loaded_at"] > self.ttl
+            if fresh:
+                state = {"loaded_at": time.time(),
+                         "objects": {},
+                         "known_ids": set(),
+                         "pending": collections.deque()}
+                self._scopes[scope] = state
+                self._add_ids(state, list_ids())
+
+            obj = state["objects"].get(name)
+            if obj is not None:
+                self.hits += 1
+                return obj
+
+            self.misses += 1
+            obj = self._fetch_until(state, name, get_object)
+            if obj is None and not fresh:
+                # the name may have been created since the ids were listed
+                self._add_ids(state, list_ids())
+                obj = self._fetch_until(state, name, get_object)
+            return obj
+
+    def invalidate(self, scope=None):
+        with self._lock:
+            if scope is None:
+                self._scopes = {}
+            else:
+                self._scopes.pop(scope, None)
+
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": sum(len(state["objects"]) for state in self._scopes.values())}
+
+    def _add_ids(self, state, ids):
+        for obj_id in ids:
+            if obj_id not in state["known_ids"]:
+                state["known_ids"].add(obj_id)
+                state["pending"].append(obj_id)
+
+    def _fetch_until(self, state, name, get_object):
+        while state["pending"]:
+            obj = get_object(state["pending"].popleft())
+            # keep the first object found when names are duplicated across categories
+            state["objects"].setdefault(obj["name"], obj)
+            if obj["name"] == name:
+                return state["objects"][name]
+        return None
+
+
+def get_name_index(url_base, kind, ttl=DEFAULT_INDEX_TTL):
+    """
+    Returns the process wide name index of the given kind ('categories' or
+    'tags') for a vCenter, shared by every VmwareTagging instance like the
+    session ids in SESSION_ID_CACHE.
+    """
+    with NAME_INDEX_LOCK:
+        key = (url_base, kind)
+        if key not in NAME_INDEX_CACHE:
+            NAME_INDEX_CACHE[key] = NameIndex(ttl)
+        index = NAME_INDEX_CACHE[key]
+        index.ttl = ttl
+        return index
+
 
 class VmwareTagging(object):
     # vSphere Automation API (6.5)
     # API Reference: https://code.vmware.com/web/dp/explorer-apis?id=191
     def __init__(self, server, username, password,
-                 scheme="https", port=None, ssl_verify=True, logger=None):
+                 scheme="https", port=None, ssl_verify=True, logger=None,
+                 on_login=None, index_ttl=DEFAULT_INDEX_TTL,
+                 batch_size=DEFAULT_BATCH_SIZE):
         self.session = requests.Session()
         self.session.verify = ssl_verify
         self.session.auth = (username, password)
         self.server = server
+        self.username = username
+        # called with the new session id every time we log in
+        self.on_login = on_login
+        self.batch_size = batch_size
+        # tags and categories fetched by ID, memoized for the life of this object
+        self.tag_cache = {}
+        self.category_cache = {}
         if port:
             self.url_base = "{}://{}:{}".format(scheme, server, port)
         else:
             self.url_base = "{}://{}".format(scheme, server)
+        self.category_index = get_name_index(self.url_base, "categories", index_ttl)
+        self.tag_index = get_name_index(self.url_base, "tags", index_ttl)
 
         if logger:
             # use provided logger
@@ -98,15 +233,25 @@ class VmwareTagging(object):
     def make_url(self, endpoint):
         return self.url_base + endpoint
 
+    def send(self, send_func, url, **kwargs):
+        response = send_func(url, **kwargs)
+        if response.status_code == 401 and SESSION_ID_HEADER in self.session.headers:
+            # the reused session has expired, log in again and retry once
+            self.logger.debug("Session for {} is no longer valid, logging in again"
+                              .format(self.url_base))
+            self.login()
+            response = send_func(url, **kwargs)
+        return response
+
     def get(self, endpoint, params=None):
         url = self.make_url(endpoint)
-        response = self.session.get(url, params=params)
+        response = self.send(self.session.get, url, params=params)
         response.raise_for_status()
         return response.json()
 
     def post(self, endpoint, payload=None, params=None):
         url = self.make_url(endpoint)
-        response = self.session.post(url, params=params, json=payload)
+        response = self.send(self.session.post, url, params=params, json=payload)
         response.raise_for_status()
         if response.text:
             return response.json()
@@ -114,7 +259,7 @@ class VmwareTagging(object):
 
     def delete(self, endpoint, payload=None, params=None):
         url = self.make_url(endpoint)
-        response = self.session.delete(url, params=params, json=payload)
+        response = self.send(self.session.delete, url, params=params, json=payload)
         response.raise_for_status()
         if response.text:
             return response.json()
@@ -130,9 +275,32 @@ class VmwareTagging(object):
         # however, we'll return the cookie value so that it may be returned
         # to the user
         result = json.loads(response.content)
-        self.session.headers.update({"vmware-api-session-id": result["value"]})
+        self.set_session_id(result["value"])
+        if self.on_login:
+            self.on_login(result["value"])
         return dict(response.cookies)
 
+    @property
+    def session_cache_key(self):
+        return (self.url_base, self.username)
+
+    def set_session_id(self, session_id):
+        self.session.headers.update({SESSION_ID_HEADER: session_id})
+        SESSION_ID_CACHE[self.session_cache_key] = session_id
+
+    def resume_session(self, session_id=None):
+        """
+        Reuses the session id cached in this process for this server and user,
+        or the given one (ex: loaded from the st2 datastore), and only logs in
+        when there is none. An expired session is replaced transparently the
+        first time a request is rejected with a 401.
+        """
+        session_id = SESSION_ID_CACHE.get(self.session_cache_key) or session_id
+        if session_id:
+            self.set_session_id(session_id)
+        else:
+            self.login()
+
     ############################################################################
 
     # Category Functions
@@ -147,15 +315,23 @@ class VmwareTagging(object):
 
     def category_delete(self, category_id):
         response = self.delete("/rest/com/vmware/cis/tagging/category/id:{}".format(category_id))
+        # deleting a category also deletes all of its tags
+        self.category_index.invalidate()
+        self.tag_index.invalidate()
+        self.category_cache = {}
+        self.tag_cache = {}
         return response
 
+    def category_get_cached(self, category_id):
+        if category_id not in self.category_cache:
+            self.category_cache[category_id] = self.category_get(category_id)
+        return self.category_cache[category_id]
+
     def category_find_by_name(self, name):
-        category_id_list = self.category_list()
-        for category_id in category_id_list:
-            category = self.category_get(category_id)
-            if category["name"] == name:
-                return category
-        return None
+        return self.category_index.find(None, name, self.category_list, self.category_get)
+
+    def category_get_all(self):
+        return [self.category_get(category_id) for category_id in self.category_list()]
 
     def category_create_spec(self):
         return {"name": "",
@@ -190,6 +366,7 @@ class VmwareTagging(object):
 
         response = self.post("/rest/com/vmware/cis/tagging/category",
                              payload={'create_spec': create_spec})
+        self.category_index.invalidate()
 
         return response['value']
 
@@ -224,16 +401,22 @@ class VmwareTagging(object):
 
     def tag_delete(self, tag_id):
         response = self.delete("/rest/com/vmware/cis/tagging/tag/id:{}".format(tag_id))
+        self.tag_index.invalidate()
+        self.tag_cache.pop(tag_id, None)
         return response
 
+    def tag_get_cached(self, tag_id):
+        if tag_id not in self.tag_cache:
+            self.tag_cache[tag_id] = self.tag_get(tag_id)
+        return self.tag_cache[tag_id]
+
     # If a category ID is not given then this will return the first tag it finds with the given name
     def tag_find_by_name(self, name, category_id=None):
-        tag_id_list = self.tag_list(category_id)
-        for tag_id in tag_id_list:
-            tag = self.tag_get(tag_id)
-            if tag['name'] == name:
-                return tag
-        return None
+        return self.tag_index.find(category_id, name,
+                                   lambda: self.tag_list(category_id), self.tag_get)
+
+    def tag_get_all(self, category_id=None):
+        return [self.tag_get(tag_id) for tag_id in self.tag_list(category_id)]
 
     def tag_create_spec(self):
         return {"name": "",
@@ -249,6 +432,8 @@ class VmwareTagging(object):
 
         response = self.post("/rest/com/vmware/cis/tagging/tag",
                              payload={"create_spec": create_spec})
+        self.tag_index.invalidate(category_id)
+        self.tag_index.invalidate(None)
 
         return response["value"]
 
@@ -261,6 +446,13 @@ class VmwareTagging(object):
             tag = self.tag_get(created_tag_id)
         return tag
 
+    def index_stats(self):
+        """
+        Returns the hit/miss counters and size of the category and tag name indexes
+        """
+        return {"categories": self.category_index.stats(),
+                "tags": self.tag_index.stats()}
+
     ##############################################################################
 
     # creates a category and a tag all in one step
@@ -334,6 +526,85 @@ class VmwareTagging(object):
         # attach the provided tag in this category to the object
         return self.tag_association_attach(tag_id, obj_type, obj_id)
 
+    def object_ids_payload(self, obj_type, obj_ids):
+        return {'object_ids': [{'id': obj_id, 'type': obj_type} for obj_id in obj_ids]}
+
+    def tag_association_batch(self, tag_id, obj_type, obj_ids, batch_action):
+        # batch_action == 'attach-tag-to-multiple-objects' or 'detach-tag-from-multiple-objects'
+        for chunk in chunks(obj_ids, self.batch_size):
+            response = self.post(self.tag_association_endpoint(tag_id),
+                                 params={'~action': batch_action},
+                                 payload=self.object_ids_payload(obj_type, chunk))
+            value = response['value'] if response else None
+            if value and not value.get('success', True):
+                raise ValueError("Failed to {} tag_id={}: {}"
+                                 .format(batch_action, tag_id, value.get('error_messages')))
+
+    def tag_association_attach_objects(self, tag_id, obj_type, obj_ids):
+        self.tag_association_batch(tag_id, obj_type, obj_ids, 'attach-tag-to-multiple-objects')
+
+    def tag_association_detach_objects(self, tag_id, obj_type, obj_ids):
+        self.tag_association_batch(tag_id, obj_type, obj_ids, 'detach-tag-from-multiple-objects')
+
+    def tag_association_list_attached_tags_on_objects(self, obj_type, obj_ids):
+        # returns a dict of object ID -> list of attached tag IDs
+        attached = dict((obj_id, []) for obj_id in obj_ids)
+        for chunk in chunks(obj_ids, self.batch_size):
+            response = self.post(self.tag_association_endpoint(),
+                                 params={'~action': 'list-attached-tags-on-objects'},
+                                 payload=self.object_ids_payload(obj_type, chunk))
+            for object_tags in response['value']:
+                attached[object_tags['object_id']['id']] = object_tags['tag_ids']
+        return attached
+
+    def tag_association_detach_category_objects(self, category_id, obj_type, obj_ids,
+                                                keep_tag_id=None):
+        # detach every tag of the category from all of the objects, except keep_tag_id
+        # returns (object ID -> list of the tags detached from it,
+        #          object ID -> list of the tag IDs that were attached to it)
+        attached = self.tag_association_list_attached_tags_on_objects(obj_type, obj_ids)
+
+        objects_by_tag = {}
+        for obj_id in obj_ids:
+            for tag_id in attached[obj_id]:
+                tag = self.tag_get_cached(tag_id)
+                if tag['category_id'] == category_id and tag_id != keep_tag_id:
+                    objects_by_tag.setdefault(tag_id, []).append(obj_id)
+
+        results = dict((obj_id, []) for obj_id in obj_ids)
+        for tag_id, tag_obj_ids in objects_by_tag.items():
+            self.tag_association_detach_objects(tag_id, obj_type, tag_obj_ids)
+            for obj_id in tag_obj_ids:
+                results[obj_id].append(self.tag_get_cached(tag_id))
+        return results, attached
+
+    def tag_association_action_bulk(self, category, tag, object_type, obj_ids, action):
+        # Same as tag_association_action for many objects at once using the batch
+        # tag association operations, returns a dict of object ID -> response
+        self.logger.debug("tag association bulk action... category_id={} tag_id={}"
+                          " object_type={} objects={} action={}"
+                          .format(category['id'], tag['id'], object_type, len(obj_ids), action))
+        if not obj_ids:
+            return {}
+
+        if action == 'attach':
+            self.tag_association_attach_objects(tag['id'], object_type, obj_ids)
+            return dict((obj_id, None) for obj_id in obj_ids)
+        elif action == 'replace':
+            detached, attached = self.tag_association_detach_category_objects(
+                category['id'], object_type, obj_ids, keep_tag_id=tag['id'])
+            missing = [obj_id for obj_id in obj_ids if tag['id'] not in attached[obj_id]]
+            if missing:
+                self.tag_association_attach_objects(tag['id'], object_type, missing)
+            return dict((obj_id, None) for obj_id in obj_ids)
+        elif action == 'detach':
+            detached, attached = self.tag_association_detach_category_objects(
+                category['id'], object_type, obj_ids)
+            return detached
+        else:
+            raise ValueError("Unknown tag association action={} allowed actions are: {}"
+                             .format(action, ACTIONS))
+
     def tag_association_action(self, category, tag, object_type, obj_id, action):
         # action == 'add' or 'replace', one of ACTIONS
         # tag the VM
@@ -584,18 +855,17 @@ class VmwareTagging(object):
         params = {query_obj_type_filter + '.1': obj_id}
         object_list = self.object_find(bulk_object_type, params=params)
 
-        # add the tags for all of the objects in the list
+        # add the tags for all of the objects in the list with batch requests
+        obj_ids = [self.object_extract_id(obj, bulk_object_type, params) for obj in object_list]
+        responses = self.tag_association_action_bulk(category, tag,
+                                                     bulk_object_type, obj_ids, action)
         results = []
-        for obj in object_list:
-            # extract the ID property from the object
-            obj_id = self.object_extract_id(obj, bulk_object_type, params)
-            response = self.tag_association_action(category, tag,
-                                                   bulk_object_type, obj_id, action)
+        for obj, obj_id in zip(object_list, obj_ids):
             results.append({
                 "id": obj_id,
                 "name": obj['name'],
                 "type": bulk_object_type,
-                "response": response,
+                "response": responses[obj_id],
             })
         return results
 
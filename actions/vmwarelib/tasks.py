@@ -0,0 +1,240 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from pyVmomi import vim, vmodl  # pylint: disable-msg=E0611
+
+# Longest time a single WaitForUpdatesEx call blocks on the server
+DEFAULT_MAX_WAIT = 60
+
+TASK_DONE_STATES = [vim.TaskInfo.State.success, vim.TaskInfo.State.error]
+
+
+class WaitTimeoutError(Exception):
+    pass
+
+
+def wait_for_updates(content, objects, vimtype, path_set, is_done, timeout=None,
+                     max_wait=DEFAULT_MAX_WAIT):
+    """
+    Blocks until is_done() returns True for the properties of every object,
+    using a PropertyCollector filter and WaitForUpdatesEx so vCenter pushes
+    the property changes instead of the objects being polled.
+
+    Args:
+    - content: vSphere ServiceContent
+    - objects: managed objects to watch
+    - vimtype: the vim type of the objects (ex: vim.Task)
+    - path_set: property paths to watch on each object
+    - is_done: function called with the dict of property path -> value of an
+               object, returns True once that object is in the wanted state
+    - timeout: seconds to wait before raising WaitTimeoutError, None waits forever
+    - max_wait: longest time a single WaitForUpdatesEx call blocks on the server
+
+    Returns:
+    - dict: moid -> dict of property path -> value, for each object
+    """
+    properties = dict((obj._moId, {}) for obj in objects)
+    pending = set(properties)
+    if not pending:
+        return properties
+
+    deadline = time.time() + timeout if timeout is not None else None
+
+    # a dedicated collector keeps the filter from affecting anyone else
+    # sharing the session's default PropertyCollector
+    collector = content.propertyCollector.CreatePropertyCollector()
+    try:
+        obj_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=obj) for obj in objects]
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(
+            type=vimtype, pathSet=list(path_set), all=False)
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=obj_specs, propSet=[prop_spec])
+        collector.CreateFilter(filter_spec, True)
+
+        version = ''
+        while pending:
+            wait = max_wait
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise WaitTimeoutError("Timed out after %s seconds waiting for: %s" %
+                                           (timeout, ', '.join(sorted(pending))))
+                wait = min(wait, max(int(remaining), 1))
+
+            options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=wait)
+            update = collector.WaitForUpdatesEx(version, options)
+            if update is None:
+                # nothing changed before maxWaitSeconds expired
+                continue
+
+            version = update.version
+            for filter_update in update.filterSet:
+                for obj_update in filter_update.objectSet:
+                    moid = obj_update.obj._moId
+                    props = properties.setdefault(moid, {})
+                    for change in obj_update.changeSet:
+                        props[change.name] = None if change.op == 'remove' else change.val
+                    if moid in pending and is_done(props):
+                        pending.discard(moid)
+    finally:
+        collector.DestroyPropertyCollector()
+
+    return properties
+
+
+def wait_for_tasks(content, tasks, timeout=None, max_wait=DEFAULT_MAX_WAIT):
+    """
+    Blocks until every task has finished, successfully or not.
+
+    Args:
+    - content: vSphere ServiceContent
+    - tasks: vim.Task objects to wait for
+    - timeout: seconds to wait before raising WaitTimeoutError, None waits forever
+
+    Returns:
+    - dict: task moid -> final vim.TaskInfo.State
+    """
+    properties = wait_for_updates(content, tasks, vim.Task, ['info.state'],
+                                  lambda props: props.get('info.state') in TASK_DONE_STATES,
+                                  timeout=timeout, max_wait=max_wait)
+    return dict((moid, props.get('info.state')) for moid, props in properties.items())
+
+
+def wait_for_property(content, obj, path, is_done, timeout=None, max_wait=DEFAULT_MAX_WAIT):
+    """
+    Blocks until is_done() returns True for the value of a single property
+    of a managed object, and returns that value.
+    """
+    properties = wait_for_updates(content, [obj], type(obj), [path],
+                                  lambda props: is_done(props.get(path)),
+                                  timeout=timeout, max_wait=max_wait)
+    return properties[obj._moId].get(path)
+
+
+class TaskTracker(object):
+    """
+    Tracks any number of in-flight tasks through a single PropertyCollector
+    from one background thread, calling on_complete(task, properties) as each
+    task finishes.
+
+    Each tracked task gets its own PropertyFilter on the tracker's collector,
+    which is destroyed once the task completes, and a single WaitForUpdatesEx
+    loop receives the state changes of all of them.
+    """
+    def __init__(self, content, on_complete, path_set=None, max_wait=DEFAULT_MAX_WAIT,
+                 logger=None):
+        self.content = content
+        self.on_complete = on_complete
+        self.path_set = list(path_set or ['info.state'])
+        if 'info.state' not in self.path_set:
+            self.path_set.append('info.state')
+        self.max_wait = max_wait
+        self.logger = logger
+
+        self._collector = None
+        self._filters = {}
+        self._properties = {}
+        self._lock = threading.RLock()
+        self._thread = None
+        self._stopped = False
+
+    def track(self, task):
+        with self._lock:
+            if self._stopped or task._moId in self._filters:
+                return
+
+            if self._collector is None:
+                self._collector = self.content.propertyCollector.CreatePropertyCollector()
+
+            obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=task)
+            prop_spec = vmodl.query.PropertyCollector.PropertySpec(
+                type=vim.Task, pathSet=self.path_set, all=False)
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[obj_spec], propSet=[prop_spec])
+            self._filters[task._moId] = self._collector.CreateFilter(filter_spec, True)
+            self._properties[task._moId] = {}
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def pending(self):
+        with self._lock:
+            return len(self._filters)
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            collector, self._collector = self._collector, None
+            self._filters = {}
+            self._properties = {}
+
+        if collector is not None:
+            try:
+                collector.CancelWaitForUpdates()
+                collector.DestroyPropertyCollector()
+            except Exception as e:
+                self._log('debug', 'Unable to destroy the task PropertyCollector: %s' % e)
+
+    def _run(self):
+        version = ''
+        while not self._stopped:
+            try:
+                options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=self.max_wait)
+                update = self._collector.WaitForUpdatesEx(version, options)
+            except Exception as e:
+                if self._stopped:
+                    break
+                self._log('error', 'Failed to wait for task updates: %s' % e)
+                # don't spin when the session is gone, the owner re-creates the tracker
+                time.sleep(self.max_wait)
+                continue
+
+            if update is not None:
+                version = update.version
+                self._process_update(update)
+
+    def _process_update(self, update):
+        completed = []
+        with self._lock:
+            for filter_update in update.filterSet:
+                for obj_update in filter_update.objectSet:
+                    moid = obj_update.obj._moId
+                    if moid not in self._properties:
+                        continue
+                    props = self._properties[moid]
+                    for change in obj_update.changeSet:
+                        props[change.name] = None if change.op == 'remove' else change.val
+                    if props.get('info.state') in TASK_DONE_STATES:
+                        self._properties.pop(moid)
+                        completed.append((obj_update.obj, props, self._filters.pop(moid)))
+
+        for task, props, task_filter in completed:
+            try:
+                task_filter.DestroyPropertyFilter()
+            except Exception as e:
+                self._log('debug', 'Unable to destroy the filter of %s: %s' % (task._moId, e))
+            try:
+                self.on_complete(task, props)
+            except Exception as e:
+                self._log('error', 'Failed to handle the completion of %s: %s' % (task._moId, e))
+
+    def _log(self, level, message):
+        if self.logger:
+            getattr(self.logger, level)(message)
@@ -13,8 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import eventlet  # pylint: disable=import-error
-
 from pyVmomi import vim  # pylint: disable-msg=E0611
 
 from vmwarelib import inventory
@@ -23,15 +21,15 @@ from vmwarelib.actions import BaseAction
 
 class WaitTask(BaseAction):
 
-    def run(self, task_id, vsphere=None):
+    def run(self, task_id, timeout=None, vsphere=None):
         self.establish_connection(vsphere)
         # convert ids to stubs
         task = inventory.get_task(self.si_content, moid=task_id)
-        while task.info.state == vim.TaskInfo.State.running:
-            eventlet.sleep(1)
+        self._wait_for_task(task, timeout=timeout)
+        info = task.info
         result, error = None, None
-        if task.info.state == vim.TaskInfo.State.success:
-            result = task.info.result
+        if info.state == vim.TaskInfo.State.success:
+            result = info.result
         else:
-            error = task.info.error
+            error = info.error
         return {'result': result, 'error': error}
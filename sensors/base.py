@@ -1,14 +1,47 @@
+import os
 import ssl
-import atexit
+import sys
+from datetime import datetime
+
+import eventlet
 import requests
 
-from pyVim import connect
 from st2reactor.sensor.base import PollingSensor
 
+# vmwarelib is shipped with the actions, make it importable from the sensor container
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'actions'))
+
+from vmwarelib import session  # noqa: E402
+
+ISOFORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def parse_isoformat(value):
+    """
+    Parse a timestamp written by datetime.isoformat(). datetime.fromisoformat()
+    needs python 3.7 and strptime() only reads offsets without a colon before it.
+    """
+    fmt = ISOFORMAT
+    if '.' in value:
+        fmt += '.%f'
+    if len(value) > 19 and value[-6] in '+-' and value[-3] == ':':
+        value = value[:-3] + value[-2:]
+        fmt += '%z'
+    return datetime.strptime(value, fmt)
+
 
 class VSphereSensor(PollingSensor):
     CONNECTION_ITEMS = ['host', 'port', 'user', 'passwd']
 
+    def __init_subclass__(cls, **kwargs):
+        # a poll that fails because the pooled session expired polls again
+        # with a new session
+        super(VSphereSensor, cls).__init_subclass__(**kwargs)
+        poll = cls.__dict__.get('poll')
+        if poll is not None and not getattr(poll, '_relogin', False):
+            cls.poll = session.relogin_on_not_authenticated(poll)
+
     def __init__(self, sensor_service, config=None, poll_interval=5):
         super(VSphereSensor, self).__init__(sensor_service=sensor_service, config=config,
                                             poll_interval=poll_interval)
@@ -35,9 +68,66 @@ class VSphereSensor(PollingSensor):
             else:
                 ssl._create_default_https_context = _create_unverified_https_context
 
+        # config entries forced on the sensors watching a single vsphere for a fan-out sensor
+        self._config_overrides = {}
+        self._children = []
+
+    def _setup_fan_out(self, prefix):
+        """
+        When the sensor's config has a 'vspheres' list, creates one instance of
+        the sensor per vsphere connection (all of them for '*') and sets them up.
+        The calling sensor then only polls its children from its own process.
+
+        Returns:
+        - bool: True if the sensor fans out to several vsphere connections
+        """
+        vspheres = self._get_config_entry('vspheres', prefix=prefix)
+        if not vspheres:
+            return False
+
+        if '*' in vspheres:
+            vspheres = sorted(self.config['vsphere'].keys())
+
+        self._children = []
+        for vsphere in vspheres:
+            child = self.__class__(sensor_service=self.sensor_service, config=self.config,
+                                   poll_interval=self.get_poll_interval())
+            child._config_overrides = {'vsphere': vsphere, 'vspheres': None}
+            self._children.append(child)
+
+        self._run_children('setup')
+        return True
+
+    def _run_children(self, method):
+        """Calls method on every child sensor, each in its own green thread"""
+        def run_child(child):
+            try:
+                getattr(child, method)()
+            except Exception as e:
+                self.sensor_service.get_logger(__name__).error(
+                    'vsphere %s: %s failed: %s' % (child._config_overrides['vsphere'], method, e))
+
+        pool = eventlet.GreenPool(len(self._children))
+        for child in self._children:
+            pool.spawn_n(run_child, child)
+        pool.waitall()
+
     def establish_connection(self, vsphere):
-        self.si = self._connect(vsphere)
+        """
+        Connects to vSphere through the process wide session pool. Calling this
+        again reuses the pooled session, logging in again only when it expired.
+
+        Returns:
+        - bool: True if a new session was established, in which case any
+                objects created from the previous session must be re-created
+        """
+        si = self._connect(vsphere)
+        if getattr(self, 'si', None) is si:
+            return False
+
+        self.si = si
         self.si_content = self.si.RetrieveContent()
+        return True
 
     def _connect(self, vsphere):
         connection = self.config['vsphere'].get(vsphere)
@@ -48,18 +138,39 @@ class VSphereSensor(PollingSensor):
                 raise KeyError("vsphere.yaml Mising: vsphere:%s:%s"
                                % (vsphere, item))
 
+        pool_config = self.config.get('session_pool') or {}
+        pool = session.get_pool(idle_timeout=pool_config.get('idle_timeout'),
+                                keepalive_interval=pool_config.get('keepalive_interval'))
+        # the sensor container is long lived, keep every pooled session from
+        # expiring and drop the ones that did
+        pool.keepalive()
+        self._session_name = vsphere
         try:
-            si = connect.SmartConnect(host=connection['host'],
-                                      port=connection['port'],
-                                      user=connection['user'],
-                                      pwd=connection['passwd'])
+            si = pool.get(vsphere, connection)
         except Exception as e:
             raise Exception(e)
 
-        atexit.register(connect.Disconnect, si)
         return si
 
+    def _destroy_history_collector(self):
+        """
+        vCenter limits the task and event history collectors of a session,
+        destroy self._collector once it is no longer read.
+        """
+        collector, self._collector = getattr(self, '_collector', None), None
+        if collector is None:
+            return
+        try:
+            collector.DestroyCollector()
+        except Exception as e:
+            # the collector is gone already when its session expired
+            self.sensor_service.get_logger(__name__).debug(
+                'Unable to destroy the history collector: %s' % e)
+
     def _get_config_entry(self, key, prefix=None):
+        if key in self._config_overrides:
+            return self._config_overrides[key]
+
         # First of all, get configuration value from Datastore
         value = self.sensor_service.get_value('vsphere.%s' % (key), local=False)
         if value:
@@ -0,0 +1,177 @@
+import json
+
+from pyVmomi import vim  # pylint: disable-msg=E0611
+from base import VSphereSensor, parse_isoformat
+from datetime import datetime
+
+# entity arguments of a vim.event.Event, the attribute holding the entity in
+# each of them and the payload key they are returned under
+EVENT_ENTITIES = [
+    ('vm', 'vm', 'vm'),
+    ('host', 'host', 'host'),
+    ('computeResource', 'computeResource', 'compute_resource'),
+    ('datacenter', 'datacenter', 'datacenter'),
+    ('ds', 'datastore', 'datastore'),
+    ('net', 'network', 'network'),
+]
+
+
+class EventsSensor(VSphereSensor):
+    DEFAULT_PAGE_SIZE = 1000
+    DEFAULT_BATCH_SIZE = 1
+    DEFAULT_VSPHERE = 'default'
+
+    # sensor datastore key of the last event read, to resume from after a restart
+    CURSOR_KEY = 'events.cursor.%s'
+
+    def setup(self):
+        self._log = self.sensor_service.get_logger(__name__)
+
+        # with several vspheres configured, one child sensor watches each of them
+        if self._setup_fan_out('sensors.events'):
+            return
+
+        self._vsphere = self._get_config_entry('vsphere', prefix='sensors.events')
+        if not self._vsphere:
+            self._vsphere = self.DEFAULT_VSPHERE
+
+        self._page_size = self._get_config_entry('page_size', prefix='sensors.events')
+        if not self._page_size:
+            self._page_size = self.DEFAULT_PAGE_SIZE
+
+        self._batch_size = self._get_config_entry('batch_size', prefix='sensors.events')
+        if not self._batch_size:
+            self._batch_size = self.DEFAULT_BATCH_SIZE
+
+        self._event_types = self._get_config_entry('event_types', prefix='sensors.events')
+        self._entity = self._get_config_entry('entity', prefix='sensors.events')
+
+        # Connect to the vSphere server
+        self.establish_connection(self._vsphere)
+
+        self._cursor = self._load_cursor()
+        self._collector = self._get_event_collector()
+
+    def poll(self):
+        if self._children:
+            return self._run_children('poll')
+
+        # The collector belongs to the session, re-create it if we had to log in again
+        if self.establish_connection(self._vsphere) or not self._collector:
+            self._destroy_history_collector()
+            self._collector = self._get_event_collector()
+
+        if not self._collector:
+            return
+
+        try:
+            self._read_events()
+        except Exception:
+            # the next poll reads from a new collector, resuming from the cursor
+            self._destroy_history_collector()
+            raise
+
+    def _read_events(self):
+        # drain the collector until it is empty so a busy vCenter doesn't leave
+        # the sensor behind
+        while True:
+            events = self._collector.ReadNextEvents(self._page_size)
+            payloads = [self._get_payload(event) for event in events
+                        if not self._is_read(event)]
+            self._dispatch(payloads)
+
+            if events:
+                self._save_cursor(events[-1])
+            if len(events) < self._page_size:
+                break
+
+    def _dispatch(self, payloads):
+        if self._batch_size <= 1:
+            for payload in payloads:
+                self.sensor_service.dispatch(trigger='vsphere.event', payload=payload)
+            return
+
+        for i in range(0, len(payloads), self._batch_size):
+            self.sensor_service.dispatch(trigger='vsphere.event_batch', payload={
+                'vsphere': self._vsphere,
+                'events': payloads[i:i + self._batch_size],
+            })
+
+    def _get_payload(self, event):
+        payload = {
+            'vsphere': self._vsphere,
+            'key': event.key,
+            'type': event._wsdlName,
+            'chain_id': event.chainId,
+            'created_time':
+                event.createdTime and event.createdTime.strftime('%Y/%m/%d %H:%M:%S') or '',
+            'user_name': event.userName or '',
+            'message': event.fullFormattedMessage or '',
+        }
+        for attr, entity_attr, key in EVENT_ENTITIES:
+            argument = getattr(event, attr, None)
+            entity = argument and getattr(argument, entity_attr, None)
+            payload[key] = argument and {
+                'id': entity and entity._moId,
+                'name': argument.name,
+            }
+        return payload
+
+    def _is_read(self, event):
+        # event keys increase monotonically, anything up to the cursor was dispatched
+        # before the restart
+        return bool(self._cursor) and event.key <= self._cursor['key']
+
+    def _load_cursor(self):
+        value = self.sensor_service.get_value(self.CURSOR_KEY % self._vsphere)
+        if not value:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            self._log.warning('Ignoring invalid events cursor: %s' % value)
+            return None
+
+    def _save_cursor(self, event):
+        if self._cursor and event.key <= self._cursor['key']:
+            return
+        self._cursor = {'key': event.key, 'created_time': event.createdTime.isoformat()}
+        self.sensor_service.set_value(self.CURSOR_KEY % self._vsphere, json.dumps(self._cursor))
+
+    def _get_event_collector(self):
+        # set filter to get events created after the last event read or after
+        # starting this sensor
+        time_filter = vim.event.EventFilterSpec.ByTime()
+        if self._cursor:
+            time_filter.beginTime = parse_isoformat(self._cursor['created_time'])
+        else:
+            time_filter.beginTime = datetime.now()
+
+        filter_spec = vim.event.EventFilterSpec(time=time_filter)
+        if self._event_types:
+            filter_spec.eventTypeId = self._event_types
+        if self._entity:
+            entity_type = getattr(vim, self._entity['type'])
+            filter_spec.entity = vim.event.EventFilterSpec.ByEntity(
+                entity=entity_type(self._entity['id'], stub=self.si._stub),
+                recursion=vim.event.EventFilterSpec.RecursionOption.all)
+
+        try:
+            return self.si_content.eventManager.CreateCollectorForEvents(filter=filter_spec)
+        except Exception as e:
+            self._log.error(e)
+
+    def cleanup(self):
+        if self._children:
+            return self._run_children('cleanup')
+
+        self._destroy_history_collector()
+
+    def add_trigger(self, trigger):
+        pass
+
+    def update_trigger(self, trigger):
+        pass
+
+    def remove_trigger(self, trigger):
+        pass
@@ -0,0 +1,172 @@
+from pyVmomi import vim, vmodl  # pylint: disable-msg=E0611
+from base import VSphereSensor
+
+from vmwarelib import inventory
+from vmwarelib.serialize import DEFAULT_SERIALIZER
+
+
+class InventorySensor(VSphereSensor):
+    """
+    Watches property changes of the vSphere inventory through a single
+    PropertyCollector filter and dispatches a trigger for each changed object.
+    """
+    DEFAULT_VSPHERE = 'default'
+    DEFAULT_MAX_WAIT = 30
+    DEFAULT_OBJECTS = [
+        {'type': 'VirtualMachine', 'properties': ['name', 'runtime.powerState']},
+        {'type': 'HostSystem', 'properties': ['name', 'runtime.connectionState']},
+        {'type': 'Datastore', 'properties': ['name', 'summary.freeSpace']},
+    ]
+
+    def setup(self):
+        self._log = self.sensor_service.get_logger(__name__)
+
+        # with several vspheres configured, one child sensor watches each of them
+        if self._setup_fan_out('sensors.inventory'):
+            return
+
+        self._vsphere = self._get_config_entry('vsphere', prefix='sensors.inventory')
+        if not self._vsphere:
+            self._vsphere = self.DEFAULT_VSPHERE
+
+        self._max_wait = self._get_config_entry('max_wait', prefix='sensors.inventory')
+        if not self._max_wait:
+            self._max_wait = self.DEFAULT_MAX_WAIT
+
+        objects = self._get_config_entry('objects', prefix='sensors.inventory')
+        if not objects:
+            objects = self.DEFAULT_OBJECTS
+        self._prop_specs = self._get_prop_specs(objects)
+
+        # Connect to the vSphere server
+        self.establish_connection(self._vsphere)
+
+        self._collector = None
+        self._view = None
+        self._reset_collector()
+
+    def poll(self):
+        if self._children:
+            return self._run_children('poll')
+
+        # The collector belongs to the session, re-create it if we had to log in again
+        if self.establish_connection(self._vsphere) or not self._collector:
+            self._reset_collector()
+
+        if not self._collector:
+            return
+
+        # blocks until something changed or max_wait expired, every change made
+        # since the previous version is returned at once
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=self._max_wait)
+        try:
+            update = self._collector.WaitForUpdatesEx(self._version, options)
+            while update:
+                self._version = update.version
+                for filter_update in update.filterSet:
+                    for obj_update in filter_update.objectSet:
+                        self._handle_update(obj_update)
+
+                # more changes are waiting when the update was truncated
+                if not update.truncated:
+                    break
+                update = self._collector.WaitForUpdatesEx(self._version, options)
+            # the first poll of a collector reads the current state of the
+            # inventory, in several truncated parts or in none at all when
+            # nothing matches, later updates are changes to dispatch
+            self._initialized = True
+        except vim.fault.NotAuthenticated:
+            # the poll runs again with a new login, which re-creates the collector
+            self._destroy_collector()
+            raise
+        except Exception as e:
+            # start over with a new collector on the next poll
+            self._log.error('Failed to wait for inventory updates: %s' % e)
+            self._destroy_collector()
+
+    def _handle_update(self, obj_update):
+        obj = obj_update.obj
+        changes = {}
+        for change in obj_update.changeSet:
+            value = None if change.op == 'remove' else change.val
+            changes[change.name] = DEFAULT_SERIALIZER.serialize(value)
+
+        names = self._names
+        if 'name' in changes:
+            names[obj._moId] = changes['name']
+        name = names.pop(obj._moId, None) if obj_update.kind == 'leave' else names.get(obj._moId)
+
+        # the first update only reports the current state of the inventory
+        if not self._initialized:
+            return
+
+        self._log.debug('Inventory change on %s: %s' % (obj._moId, changes))
+        self.sensor_service.dispatch(trigger='vsphere.inventory_change', payload={
+            'vsphere': self._vsphere,
+            'object_type': obj._wsdlName,
+            'object_id': obj._moId,
+            'name': name,
+            'kind': str(obj_update.kind),
+            'changes': changes,
+        })
+
+    def _get_prop_specs(self, objects):
+        prop_specs = []
+        for obj in objects:
+            try:
+                vimtype = getattr(vim, obj['type'])
+            except AttributeError:
+                raise ValueError("Unsupported inventory object type: %s" % obj['type'])
+
+            path_set = list(obj.get('properties') or [])
+            if 'name' not in path_set:
+                path_set.append('name')
+            prop_specs.append(vmodl.query.PropertyCollector.PropertySpec(
+                type=vimtype, pathSet=path_set, all=False))
+        return prop_specs
+
+    def _reset_collector(self):
+        self._destroy_collector()
+
+        self._version = ''
+        self._initialized = False
+        self._names = {}
+        try:
+            content = self.si_content
+            self._view = content.viewManager.CreateContainerView(
+                content.rootFolder, [spec.type for spec in self._prop_specs], True)
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[inventory.container_view_spec(self._view)],
+                propSet=self._prop_specs)
+            # a dedicated collector so the update versions only cover this filter
+            self._collector = content.propertyCollector.CreatePropertyCollector()
+            self._collector.CreateFilter(filter_spec, True)
+        except Exception as e:
+            self._log.error(e)
+            self._collector = None
+
+    def _destroy_collector(self):
+        try:
+            if self._collector:
+                self._collector.DestroyPropertyCollector()
+            if self._view:
+                self._view.Destroy()
+        except Exception as e:
+            self._log.debug('Unable to destroy the inventory collector: %s' % e)
+        self._collector = None
+        self._view = None
+
+    def cleanup(self):
+        if self._children:
+            return self._run_children('cleanup')
+
+        self._destroy_collector()
+
+    def add_trigger(self, trigger):
+        pass
+
+    def update_trigger(self, trigger):
+        pass
+
+    def remove_trigger(self, trigger):
+        pass
@@ -1,56 +1,183 @@
-import threading
+import json
 
 from pyVmomi import vim  # pylint: disable-msg=E0611
-from base import VSphereSensor
+from base import VSphereSensor, parse_isoformat
 from datetime import datetime
 
+from st2common.metrics.base import get_driver
+
+from vmwarelib import tasks
+
+# TaskInfo properties the tracker watches, enough to dispatch the completed task
+TASKINFO_PATHS = ['info.key', 'info.descriptionId', 'info.queueTime', 'info.startTime',
+                  'info.completeTime', 'info.state']
+
 
 class TaskInfoSensor(VSphereSensor):
     DEFAULT_TASKNUM = 3
+    DEFAULT_MAX_TASKNUM = 1000
     DEFAULT_VSPHERE = 'default'
 
+    # sensor datastore key of the last task read, to resume from after a restart
+    CURSOR_KEY = 'taskinfo.cursor.%s'
+    LAG_METRIC = 'vsphere.taskinfo.lag'
+
     def setup(self):
         self._log = self.sensor_service.get_logger(__name__)
 
+        # with several vspheres configured, one child sensor watches each of them
+        if self._setup_fan_out('sensors.taskinfo'):
+            return
+
         self._tasknum = self._get_config_entry('tasknum', prefix='sensors.taskinfo')
         if not self._tasknum:
             self._tasknum = self.DEFAULT_TASKNUM
 
+        self._max_tasknum = self._get_config_entry('max_tasknum', prefix='sensors.taskinfo')
+        if not self._max_tasknum:
+            self._max_tasknum = self.DEFAULT_MAX_TASKNUM
+        self._page_size = self._tasknum
+
         # Make a connection with vSphere server
-        vsphere = self._get_config_entry('vsphere', prefix='sensors.taskinfo')
-        if not vsphere:
-            vsphere = self.DEFAULT_VSPHERE
+        self._vsphere = self._get_config_entry('vsphere', prefix='sensors.taskinfo')
+        if not self._vsphere:
+            self._vsphere = self.DEFAULT_VSPHERE
 
         # Connect to the vSphere server
-        self.establish_connection(vsphere)
+        self.establish_connection(self._vsphere)
 
-        self._collector = self._get_task_collector()
+        self._cursor = self._load_cursor()
+        self._tracker = None
+        self._reset_collectors()
 
     def poll(self):
-        if self._collector:
-            for taskinfo in self._collector.ReadNextTasks(self._tasknum):
+        if self._children:
+            return self._run_children('poll')
+
+        # The collectors belong to the session, re-create them if we had to log in again
+        if self.establish_connection(self._vsphere):
+            self._reset_collectors()
+        elif not self._collector:
+            # the collector was destroyed after an error, or could not be created
+            self._collector = self._get_task_collector()
+
+        if not self._collector:
+            return
+
+        try:
+            self._read_tasks()
+        except Exception:
+            # the next poll reads from a new collector, resuming from the cursor
+            self._destroy_history_collector()
+            raise
+
+    def _read_tasks(self):
+        # drain the collector until it is empty, so bursts of tasks don't leave
+        # the sensor permanently behind
+        lag = None
+        while True:
+            taskinfos = self._collector.ReadNextTasks(self._page_size)
+            for taskinfo in taskinfos:
+                if self._is_read(taskinfo):
+                    continue
                 self._log.debug('Found a TaskInfo: %s' % taskinfo)
 
+                if lag is None and taskinfo.queueTime:
+                    lag = self._lag(taskinfo.queueTime)
+
                 # dispatches taskinfo trigger
                 self._dispatch_taskinfo(taskinfo)
+                self._advance_cursor(taskinfo)
+
+                # If task is uncompleted, track it until it completes then dispatch it again
+                if taskinfo.state not in tasks.TASK_DONE_STATES:
+                    self._tracker.track(taskinfo.task)
+
+            if taskinfos:
+                self._save_cursor()
+
+            full_page = len(taskinfos) >= self._page_size
+            self._resize_page(full_page)
+            if not full_page:
+                break
+
+        # how far behind the oldest task read in this poll was
+        lag = lag or 0
+        self._log.debug('Read tasks %s seconds after they were queued' % lag)
+        get_driver().set_gauge(self.LAG_METRIC, lag)
+
+    def _resize_page(self, full_page):
+        """Grow the page while pages come back full, shrink it once the backlog is drained"""
+        if full_page:
+            self._page_size = min(self._page_size * 2, self._max_tasknum)
+        else:
+            self._page_size = max(self._page_size // 2, self._tasknum)
+
+    def _lag(self, queue_time):
+        return max((datetime.now(queue_time.tzinfo) - queue_time).total_seconds(), 0)
+
+    def _is_read(self, taskinfo):
+        """
+        The collector resumes from the cursor's queue time, so tasks queued at
+        that exact time were possibly dispatched before the restart.
+        """
+        if not self._cursor or not taskinfo.queueTime:
+            return False
+        # isoformat strings with different offsets or precisions do not sort
+        # like the times they represent, the times are compared instead
+        cursor_time = parse_isoformat(self._cursor['queue_time'])
+        return (taskinfo.queueTime < cursor_time or
+                (taskinfo.queueTime == cursor_time and
+                 taskinfo.key in self._cursor['keys']))
+
+    def _load_cursor(self):
+        value = self.sensor_service.get_value(self.CURSOR_KEY % self._vsphere)
+        if not value:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            self._log.warning('Ignoring invalid taskinfo cursor: %s' % value)
+            return None
+
+    def _advance_cursor(self, taskinfo):
+        if not taskinfo.queueTime:
+            return
+        if (self._cursor and
+                parse_isoformat(self._cursor['queue_time']) == taskinfo.queueTime):
+            self._cursor['keys'].append(taskinfo.key)
+        else:
+            self._cursor = {'queue_time': taskinfo.queueTime.isoformat(),
+                            'keys': [taskinfo.key]}
+
+    def _save_cursor(self):
+        if self._cursor:
+            self.sensor_service.set_value(self.CURSOR_KEY % self._vsphere,
+                                          json.dumps(self._cursor))
+
+    def _reset_collectors(self):
+        if self._tracker:
+            self._tracker.stop()
+        self._destroy_history_collector()
+        self._tracker = tasks.TaskTracker(self.si_content, self._on_task_complete,
+                                          path_set=TASKINFO_PATHS, logger=self._log)
+        self._collector = self._get_task_collector()
 
-                # If task is uncompleted, waiting until it completes then dispatches it again
-                if taskinfo.state == vim.TaskInfo.State.running:
-                    threading.Thread(target=self._wait_until_task_complete,
-                                     args=[taskinfo.task]).start()
-
-    def _wait_until_task_complete(self, task):
-        """Waits until target task complete, then dispatch trigger"""
-        while task.info.state == vim.TaskInfo.State.running:
-            pass
-
-        self._dispatch_taskinfo(task.info)
+    def _on_task_complete(self, task, properties):
+        """Dispatch trigger for a tracked task once it completes"""
+        taskinfo = vim.TaskInfo(**dict((path.split('.', 1)[1], value)
+                                       for path, value in properties.items()))
+        self._dispatch_taskinfo(taskinfo)
 
     def _get_task_collector(self):
         # set filter to get TaskInfo which is queued in the vSphere after executing this Sensor
         time_filter = vim.TaskFilterSpec.ByTime()
         time_filter.timeType = vim.TaskFilterSpec.TimeOption.queuedTime
-        time_filter.beginTime = datetime.now()
+        if self._cursor:
+            # resume from the last task read, tasks queued since then are not lost
+            time_filter.beginTime = parse_isoformat(self._cursor['queue_time'])
+        else:
+            time_filter.beginTime = datetime.now()
 
         filter_spec = vim.TaskFilterSpec(time=time_filter)
 
@@ -70,10 +197,16 @@ class TaskInfoSensor(VSphereSensor):
             'complete_time':
                 taskinfo.completeTime and taskinfo.completeTime.strftime('%Y/%m/%d %H:%M:%S') or '',
             'state': str(taskinfo.state),
+            'vsphere': self._vsphere,
         })
 
     def cleanup(self):
-        pass
+        if self._children:
+            return self._run_children('cleanup')
+
+        if self._tracker:
+            self._tracker.stop()
+        self._destroy_history_collector()
 
     def add_trigger(self, trigger):
         pass
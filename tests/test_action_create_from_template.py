@@ -12,12 +12,9 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 
-import eventlet
 import mock
-import threading
 import vm_create_from_template
 
-from datetime import datetime
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
 from pyVmomi import vim  # pylint: disable-msg=E0611
 
@@ -38,6 +35,20 @@ class CreateFromTemplateTestCase(VsphereBaseActionTestCase):
         self._action.establish_connection = mock.Mock()
         self._action.si_content = mock.Mock()
 
+        # tasks finish in the final state once they have been waited for
+        self.final_state = vim.TaskInfo.State.success
+        patcher = mock.patch('vmwarelib.tasks.wait_for_tasks', side_effect=self.wait_for_tasks)
+        self.mock_wait_for_tasks = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait_for_tasks(self, content, tasks, timeout=None):
+        states = {}
+        for task in tasks:
+            if task.info.state in (vim.TaskInfo.State.queued, vim.TaskInfo.State.running):
+                task.info.state = self.final_state
+            states[task._moId] = task.info.state
+        return states
+
     @mock.patch.object(vm_create_from_template, 'vim')
     @mock.patch.object(vm_create_from_template, 'inventory')
     def test_action_with_queued_state(self, mock_inventory, mock_vim):
@@ -58,16 +69,11 @@ class CreateFromTemplateTestCase(VsphereBaseActionTestCase):
             'datastore_id': 'datastore-1',
         }
 
-        # creating and starting mock task
-        mock_task_thread = MockTaskThread(mock_task)
-        mock_task_thread.start()
-
         result = self._action.run(**params)
 
         self.assertTrue(result[0])
-
-        # stopping mock task
-        mock_task_thread.stop()
+        self.mock_wait_for_tasks.assert_called_with(self._action.si_content, [mock_task],
+                                                    timeout=None)
 
     @mock.patch.object(vm_create_from_template, 'vim')
     @mock.patch.object(vm_create_from_template, 'inventory')
@@ -89,17 +95,13 @@ class CreateFromTemplateTestCase(VsphereBaseActionTestCase):
             'datastore_id': 'datastore-1',
         }
 
-        # creating and starting mock task which will fail finally
-        mock_task_thread = MockTaskThread(mock_task, will_fail=True)
-        mock_task_thread.start()
+        # the task will fail finally
+        self.final_state = vim.TaskInfo.State.error
 
         result = self._action.run(**params)
 
         self.assertFalse(result[0])
 
-        # stopping mock task
-        mock_task_thread.stop()
-
     @mock.patch.object(vm_create_from_template, 'vim')
     @mock.patch.object(vm_create_from_template, 'inventory')
     def test_action_with_network_params(self, mock_inventory, mock_vim):
@@ -167,30 +169,3 @@ class CreateFromTemplateTestCase(VsphereBaseActionTestCase):
         result = self._action.run(**params)
 
         self.assertTrue(result[0])
-
-
-# This is the class to emulate the Task to change the state every second.
-class MockTaskThread(threading.Thread):
-    def __init__(self, mock_task, will_fail=False):
-        super(MockTaskThread, self).__init__()
-
-        self.mock_task = mock_task
-        self.is_stopped = False
-        self.woken_time = datetime.now()
-        self.final_state = vim.TaskInfo.State.success
-        if will_fail:
-            self.final_state = vim.TaskInfo.State.error
-
-    def run(self):
-        while not self.is_stopped:
-            passed_seconds = (datetime.now() - self.woken_time).seconds
-            if passed_seconds > 2:
-                self.mock_task.info.state = self.final_state
-            elif passed_seconds > 1:
-                self.mock_task.info.state = vim.TaskInfo.State.running
-
-            eventlet.sleep()
-
-    def stop(self):
-        self.is_stopped = True
-        self.join(1)
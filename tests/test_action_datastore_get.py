@@ -387,3 +387,12 @@ class DatastoreGetTestCase(VsphereBaseActionTestCase):
 
         result = self._action.run(None, None)
         self.assertEqual(result, expected_result)
+
+    @mock.patch('datastore_get.DatastoreGet.get_datastores')
+    def test_run_vspheres(self, mock_get_datastores):
+        mock_get_datastores.side_effect = lambda *args: [{'name': 'test_datastore'}]
+
+        result = self._action.run(None, None, vspheres=['default', 'other'])
+
+        self.assertEqual(result, {'default': [{'name': 'test_datastore'}],
+                                  'other': [{'name': 'test_datastore'}]})
@@ -49,30 +49,44 @@ class GetMoidTestCase(VsphereBaseActionTestCase):
         mock_vim_type.return_value = "vimType"
 
         # invoke action with valid parameters
-        mock_entity = "''vim.VirtualMachine:vm-1234''"
-        with mock.patch.object(inventory, 'get_managed_entity', return_value=mock_entity):
+        mock_entity = mock.Mock(_moId='vm-1234')
+        mock_entities = [(mock_entity, {'name': 'hoge'}),
+                         (mock.Mock(_moId='vm-5678'), {'name': 'fuga'})]
+        with mock.patch.object(inventory, 'get_entity_properties',
+                               return_value=mock_entities) as mock_get:
             # test for each object types
             for object_type in object_types:
                 result = self._action.run(object_names=['hoge'], object_type=object_type)
 
                 self.assertTrue(result[0])
-                self.assertTrue(len(result[1]) > 0)
-                self.assertEqual(result[1].get('hoge'), 'vm-1234')
+                self.assertEqual(result[1], {'hoge': 'vm-1234'})
                 mock_vim_type.assert_called_with(object_type)
+                mock_get.assert_called_with(self._action.si_content, "vimType")
 
     @mock.patch('vmwarelib.actions.BaseAction.get_vim_type')
     def test_with_invalid_names(self, mock_vim_type):
         mock_vim_type.return_value = "vimType"
 
-        def side_effect(*args, **kwargs):
-            # because vmwarelib.inventory.get_managed_entity raises an exeption when
-            # no matched object is found
-            raise Exception("Inventory Error: Unable to Find Object in a test")
-
         # invoke action with invalid names which don't match any objects
-        with mock.patch.object(inventory, 'get_managed_entity', side_effect=side_effect):
+        mock_entities = [(mock.Mock(_moId='vm-1234'), {'name': 'fuga'})]
+        with mock.patch.object(inventory, 'get_entity_properties', return_value=mock_entities):
             result = self._action.run(object_names=['hoge'], object_type='VirtualMachine')
 
         self.assertFalse(result[0])
         self.assertEqual(result[1], {})
         mock_vim_type.assert_called_with('VirtualMachine')
+
+    @mock.patch('vmwarelib.actions.BaseAction.get_vim_type')
+    def test_with_duplicate_names(self, mock_vim_type):
+        mock_vim_type.return_value = "vimType"
+
+        mock_entities = [(mock.Mock(_moId='vm-1234'), {'name': 'hoge'}),
+                         (mock.Mock(_moId='vm-5678'), {'name': 'hoge'}),
+                         (mock.Mock(_moId='vm-9012'), {'name': 'fuga'})]
+        with mock.patch.object(inventory, 'get_entity_properties', return_value=mock_entities):
+            result = self._action.run(object_names=['hoge', 'fuga'],
+                                      object_type='VirtualMachine')
+
+        self.assertTrue(result[0])
+        # the first object with a name is used, as get_managed_entity does
+        self.assertEqual(result[1], {'hoge': 'vm-1234', 'fuga': 'vm-9012'})
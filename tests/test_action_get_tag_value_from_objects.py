@@ -32,29 +32,29 @@ class GetTagValueFromObjectsTestCase(VsphereBaseActionTestCase):
         # define test variables
         category_name = "cat_name"
         object_type = "VirtualMachine"
-        object_id = "vm-123"
+        object_ids = ["vm-123", "vm-456"]
         test_category_id = "123"
         category = {'id': test_category_id, 'name': category_name}
 
         # mock
         action.tagging = mock.MagicMock()
-        action.tagging.tag_association_list_attached_tags.return_value = ["345", "111", "987"]
+        action.tagging.tag_association_list_attached_tags_on_objects.return_value = {
+            "vm-123": ["345", "111", "987"],
+            "vm-456": ["345", "012"],
+        }
         action.tagging.tag_list.return_value = ["987", "012", "385"]
-
-        expected_result = "result"
-        action.tagging.tag_get.return_value = {'name': expected_result}
+        action.tagging.tag_get_cached.side_effect = lambda tag_id: {'name': "tag-" + tag_id}
 
         # invoke action with valid parameters
-        result = action.get_tags(category, object_id, object_type)
+        result = action.get_tags(category, object_ids, object_type)
 
-        self.assertEqual(result, [expected_result])
+        self.assertEqual(result, {"vm-123": ["tag-987"], "vm-456": ["tag-012"]})
 
-        action.tagging.tag_association_list_attached_tags.assert_called_with(
-            object_type, object_id)
+        action.tagging.tag_association_list_attached_tags_on_objects.assert_called_once_with(
+            object_type, object_ids)
 
-        action.tagging.tag_list.assert_called_with(test_category_id)
-
-        action.tagging.tag_get.assert_called_with("987")
+        # the tags of the category are only listed once for all objects
+        action.tagging.tag_list.assert_called_once_with(test_category_id)
 
     def test_get_tags_tag_not_found(self):
         action = self.get_action_instance(self.new_config)
@@ -62,28 +62,25 @@ class GetTagValueFromObjectsTestCase(VsphereBaseActionTestCase):
         # define test variables
         category_name = "cat_name"
         object_type = "VirtualMachine"
-        object_id = "vm-123"
+        object_ids = ["vm-123"]
         test_category_id = "123"
         category = {'id': test_category_id, 'name': category_name}
 
         # mock
         action.tagging = mock.MagicMock()
 
-        action.tagging.tag_association_list_attached_tags.return_value = ["345", "111", "987"]
+        action.tagging.tag_association_list_attached_tags_on_objects.return_value = {
+            "vm-123": ["345", "111", "987"],
+        }
 
         action.tagging.tag_list.return_value = ["765", "012", "385"]
 
-        action.tagging.tag_get.return_value = []
-
-        result = action.get_tags(category, object_id, object_type)
-        self.assertEqual(result, [])
-
-        action.tagging.tag_association_list_attached_tags.assert_called_with(
-            object_type, object_id)
+        result = action.get_tags(category, object_ids, object_type)
+        self.assertEqual(result, {"vm-123": []})
 
         action.tagging.tag_list.assert_called_with(test_category_id)
 
-        action.tagging.tag_get.assert_not_called()
+        action.tagging.tag_get_cached.assert_not_called()
 
     @mock.patch("vmwarelib.actions.BaseAction.connect_rest")
     def test_run(self, mock_connect):
@@ -106,12 +103,14 @@ class GetTagValueFromObjectsTestCase(VsphereBaseActionTestCase):
         action.tagging = mock.MagicMock()
         action.tagging.category_find_by_name.return_value = {'id': test_category_id}
 
-        action.tagging.tag_association_list_attached_tags.return_value = ["345", "111", "987"]
+        action.tagging.tag_association_list_attached_tags_on_objects.return_value = {
+            "vm-123": ["345", "111", "987"],
+        }
 
         action.tagging.tag_list.return_value = ["987", "012", "385"]
 
         expected_result = {'vm-123': ["result"]}
-        action.tagging.tag_get.return_value = {'name': "result"}
+        action.tagging.tag_get_cached.return_value = {'name': "result"}
 
         # invoke action with valid parameters
         result = action.run(**test_kwargs)
@@ -119,12 +118,9 @@ class GetTagValueFromObjectsTestCase(VsphereBaseActionTestCase):
         self.assertEqual(result, expected_result)
         action.tagging.category_find_by_name.assert_called_with(category_name)
 
-        action.tagging.tag_association_list_attached_tags.assert_called_with(
-            object_type, object_ids[0])
-
         action.tagging.tag_list.assert_called_with(test_category_id)
 
-        action.tagging.tag_get.assert_called_with("987")
+        action.tagging.tag_get_cached.assert_called_with("987")
 
         mock_connect.assert_called_with(vsphere)
 
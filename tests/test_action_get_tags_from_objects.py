@@ -26,56 +26,54 @@ class GetTagsFromObjectsTestCase(VsphereBaseActionTestCase):
     __test__ = True
     action_cls = GetTagsFromObjects
 
+    def mock_tagging(self, action):
+        action.tagging = mock.MagicMock()
+        action.tagging.tag_association_list_attached_tags_on_objects.return_value = {
+            "vm-123": ["345", "111", "987"],
+            "vm-456": ["345"],
+            "vm-789": [],
+        }
+        tags = {
+            "345": {'tag_id': "345", 'name': 'test_tag_1', 'category_id': '123'},
+            "111": {'tag_id': "111", 'name': 'test_tag_2', 'category_id': '456'},
+            "987": {'tag_id': "987", 'name': 'test_tag_3', 'category_id': '456'},
+        }
+        categories = {
+            "123": {'category_id': "123", 'name': 'test_category_1'},
+            "456": {'category_id': "456", 'name': 'test_category_2'},
+        }
+        action.tagging.tag_get_cached.side_effect = lambda tag_id: tags[tag_id]
+        action.tagging.category_get_cached.side_effect = \
+            lambda category_id: categories[category_id]
+
     def test_get_tags(self):
         action = self.get_action_instance(self.new_config)
 
         # define test variables
         object_type = "VirtualMachine"
-        object_id = "vm-123"
+        object_ids = ["vm-123", "vm-456", "vm-789"]
 
         # mock
-        action.tagging = mock.MagicMock()
-        action.tagging.tag_association_list_attached_tags.return_value = ["345", "111", "987"]
-        action.tagging.tag_get.side_effect = [
-            {
-                'tag_id': "987",
-                'name': 'test_tag_1',
-                'category_id': '123'
-            }, {
-                'tag_id': "012",
-                'name': 'test_tag_2',
-                'category_id': '456'
-            }, {
-                'tag_id': "385",
-                'name': 'test_tag_3',
-                'category_id': '678'
-            }
-        ]
-        action.tagging.category_get.side_effect = [
-            {
-                'category_id': "123",
-                'name': 'test_category_1',
-            }, {
-                'category_id': "456",
-                'name': 'test_category_2',
-            }, {
-                'category_id': "678",
-                'name': 'test_category_3',
-            }
-        ]
+        self.mock_tagging(action)
 
         expected_result = {
-            'test_category_1': ['test_tag_1'],
-            'test_category_2': ['test_tag_2'],
-            'test_category_3': ['test_tag_3'],
+            'vm-123': {
+                'test_category_1': ['test_tag_1'],
+                'test_category_2': ['test_tag_2', 'test_tag_3'],
+            },
+            'vm-456': {
+                'test_category_1': ['test_tag_1'],
+            },
+            'vm-789': {},
         }
 
         # invoke action with valid parameters
-        result = action.get_tags(object_id, object_type)
+        result = action.get_tags(object_ids, object_type)
 
         self.assertEqual(result, expected_result)
-        action.tagging.tag_association_list_attached_tags.assert_called_with(
-            object_type, object_id)
+        # the attached tags for all objects are fetched with a single call
+        action.tagging.tag_association_list_attached_tags_on_objects.assert_called_once_with(
+            object_type, object_ids)
 
     @mock.patch("vmwarelib.actions.BaseAction.connect_rest")
     def test_run(self, mock_connect):
@@ -83,7 +81,7 @@ class GetTagsFromObjectsTestCase(VsphereBaseActionTestCase):
 
         # define test variables
         object_type = "VirtualMachine"
-        object_ids = ["vm-123"]
+        object_ids = ["vm-456"]
         vsphere = "default"
         test_kwargs = {
             "object_type": object_type,
@@ -92,41 +90,11 @@ class GetTagsFromObjectsTestCase(VsphereBaseActionTestCase):
         }
 
         # mock
-        action.tagging = mock.MagicMock()
-        action.tagging.tag_association_list_attached_tags.return_value = ["345", "111", "987"]
-        action.tagging.tag_get.side_effect = [
-            {
-                'tag_id': "987",
-                'name': 'test_tag_1',
-                'category_id': '123'
-            }, {
-                'tag_id': "012",
-                'name': 'test_tag_2',
-                'category_id': '456'
-            }, {
-                'tag_id': "385",
-                'name': 'test_tag_3',
-                'category_id': '678'
-            }
-        ]
-        action.tagging.category_get.side_effect = [
-            {
-                'category_id': "123",
-                'name': 'test_category_1',
-            }, {
-                'category_id': "456",
-                'name': 'test_category_2',
-            }, {
-                'category_id': "678",
-                'name': 'test_category_3',
-            }
-        ]
+        self.mock_tagging(action)
 
         expected_result = {
-            'vm-123': {
+            'vm-456': {
                 'test_category_1': ['test_tag_1'],
-                'test_category_2': ['test_tag_2'],
-                'test_category_3': ['test_tag_3'],
             }
         }
 
@@ -135,7 +103,7 @@ class GetTagsFromObjectsTestCase(VsphereBaseActionTestCase):
 
         self.assertEqual(result, expected_result)
 
-        action.tagging.tag_association_list_attached_tags.assert_called_with(
-            object_type, object_ids[0])
+        action.tagging.tag_association_list_attached_tags_on_objects.assert_called_with(
+            object_type, object_ids)
 
         mock_connect.assert_called_with(vsphere)
@@ -0,0 +1,171 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+from vmwarelib import inventory
+from get_vms import GetVMs
+from vsphere_base_action_test_case import VsphereBaseActionTestCase
+
+__all__ = [
+    'GetVMsTestCase'
+]
+
+
+class GetVMsTestCase(VsphereBaseActionTestCase):
+    __test__ = True
+    action_cls = GetVMs
+
+    def setUp(self):
+        super(GetVMsTestCase, self).setUp()
+
+        self._action = self.get_action_instance(self.new_config)
+
+        self._action.establish_connection = mock.Mock()
+        self._action.si = mock.Mock()
+        self._action.si_content = mock.Mock()
+
+    def mock_vm(self, moid, name, **properties):
+        props = {
+            'name': name,
+            'config.guestFullName': 'Linux',
+            'runtime.powerState': 'poweredOn',
+        }
+        props.update(properties)
+        return (mock.Mock(_moId=moid), props)
+
+    @mock.patch.object(inventory, 'object_spec')
+    @mock.patch.object(inventory, 'retrieve_properties')
+    @mock.patch.object(inventory, 'get_entity_properties')
+    def test_run_ids_names_uuids(self, mock_get, mock_retrieve, mock_obj_spec):
+        vms = [mock.Mock(_moId='vm-%d' % i) for i in range(1, 5)]
+        mock_get.return_value = [(vm, {'name': 'vm%d' % i, 'config.uuid': 'uuid-%d' % i})
+                                 for i, vm in enumerate(vms, 1)]
+        mock_retrieve.return_value = [
+            self.mock_vm('vm-1', 'vm1'),
+            self.mock_vm('vm-3', 'vm3'),
+            self.mock_vm('vm-4', 'vm4'),
+        ]
+        mock_obj_spec.side_effect = lambda vm, skip=True: vm._moId
+
+        result = self._action.run(ids=['vm-1'], names=['vm1', 'vm3'], uuids=['uuid-4'])
+
+        self.assertEqual(result, [
+            {'moid': 'vm-1', 'name': 'vm1', 'os': 'Linux', 'runtime.powerState': 'poweredOn'},
+            {'moid': 'vm-3', 'name': 'vm3', 'os': 'Linux', 'runtime.powerState': 'poweredOn'},
+            {'moid': 'vm-4', 'name': 'vm4', 'os': 'Linux', 'runtime.powerState': 'poweredOn'},
+        ])
+        # the scan of every vm only reads the properties used to match them
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(mock_get.call_args[1]['path_set'], ['name', 'config.uuid'])
+        # the requested properties are only read for the matching vms
+        self.assertEqual(mock_retrieve.call_count, 1)
+        self.assertEqual(mock_retrieve.call_args[0][1], ['vm-1', 'vm-3', 'vm-4'])
+        mock_obj_spec.assert_any_call(vms[0], skip=False)
+        self.assertIn('config.guestFullName', mock_retrieve.call_args[0][3])
+
+    @mock.patch.object(inventory, 'object_spec')
+    @mock.patch.object(inventory, 'retrieve_properties')
+    @mock.patch.object(inventory, 'get_entity_properties')
+    def test_run_properties(self, mock_get, mock_retrieve, mock_obj_spec):
+        mock_get.return_value = [(mock.Mock(_moId='vm-1'), {'name': 'vm1'})]
+        mock_retrieve.return_value = [
+            self.mock_vm('vm-1', 'vm1', **{'config.hardware.numCPU': 2,
+                                           'summary.quickStats.overallCpuUsage': None}),
+        ]
+
+        result = self._action.run(names=['vm1'],
+                                  properties=['config.hardware.numCPU',
+                                              'summary.quickStats.overallCpuUsage'])
+
+        self.assertEqual(result, [{'moid': 'vm-1',
+                                   'name': 'vm1',
+                                   'os': 'Linux',
+                                   'runtime.powerState': 'poweredOn',
+                                   'config.hardware.numCPU': 2,
+                                   'summary.quickStats.overallCpuUsage': None}])
+        self.assertEqual(mock_get.call_args[1]['path_set'], ['name'])
+        path_set = mock_retrieve.call_args[0][3]
+        self.assertIn('config.hardware.numCPU', path_set)
+        self.assertIn('summary.quickStats.overallCpuUsage', path_set)
+        self.assertNotIn('config.uuid', path_set)
+
+    @mock.patch.object(inventory, 'get_entity_properties')
+    def test_run_no_match(self, mock_get):
+        mock_get.return_value = [(mock.Mock(_moId='vm-1'), {'name': 'vm1'})]
+
+        with mock.patch.object(inventory, 'retrieve_properties') as mock_retrieve:
+            result = self._action.run(names=['missing'])
+
+        self.assertEqual(result, [])
+        self.assertFalse(mock_retrieve.called)
+
+    @mock.patch.object(inventory, 'object_spec')
+    @mock.patch.object(inventory, 'container_view_spec')
+    @mock.patch.object(inventory, 'retrieve_properties')
+    @mock.patch.object(inventory, 'get_entity_properties')
+    def test_run_traversals_and_containers(self, mock_get, mock_retrieve,
+                                           mock_view_spec, mock_obj_spec):
+        mock_retrieve.return_value = [
+            self.mock_vm('vm-1', 'vm1'),
+            self.mock_vm('vm-2', 'vm2'),
+            self.mock_vm('vm-1', 'vm1'),
+        ]
+        mock_view = mock.Mock()
+        view_manager = self._action.si_content.viewManager
+        view_manager.CreateContainerView.return_value = mock_view
+
+        result = self._action.run(datastores=['datastore-1'],
+                                  datastore_clusters=['group-p1'],
+                                  virtual_switches=['dvs-1'],
+                                  hosts=['host-1'],
+                                  clusters=['domain-c1'],
+                                  no_recursion=True)
+
+        self.assertEqual([vm['moid'] for vm in result], ['vm-1', 'vm-2'])
+        self.assertFalse(mock_get.called)
+        # every selector shares a single property retrieval
+        self.assertEqual(mock_retrieve.call_count, 1)
+        object_specs = mock_retrieve.call_args[0][1]
+        self.assertEqual(len(object_specs), 5)
+        self.assertEqual(mock_obj_spec.call_count, 3)
+        self.assertEqual(view_manager.CreateContainerView.call_count, 2)
+        for call in view_manager.CreateContainerView.call_args_list:
+            self.assertFalse(call[0][2])
+        self.assertEqual(mock_view.Destroy.call_count, 2)
+
+    @mock.patch.object(inventory, 'retrieve_properties')
+    @mock.patch.object(inventory, 'get_entity_properties')
+    def test_run_no_selectors(self, mock_get, mock_retrieve):
+        result = self._action.run()
+
+        self.assertEqual(result, [])
+        self.assertFalse(mock_get.called)
+        self.assertFalse(mock_retrieve.called)
+
+    @mock.patch.object(inventory, 'object_spec')
+    @mock.patch.object(inventory, 'retrieve_properties')
+    @mock.patch.object(inventory, 'get_entity_properties')
+    def test_run_vspheres(self, mock_get, mock_retrieve, mock_obj_spec):
+        mock_get.side_effect = lambda *args, **kwargs: [self.mock_vm('vm-1', 'vm1')]
+        mock_retrieve.side_effect = lambda *args, **kwargs: [self.mock_vm('vm-1', 'vm1')]
+
+        result = self._action.run(names=['vm1'], vspheres=['default', 'other'])
+
+        self.assertEqual(sorted(result), ['default', 'other'])
+        for vsphere in ['default', 'other']:
+            self.assertEqual([vm['moid'] for vm in result[vsphere]], ['vm-1'])
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_retrieve.call_count, 2)
@@ -0,0 +1,121 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+import hashlib
+import mock
+import os
+import shutil
+import tempfile
+from vsphere_base_action_test_case import VsphereBaseActionTestCase
+from guest_file_distribute import DistributeFileToGuests
+
+__all__ = [
+    'DistributeFileToGuestsTestCase'
+]
+
+
+class DistributeFileToGuestsTestCase(VsphereBaseActionTestCase):
+    __test__ = True
+    action_cls = DistributeFileToGuests
+
+    def setUp(self):
+        super(DistributeFileToGuestsTestCase, self).setUp()
+        self._action = self.get_action_instance(self.new_config)
+        self._action.establish_connection = mock.Mock()
+        self._action.si = mock.Mock()
+        self._action.si_content = mock.Mock()
+
+        local_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, local_dir)
+        self.local_path = os.path.join(local_dir, 'app.conf')
+        with open(self.local_path, 'wb') as local_file:
+            local_file.write(b'key=value\n')
+
+    def mock_vms(self, count):
+        vms = []
+        for i in range(count):
+            vm = mock.Mock()
+            vm._moId = 'vm-%s' % i
+            vms.append((vm, {'name': 'vm%s' % i}))
+        self.mock_property_collector(self._action.si_content, vms)
+        return [vm for vm, props in vms]
+
+    @mock.patch('vmwarelib.guest.get_http_session')
+    def test_run(self, mock_get_http_session):
+        vms = self.mock_vms(3)
+        file_manager = self._action.si_content.guestOperationsManager.fileManager
+        file_manager.InitiateFileTransferToGuest.side_effect = \
+            lambda vm, *args: 'https://esx/%s' % vm._moId
+
+        def put(url, data, verify):
+            if url == 'https://esx/vm-1':
+                raise Exception("connection refused")
+            self.assertEqual(data, b'key=value\n')
+            return mock.Mock()
+        mock_get_http_session.return_value.put.side_effect = put
+
+        result = self._action.run(username='u', password='p', guest_directory='/etc',
+                                  local_path=self.local_path,
+                                  vm_ids=['vm-0', 'vm-1', 'vm-2'], max_workers=2)
+
+        # any failed upload fails the action, with the status of every VM
+        self.assertEqual(result[0], False)
+        output = result[1]
+        self.assertEqual(output['path'], '/etc/app.conf')
+        self.assertEqual(output['size'], 10)
+        self.assertEqual(output['sha256'], hashlib.sha256(b'key=value\n').hexdigest())
+        self.assertEqual(output['succeeded'], 2)
+        self.assertEqual(output['failed'], 1)
+        self.assertEqual([(r['vm_id'], r['vm_name'], r['status']) for r in output['vms']],
+                         [('vm-0', 'vm0', 'succeeded'),
+                          ('vm-1', 'vm1', 'failed'),
+                          ('vm-2', 'vm2', 'succeeded')])
+        self.assertEqual(output['vms'][0]['result']['size'], 10)
+        self.assertEqual(output['vms'][1]['error'], 'connection refused')
+        self.assertIn('seconds', output['vms'][2])
+        # the VMs are resolved with a single property retrieval
+        self.assertEqual(
+            self._action.si_content.propertyCollector.RetrievePropertiesEx.call_count, 1)
+        for vm in vms:
+            file_manager.InitiateFileTransferToGuest.assert_any_call(
+                vm, self._action.guest_credentials, '/etc/app.conf', mock.ANY, 10, True)
+
+    @mock.patch('guest_file_distribute.SHARED_UPLOAD_MAX_SIZE', 0)
+    def test_run_streams_large_files(self):
+        self.mock_vms(2)
+        self._action.upload_file = mock.Mock(return_value={'sha256': 'abc', 'size': 10})
+
+        result = self._action.run(username='u', password='p', guest_directory='/etc',
+                                  local_path=self.local_path, vm_ids=['vm-0', 'vm-1'])
+
+        self.assertEqual(result['succeeded'], 2)
+        self.assertEqual(result['sha256'], 'abc')
+        self._action.upload_file.assert_called_with(self.local_path, '/etc/app.conf', True)
+        self.assertEqual(self._action.upload_file.call_count, 2)
+
+    @mock.patch('vmwarelib.inventory.iter_entity_properties')
+    def test_get_guest_vms_cluster(self, mock_inventory):
+        vm = mock.Mock()
+        mock_inventory.return_value = iter([(vm, {'name': 'vm0'})])
+        self._action.prepare_multi_guest_operation(None, 'u', 'p')
+
+        self.assertEqual(self._action.get_guest_vms(cluster_id='domain-c1'), [(vm, 'vm0')])
+        self.assertEqual(mock_inventory.call_args[1]['container']._moId, 'domain-c1')
+
+    def test_get_guest_vms_selection(self):
+        with self.assertRaises(ValueError):
+            self._action.get_guest_vms()
+        with self.assertRaises(ValueError):
+            self._action.get_guest_vms(vm_ids=['vm-0'], folder_id='group-v1')
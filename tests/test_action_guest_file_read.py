@@ -12,7 +12,11 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 
+import hashlib
 import mock
+import os
+import shutil
+import tempfile
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
 from guest_file_read import InitiateFileTransferFromGuest
 
@@ -55,3 +59,86 @@ class InitiateFileTransferFromGuestTestCase(VsphereBaseActionTestCase):
                     assert_called_once_with(
                         mock.ANY, mock.ANY, guestFilePath='/tmp/foo.txt')
                 self.assertEqual(result, "mocktext")
+
+    def mock_transfer(self, action, size, chunks, status_code=200):
+        transfer = action.si_content.guestOperationsManager.fileManager.\
+            InitiateFileTransferFromGuest.return_value
+        transfer.size = size
+        transfer.url = 'https://esx/guestFile'
+        response = self.mock_http_session.return_value.get.return_value
+        response.status_code = status_code
+        response.iter_content.return_value = chunks
+        return response
+
+    def setUp(self):
+        super(InitiateFileTransferFromGuestTestCase, self).setUp()
+        patcher = mock.patch('vmwarelib.guest.get_http_session')
+        self.mock_http_session = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_download_local_path(self):
+        (action, mock_vm) = self.mock_one_vm('vm-12345')
+        response = self.mock_transfer(action, 10, [b'0123', b'4567', b'89'])
+        local_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, local_dir)
+        local_path = os.path.join(local_dir, 'foo.log')
+
+        result = action.run(vm_id='vm-12345', username='u', password='p',
+                            guest_directory='/tmp', guest_file='foo.log',
+                            local_path=local_path)
+
+        with open(local_path, 'rb') as local_file:
+            self.assertEqual(local_file.read(), b'0123456789')
+        self.assertEqual(result['size'], 10)
+        self.assertEqual(result['file_size'], 10)
+        self.assertEqual(result['offset'], 0)
+        self.assertEqual(result['path'], local_path)
+        self.assertEqual(result['guest_path'], '/tmp/foo.log')
+        self.assertEqual(result['sha256'], hashlib.sha256(b'0123456789').hexdigest())
+        self.assertIn('bytes_per_second', result)
+        self.mock_http_session.return_value.get.assert_called_once_with(
+            'https://esx/guestFile', verify=False, stream=True, headers={})
+        response.close.assert_called_once_with()
+
+    def test_download_tail_partial_content(self):
+        (action, mock_vm) = self.mock_one_vm('vm-12345')
+        self.mock_transfer(action, 10, [b'789'], status_code=206)
+        local_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, local_dir)
+        local_path = os.path.join(local_dir, 'foo.log')
+
+        result = action.run(vm_id='vm-12345', username='u', password='p',
+                            guest_directory=None, guest_file='/tmp/foo.log',
+                            local_path=local_path, tail_bytes=3)
+
+        with open(local_path, 'rb') as local_file:
+            self.assertEqual(local_file.read(), b'789')
+        self.assertEqual(result['offset'], 7)
+        self.assertEqual(result['size'], 3)
+        self.mock_http_session.return_value.get.assert_called_once_with(
+            'https://esx/guestFile', verify=False, stream=True,
+            headers={'Range': 'bytes=7-'})
+
+    def test_read_range_without_range_support(self):
+        # the host ignores the Range header and sends the whole file
+        (action, mock_vm) = self.mock_one_vm('vm-12345')
+        response = self.mock_transfer(action, 10, [b'0123', b'4567', b'89'])
+
+        result = action.run(vm_id='vm-12345', username='u', password='p',
+                            guest_directory=None, guest_file='/tmp/foo.log',
+                            offset=2, length=5)
+
+        self.assertEqual(result, '23456')
+        self.mock_http_session.return_value.get.assert_called_once_with(
+            'https://esx/guestFile', verify=False, stream=True,
+            headers={'Range': 'bytes=2-6'})
+        response.close.assert_called_once_with()
+
+    def test_get_byte_range(self):
+        action = self.get_action_instance(self.new_config)
+        self.assertEqual(action.get_byte_range(10), (0, 10))
+        self.assertEqual(action.get_byte_range(10, offset=4), (4, 10))
+        self.assertEqual(action.get_byte_range(10, offset=4, length=20), (4, 10))
+        self.assertEqual(action.get_byte_range(10, offset=20, length=5), (10, 10))
+        self.assertEqual(action.get_byte_range(10, tail_bytes=4), (6, 10))
+        self.assertEqual(action.get_byte_range(10, tail_bytes=40), (0, 10))
@@ -12,9 +12,12 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 
+import hashlib
 import mock
+import tempfile
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
 from guest_file_upload import InitiateFileTransferToGuest
+from vmwarelib import guest
 
 __all__ = [
     'InitiateFileTransferToGuestTestCase'
@@ -25,10 +28,25 @@ class InitiateFileTransferToGuestTestCase(VsphereBaseActionTestCase):
     __test__ = True
     action_cls = InitiateFileTransferToGuest
 
-    @mock.patch('builtins.open', mock.mock_open(read_data="mockfilecontents"))
+    def mock_http_session(self, mock_get_http_session, chunks):
+        """The mock session's put reads the streamed body the way requests does"""
+        def put(url, data=None, verify=None):
+            chunks.append(len(data))
+            while True:
+                chunk = data.read(8192)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return mock.Mock()
+
+        mock_get_http_session.return_value.put.side_effect = put
+        return mock_get_http_session.return_value
+
+    @mock.patch('builtins.open', mock.mock_open(read_data=b"mockfilecontents"))
+    @mock.patch('vmwarelib.guest.os.path.getsize', mock.Mock(return_value=16))
     @mock.patch('pyVmomi.vim.vm.guest.FileManager')
-    @mock.patch('requests.put')
-    def test_normal(self, mock_put, mock_guest_file_manager):
+    @mock.patch('vmwarelib.guest.get_http_session')
+    def test_normal(self, mock_get_http_session, mock_guest_file_manager):
         # Exercise guest directory, one Windows, one Linux
         # guest_path[0] is the input guest_directory
         # guest_path[1] is the expected result
@@ -39,6 +57,8 @@ class InitiateFileTransferToGuestTestCase(VsphereBaseActionTestCase):
                 '/opt/stackstorm/packs.dev/mypack/myfile',
                 'pack:mypack/myfile'
             ):
+                chunks = []
+                self.mock_http_session(mock_get_http_session, chunks)
                 (action, mock_vm) = self.mock_one_vm('vm-12345')
                 mockFileMgr = mock.Mock()
                 mockFileMgr.InitiateFileTransferToGuest = mock.Mock()
@@ -57,3 +77,64 @@ class InitiateFileTransferToGuestTestCase(VsphereBaseActionTestCase):
                     len("mockfilecontents"), True
                 )
                 self.assertEqual(result, guest_path[1])
+                # the Content-Length is known up front and the body is streamed
+                self.assertEqual(chunks, [16, b"mockfilecontents"])
+
+    @mock.patch('vmwarelib.guest.get_http_session')
+    def test_upload_file_chunks(self, mock_get_http_session):
+        chunks = []
+        self.mock_http_session(mock_get_http_session, chunks)
+        (action, mock_vm) = self.mock_one_vm('vm-12345')
+        action._creds = 'creds'
+        action._vm = mock_vm
+
+        contents = b"x" * 20000
+        with tempfile.NamedTemporaryFile() as local_file:
+            local_file.write(contents)
+            local_file.flush()
+            result = action.upload_file(local_file.name, '/tmp/myfile', chunk_size=4096)
+
+        # never more than chunk_size bytes are read at once
+        self.assertEqual(chunks[0], 20000)
+        self.assertEqual([len(chunk) for chunk in chunks[1:]], [4096] * 4 + [3616])
+        self.assertEqual(result['path'], '/tmp/myfile')
+        self.assertEqual(result['size'], 20000)
+        self.assertEqual(result['sha256'], hashlib.sha256(contents).hexdigest())
+        self.assertIn('bytes_per_second', result)
+
+    @mock.patch('vmwarelib.guest.get_http_session')
+    def test_run_verify_sha256(self, mock_get_http_session):
+        (action, mock_vm) = self.mock_one_vm('vm-12345')
+        action.upload_file = mock.Mock(return_value={'size': 16, 'seconds': 1,
+                                                     'bytes_per_second': 16,
+                                                     'sha256': 'abc'})
+        mock_get_http_session.return_value.get.return_value.iter_content.return_value = \
+            [b"other", b"contents"]
+
+        with self.assertRaises(Exception):
+            action.run(vm_id='vm-12345', username='u', password='p',
+                       guest_directory='/tmp', local_path='/tmp/myfile',
+                       verify_sha256=True)
+
+        action.upload_file.return_value['sha256'] = \
+            hashlib.sha256(b"othercontents").hexdigest()
+        result = action.run(vm_id='vm-12345', username='u', password='p',
+                            guest_directory='/tmp', local_path='/tmp/myfile',
+                            verify_sha256=True)
+
+        self.assertEqual(result, '/tmp/myfile')
+        mock_get_http_session.return_value.get.assert_called_with(
+            action.guest_file_manager.InitiateFileTransferFromGuest.return_value.url,
+            verify=False, stream=True, headers={})
+
+    @mock.patch('vmwarelib.guest._http_pool_size', 0)
+    @mock.patch('vmwarelib.guest._http_session', None)
+    def test_http_session_pool_fits_max_workers(self):
+        session = guest.get_http_session()
+        adapter = session.get_adapter('https://esxi')
+        self.assertEqual(adapter._pool_maxsize, guest.DEFAULT_MAX_WORKERS)
+        self.assertIs(guest.get_http_session(5), session)
+        self.assertIs(session.get_adapter('https://esxi'), adapter)
+        self.assertIs(guest.get_http_session(50), session)
+        self.assertEqual(session.get_adapter('https://esxi')._pool_maxsize, 50)
+        self.assertEqual(session.get_adapter('https://esxi')._pool_connections, 50)
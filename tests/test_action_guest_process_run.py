@@ -0,0 +1,125 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+import mock
+from vsphere_base_action_test_case import VsphereBaseActionTestCase
+from guest_process_run import RunProgramInGuest
+
+__all__ = [
+    'RunProgramInGuestTestCase'
+]
+
+
+class RunProgramInGuestTestCase(VsphereBaseActionTestCase):
+    __test__ = True
+    action_cls = RunProgramInGuest
+
+    def setUp(self):
+        super(RunProgramInGuestTestCase, self).setUp()
+        (self._action, self.mock_vm) = self.mock_one_vm('vm-12345')
+        operations = self._action.si_content.guestOperationsManager
+        self.file_manager = operations.fileManager
+        self.process_manager = operations.processManager
+        self.file_manager.CreateTemporaryDirectoryInGuest.return_value = '/tmp/st2_runner'
+        self.process_manager.StartProgramInGuest.return_value = 42
+
+        # the outputs are streamed back from the guest
+        outputs = {'/tmp/st2_runner/stdout': [b'host', b'01\n'],
+                   '/tmp/st2_runner/stderr': []}
+        self.file_manager.InitiateFileTransferFromGuest.side_effect = \
+            lambda vm, creds, guestFilePath: mock.Mock(
+                url=guestFilePath, size=sum(len(c) for c in outputs[guestFilePath]))
+
+        def get(url, **kwargs):
+            return mock.Mock(status_code=200,
+                             iter_content=mock.Mock(return_value=outputs[url]))
+        patcher = mock.patch('vmwarelib.guest.get_http_session')
+        patcher.start().return_value.get.side_effect = get
+        self.addCleanup(patcher.stop)
+
+    def process(self, exit_code=None):
+        return mock.Mock(endTime=None if exit_code is None else 'yes', exitCode=exit_code)
+
+    @mock.patch('vmwarelib.guest.time.sleep')
+    def test_run(self, mock_sleep):
+        self.process_manager.ListProcessesInGuest.side_effect = \
+            [[self.process()], [self.process()], [self.process(0)]]
+
+        result = self._action.run(vm_id='vm-12345', username='u', password='p',
+                                  command='/bin/sh', arguments='-c hostname')
+
+        self.assertEqual(result[0], True)
+        self.assertEqual(result[1]['exit_code'], 0)
+        self.assertEqual(result[1]['stdout'], 'host01\n')
+        self.assertEqual(result[1]['stderr'], '')
+        self.assertEqual(result[1]['pid'], 42)
+        cmdspec = self.process_manager.StartProgramInGuest.call_args[0][2]
+        self.assertEqual(cmdspec.programPath, '/bin/sh')
+        self.assertEqual(cmdspec.arguments,
+                         '-c hostname 1> "/tmp/st2_runner/stdout" 2> "/tmp/st2_runner/stderr"')
+        self.assertEqual(cmdspec.workingDirectory, '/tmp/st2_runner')
+        # short commands are polled quickly, backing off while they run
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [0.25, 0.5])
+        self.file_manager.DeleteDirectoryInGuest.assert_called_once_with(
+            self.mock_vm, self._action.guest_credentials, '/tmp/st2_runner', True)
+
+    @mock.patch('vmwarelib.guest.time.sleep')
+    def test_run_failed(self, mock_sleep):
+        self.process_manager.ListProcessesInGuest.return_value = [self.process(3)]
+
+        result = self._action.run(vm_id='vm-12345', username='u', password='p',
+                                  command='/bin/false', workdir='/opt',
+                                  max_output_bytes=3)
+
+        # the output is still returned when the command fails
+        self.assertEqual(result[0], False)
+        self.assertEqual(result[1]['exit_code'], 3)
+        self.assertEqual(result[1]['stdout'], '01\n')
+        cmdspec = self.process_manager.StartProgramInGuest.call_args[0][2]
+        self.assertEqual(cmdspec.workingDirectory, '/opt')
+        mock_sleep.assert_not_called()
+
+    @mock.patch('vmwarelib.guest.time.time')
+    @mock.patch('vmwarelib.guest.time.sleep')
+    def test_run_timeout(self, mock_sleep, mock_time):
+        mock_time.side_effect = [0, 0, 10, 20, 20]
+        self.process_manager.ListProcessesInGuest.return_value = [self.process()]
+
+        with self.assertRaises(Exception):
+            self._action.run(vm_id='vm-12345', username='u', password='p',
+                             command='/bin/sleep', arguments='600', timeout=15)
+
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [0.25])
+        self.process_manager.TerminateProcessInGuest.assert_called_once_with(
+            self.mock_vm, self._action.guest_credentials, 42)
+        self.file_manager.DeleteDirectoryInGuest.assert_called_once_with(
+            self.mock_vm, self._action.guest_credentials, '/tmp/st2_runner', True)
+
+    @mock.patch('vmwarelib.guest.time.sleep')
+    def test_run_program_script(self, mock_sleep):
+        self.process_manager.ListProcessesInGuest.return_value = [self.process(0)]
+        self._action.prepare_guest_operation(None, 'vm-12345', 'u', 'p')
+        self._action.upload_data = mock.Mock()
+
+        result = self._action.run_program('/bin/sh', '-e', script=('check.sh', b'echo ok\n'),
+                                          script_arguments='--strict')
+
+        self.assertEqual(result['exit_code'], 0)
+        self._action.upload_data.assert_called_once_with(b'echo ok\n',
+                                                         '/tmp/st2_runner/check.sh')
+        cmdspec = self.process_manager.StartProgramInGuest.call_args[0][2]
+        self.assertEqual(cmdspec.arguments,
+                         '-e "/tmp/st2_runner/check.sh" --strict 1> "/tmp/st2_runner/stdout" '
+                         '2> "/tmp/st2_runner/stderr"')
@@ -0,0 +1,102 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+import json
+import mock
+import os
+import shutil
+import tempfile
+from vsphere_base_action_test_case import VsphereBaseActionTestCase
+from guest_process_run_batch import RunProgramInGuests
+
+__all__ = [
+    'RunProgramInGuestsTestCase'
+]
+
+
+def run_program(action, command, arguments, workdir, envvar, **kwargs):
+    if action.vm._moId == 'vm-2':
+        raise Exception("Guest operations agent could not be contacted")
+    exit_code = 2 if action.vm._moId == 'vm-1' else 0
+    return {'pid': 42,
+            'exit_code': exit_code,
+            'stdout': 'out %s' % action.vm._moId,
+            'stderr': '',
+            'seconds': 1}
+
+
+class RunProgramInGuestsTestCase(VsphereBaseActionTestCase):
+    __test__ = True
+    action_cls = RunProgramInGuests
+
+    def setUp(self):
+        super(RunProgramInGuestsTestCase, self).setUp()
+        self._action = self.get_action_instance(self.new_config)
+        self._action.establish_connection = mock.Mock()
+        self._action.si = mock.Mock()
+        self._action.si_content = mock.Mock()
+        vms = []
+        for i in range(3):
+            vm = mock.Mock()
+            vm._moId = 'vm-%s' % i
+            vms.append((vm, {'name': 'vm%s' % i}))
+        self.mock_property_collector(self._action.si_content, vms)
+
+        self.local_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local_dir)
+
+    @mock.patch.object(RunProgramInGuests, 'run_program', autospec=True,
+                       side_effect=run_program)
+    def test_run(self, mock_run_program):
+        result = self._action.run(username='u', password='p', command='/bin/sh',
+                                  arguments='-c "id -u"', timeout=60,
+                                  vm_ids=['vm-0', 'vm-1', 'vm-2'], max_workers=2)
+
+        self.assertEqual(result[0], False)
+        output = result[1]
+        self.assertEqual(output['succeeded'], 1)
+        self.assertEqual(output['failed'], 2)
+        self.assertEqual([(r['vm_id'], r['status'], r.get('exit_code')) for r in output['vms']],
+                         [('vm-0', 'succeeded', 0),
+                          ('vm-1', 'failed', 2),
+                          ('vm-2', 'failed', None)])
+        self.assertEqual(output['vms'][0]['stdout'], 'out vm-0')
+        self.assertEqual(output['vms'][2]['error'],
+                         'Guest operations agent could not be contacted')
+        mock_run_program.assert_called_with(
+            mock.ANY, '/bin/sh', '-c "id -u"', None, None, timeout=60,
+            max_output_bytes=None, script=None, script_arguments=None)
+
+    @mock.patch.object(RunProgramInGuests, 'run_program', autospec=True,
+                       side_effect=run_program)
+    def test_run_script_output_path(self, mock_run_program):
+        script = os.path.join(self.local_dir, 'check.sh')
+        with open(script, 'wb') as local_file:
+            local_file.write(b'echo ok\n')
+        output_path = os.path.join(self.local_dir, 'results.jsonl')
+
+        result = self._action.run(username='u', password='p', command='/bin/sh',
+                                  script=script, script_arguments='--strict',
+                                  vm_ids=['vm-0'], output_path=output_path)
+
+        self.assertEqual(result['succeeded'], 1)
+        self.assertEqual(result['output_path'], output_path)
+        # the output is only in the file
+        self.assertNotIn('stdout', result['vms'][0])
+        with open(output_path) as output_file:
+            lines = [json.loads(line) for line in output_file]
+        self.assertEqual([(r['vm_id'], r['stdout']) for r in lines], [('vm-0', 'out vm-0')])
+        self.assertEqual(mock_run_program.call_args[1]['script'], ('check.sh', b'echo ok\n'))
+        self.assertEqual(mock_run_program.call_args[1]['script_arguments'], '--strict')
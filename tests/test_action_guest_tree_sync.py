@@ -0,0 +1,170 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+import datetime
+import mock
+import os
+import pytz  # pylint: disable=import-error
+import shutil
+import tempfile
+from pyVmomi import vim  # pylint: disable-msg=E0611
+from vsphere_base_action_test_case import VsphereBaseActionTestCase
+from guest_tree_sync import SyncTreeToGuest
+
+__all__ = [
+    'SyncTreeToGuestTestCase'
+]
+
+MTIME = 1500000000
+
+
+class SyncTreeToGuestTestCase(VsphereBaseActionTestCase):
+    __test__ = True
+    action_cls = SyncTreeToGuest
+
+    def setUp(self):
+        super(SyncTreeToGuestTestCase, self).setUp()
+        self.local_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local_dir)
+        for relpath, contents in (('a.txt', b'aaa'), ('sub/b.txt', b'bbb'),
+                                  ('sub/c.txt', b'cccc'), ('new/d.txt', b'd')):
+            full_path = os.path.join(self.local_dir, *relpath.split('/'))
+            if not os.path.isdir(os.path.dirname(full_path)):
+                os.makedirs(os.path.dirname(full_path))
+            with open(full_path, 'wb') as local_file:
+                local_file.write(contents)
+            os.utime(full_path, (MTIME, MTIME))
+
+        (self._action, self.mock_vm) = self.mock_one_vm('vm-12345')
+        self.file_manager = self._action.si_content.guestOperationsManager.fileManager
+        self._action.upload_file = mock.Mock(side_effect=lambda local_path, guest_path, **kw:
+                                             {'size': os.path.getsize(local_path)})
+
+    def file_info(self, path, type='file', size=3, mtime=MTIME):
+        modification_time = datetime.datetime.utcfromtimestamp(mtime).replace(tzinfo=pytz.UTC)
+        info = mock.Mock(type=type, size=size,
+                         attributes=mock.Mock(modificationTime=modification_time))
+        info.path = path
+        return info
+
+    def mock_guest_tree(self, listings):
+        def list_files(vm, creds, guest_path, index=0):
+            return mock.Mock(files=listings[guest_path][index:], remaining=0)
+        self.file_manager.ListFilesInGuest.side_effect = list_files
+
+    def run_sync(self, **kwargs):
+        return self._action.run(vm_id='vm-12345', username='u', password='p',
+                                local_directory=self.local_dir, guest_directory='/opt/app',
+                                **kwargs)
+
+    def test_run_uploads_changes(self):
+        self.mock_guest_tree({
+            '/opt/app': [self.file_info('.', 'directory'), self.file_info('..', 'directory'),
+                         self.file_info('a.txt'),
+                         self.file_info('sub', 'directory'),
+                         self.file_info('old.txt')],
+            '/opt/app/sub': [self.file_info('b.txt', mtime=MTIME + 60),
+                             self.file_info('c.txt')],
+        })
+
+        result = self.run_sync(delete_extra=True)
+
+        self.assertEqual(result['uploaded'], ['new/d.txt', 'sub/b.txt', 'sub/c.txt'])
+        self.assertEqual(result['unchanged'], 1)
+        self.assertEqual(result['size'], 8)
+        self.assertEqual(result['directories_created'], ['new'])
+        self.assertEqual(result['deleted'], ['old.txt'])
+        self.assertEqual(result['failed'], [])
+        self.file_manager.MakeDirectoryInGuest.assert_called_once_with(
+            self.mock_vm, self._action.guest_credentials, '/opt/app/new', True)
+        self.file_manager.DeleteFileInGuest.assert_called_once_with(
+            self.mock_vm, self._action.guest_credentials, '/opt/app/old.txt')
+        # the guest file gets the local modification time for the next sync
+        kwargs = self._action.upload_file.call_args_list[0][1]
+        self.assertEqual(kwargs['file_attribute'].modificationTime,
+                         datetime.datetime.utcfromtimestamp(MTIME).replace(tzinfo=pytz.UTC))
+
+    def test_run_new_guest_directory(self):
+        self.file_manager.ListFilesInGuest.side_effect = vim.fault.FileNotFound()
+        self._action.upload_file.side_effect = [{'size': 3}, Exception('disk full'),
+                                                {'size': 3}, {'size': 4}]
+
+        result = self.run_sync(max_workers=1)
+
+        self.assertEqual(result[0], False)
+        self.assertEqual(result[1]['uploaded'], ['a.txt', 'sub/b.txt', 'sub/c.txt'])
+        self.assertEqual(result[1]['failed'], [{'path': 'new/d.txt', 'error': 'disk full'}])
+        self.assertEqual(result[1]['directories_created'], ['new', 'sub'])
+        self.assertEqual(self.file_manager.MakeDirectoryInGuest.call_args_list[0][0][2],
+                         '/opt/app')
+
+    def test_run_guest_file_at_directory_path(self):
+        self.mock_guest_tree({
+            '/opt/app': [self.file_info('a.txt'), self.file_info('sub')],
+        })
+
+        def make_directory(vm, creds, guest_path, parents):
+            if guest_path == '/opt/app/sub':
+                raise Exception('File /opt/app/sub already exists')
+        self.file_manager.MakeDirectoryInGuest.side_effect = make_directory
+
+        result = self.run_sync()
+
+        # the directory and the files beneath it fail, the rest is synced
+        self.assertEqual(result[0], False)
+        self.assertEqual(result[1]['failed'], [
+            {'path': 'sub', 'error': 'File /opt/app/sub already exists'},
+            {'path': 'sub/b.txt', 'error': 'Directory sub could not be created'},
+            {'path': 'sub/c.txt', 'error': 'Directory sub could not be created'},
+        ])
+        self.assertEqual(result[1]['directories_created'], ['new'])
+        self.assertEqual(result[1]['uploaded'], ['new/d.txt'])
+        self.assertEqual(result[1]['unchanged'], 1)
+
+    def test_run_compare_sha256(self):
+        self.mock_guest_tree({
+            '/opt/app': [self.file_info('a.txt', mtime=MTIME + 60),
+                         self.file_info('sub', 'directory'),
+                         self.file_info('new', 'directory')],
+            '/opt/app/sub': [self.file_info('b.txt', mtime=MTIME + 60),
+                             self.file_info('c.txt', size=4)],
+            '/opt/app/new': [self.file_info('d.txt', size=1)],
+        })
+        local_sha256 = self._action.local_file_sha256
+        guest_sha256 = {
+            '/opt/app/a.txt': local_sha256(os.path.join(self.local_dir, 'a.txt')),
+            '/opt/app/sub/b.txt': local_sha256(os.path.join(self.local_dir, 'sub', 'b.txt')),
+        }
+        self._action.guest_file_sha256 = mock.Mock(
+            side_effect=lambda guest_path: guest_sha256.get(guest_path, 'changed'))
+
+        result = self.run_sync(compare='sha256')
+
+        # only the files of the same size with different contents are uploaded
+        self.assertEqual(result['uploaded'], ['new/d.txt', 'sub/c.txt'])
+        self.assertEqual(result['unchanged'], 2)
+        self.assertEqual(result['directories_created'], [])
+
+    def test_list_guest_tree_paged(self):
+        pages = [mock.Mock(files=[self.file_info('a.txt')], remaining=1),
+                 mock.Mock(files=[self.file_info('b.txt')], remaining=0)]
+        self.file_manager.ListFilesInGuest.side_effect = pages
+        self._action.prepare_guest_operation(None, 'vm-12345', 'u', 'p')
+
+        tree = self._action.list_guest_tree('C:\\app')
+
+        self.assertEqual(sorted(tree), ['a.txt', 'b.txt'])
+        self.file_manager.ListFilesInGuest.assert_called_with(
+            mock.ANY, mock.ANY, 'C:\\app', index=1)
@@ -36,41 +36,17 @@ class GetHostTestCase(VsphereBaseActionTestCase):
         self._action.establish_connection = mock.Mock()
         self._action.si_content = mock.Mock()
 
+    def mock_hosts(self, count):
+        hosts = []
+        for i in range(1, count + 1):
+            host = mock.Mock(_moId=i)
+            name = 'test_host' if i == 1 else 'test_host_%s' % i
+            summary = 'expected_summary' if i == 1 else 'expected_summary_%s' % i
+            hosts.append((host, {'name': name, 'summary': summary}))
+        return self.mock_property_collector(self._action.si_content, hosts)
+
     def test_get_select_hosts(self):
-        host_1 = mock.Mock()
-        host_1_name_property = mock.PropertyMock(return_value='test_host')
-        type(host_1).name = host_1_name_property
-        host_1.summary = 'expected_summary'
-        host_1._moId = 1
-
-        host_2 = mock.Mock()
-        host_2_name_property = mock.PropertyMock(return_value='test_host_2')
-        type(host_2).name = host_2_name_property
-        host_2.summary = 'expected_summary_2'
-        host_2._moId = 2
-
-        host_3 = mock.Mock()
-        host_3_name_property = mock.PropertyMock(return_value='test_host_3')
-        type(host_3).name = host_3_name_property
-        host_3.summary = 'expected_summary_3'
-        host_3._moId = 3
-
-        host_4 = mock.Mock()
-        host_4_name_property = mock.PropertyMock(return_value='test_host_4')
-        type(host_4).name = host_4_name_property
-        host_4.summary = 'expected_summary_4'
-        host_4._moId = 4
-
-        host_5 = mock.Mock()
-        host_5_name_property = mock.PropertyMock(return_value='test_host_5')
-        type(host_5).name = host_5_name_property
-        host_5.summary = 'expected_summary_5'
-        host_5._moId = 5
-
-        mock_view = mock.Mock(view=[host_1, host_2, host_3, host_4, host_5])
-        mock_vmware = mock.Mock(rootFolder="folder")
-        mock_vmware.viewManager.CreateContainerView.return_value = mock_view
-        self._action.si_content = mock_vmware
+        collector = self.mock_hosts(5)
 
         expected_result = {
             'test_host_4': 'expected_summary_4',
@@ -80,22 +56,16 @@ class GetHostTestCase(VsphereBaseActionTestCase):
 
         result = self._action.get_select_hosts([4], ['test_host_2', 'test_host_5'])
         self.assertEqual(result, expected_result)
+        # all of the hosts are resolved with a single property retrieval
+        self.assertEqual(collector.RetrievePropertiesEx.call_count, 1)
 
-    def test_get_all_hosts(self):
-        host_1 = mock.Mock()
-        host_1_name_property = mock.PropertyMock(return_value='test_host')
-        type(host_1).name = host_1_name_property
-        host_1.summary = 'expected_summary'
+    def test_get_select_hosts_not_found(self):
+        self.mock_hosts(2)
 
-        host_2 = mock.Mock()
-        host_2_name_property = mock.PropertyMock(return_value='test_host_2')
-        type(host_2).name = host_2_name_property
-        host_2.summary = 'expected_summary_2'
+        self.assertRaises(Exception, self._action.get_select_hosts, [4], None)
 
-        mock_view = mock.Mock(view=[host_1, host_2])
-        mock_vmware = mock.Mock(rootFolder="folder")
-        mock_vmware.viewManager.CreateContainerView.return_value = mock_view
-        self._action.si_content = mock_vmware
+    def test_get_all_hosts(self):
+        collector = self.mock_hosts(2)
 
         expected_result = {
             'test_host': 'expected_summary',
@@ -104,42 +74,10 @@ class GetHostTestCase(VsphereBaseActionTestCase):
 
         result = self._action.get_all_hosts()
         self.assertEqual(result, expected_result)
+        self.assertEqual(collector.RetrievePropertiesEx.call_count, 1)
 
     def test_run_select(self):
-        host_1 = mock.Mock()
-        host_1_name_property = mock.PropertyMock(return_value='test_host')
-        type(host_1).name = host_1_name_property
-        host_1.summary = 'expected_summary'
-        host_1._moId = 1
-
-        host_2 = mock.Mock()
-        host_2_name_property = mock.PropertyMock(return_value='test_host_2')
-        type(host_2).name = host_2_name_property
-        host_2.summary = 'expected_summary_2'
-        host_2._moId = 2
-
-        host_3 = mock.Mock()
-        host_3_name_property = mock.PropertyMock(return_value='test_host_3')
-        type(host_3).name = host_3_name_property
-        host_3.summary = 'expected_summary_3'
-        host_3._moId = 3
-
-        host_4 = mock.Mock()
-        host_4_name_property = mock.PropertyMock(return_value='test_host_4')
-        type(host_4).name = host_4_name_property
-        host_4.summary = 'expected_summary_4'
-        host_4._moId = 4
-
-        host_5 = mock.Mock()
-        host_5_name_property = mock.PropertyMock(return_value='test_host_5')
-        type(host_5).name = host_5_name_property
-        host_5.summary = 'expected_summary_5'
-        host_5._moId = 5
-
-        mock_view = mock.Mock(view=[host_1, host_2, host_3, host_4, host_5])
-        mock_vmware = mock.Mock(rootFolder="folder")
-        mock_vmware.viewManager.CreateContainerView.return_value = mock_view
-        self._action.si_content = mock_vmware
+        self.mock_hosts(5)
 
         expected_result = {
             'test_host_4': 'expected_summary_4',
@@ -151,40 +89,7 @@ class GetHostTestCase(VsphereBaseActionTestCase):
         self.assertEqual(result, expected_result)
 
     def test_run_all(self):
-        host_1 = mock.Mock()
-        host_1_name_property = mock.PropertyMock(return_value='test_host')
-        type(host_1).name = host_1_name_property
-        host_1.summary = 'expected_summary'
-        host_1._moId = 1
-
-        host_2 = mock.Mock()
-        host_2_name_property = mock.PropertyMock(return_value='test_host_2')
-        type(host_2).name = host_2_name_property
-        host_2.summary = 'expected_summary_2'
-        host_2._moId = 2
-
-        host_3 = mock.Mock()
-        host_3_name_property = mock.PropertyMock(return_value='test_host_3')
-        type(host_3).name = host_3_name_property
-        host_3.summary = 'expected_summary_3'
-        host_3._moId = 3
-
-        host_4 = mock.Mock()
-        host_4_name_property = mock.PropertyMock(return_value='test_host_4')
-        type(host_4).name = host_4_name_property
-        host_4.summary = 'expected_summary_4'
-        host_4._moId = 4
-
-        host_5 = mock.Mock()
-        host_5_name_property = mock.PropertyMock(return_value='test_host_5')
-        type(host_5).name = host_5_name_property
-        host_5.summary = 'expected_summary_5'
-        host_5._moId = 5
-
-        mock_view = mock.Mock(view=[host_1, host_2, host_3, host_4, host_5])
-        mock_vmware = mock.Mock(rootFolder="folder")
-        mock_vmware.viewManager.CreateContainerView.return_value = mock_view
-        self._action.si_content = mock_vmware
+        self.mock_hosts(5)
 
         expected_result = {
             'test_host': 'expected_summary',
@@ -197,6 +102,20 @@ class GetHostTestCase(VsphereBaseActionTestCase):
         result = self._action.run(None, None, True)
         self.assertEqual(result, expected_result)
 
+    def test_run_vspheres(self):
+        self.mock_hosts(2)
+
+        expected_hosts = {
+            'test_host': 'expected_summary',
+            'test_host_2': 'expected_summary_2'
+        }
+
+        result = self._action.run(None, None, True, vspheres=['default', 'other'])
+        self.assertEqual(result, {'default': expected_hosts, 'other': expected_hosts})
+        self._action.establish_connection.assert_has_calls([mock.call('default'),
+                                                            mock.call('other')],
+                                                           any_order=True)
+
     def test_run_error(self):
         # host_1 = mock.Mock()
         # host_1_name_property = mock.PropertyMock(return_value='test_host')
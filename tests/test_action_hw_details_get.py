@@ -12,8 +12,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 
-# import yaml
-# from mock import Mock, MagicMock
+import mock
 
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
 
@@ -34,3 +33,18 @@ class GetVMDetailsTestCase(VsphereBaseActionTestCase):
 
         self.assertRaises(ValueError, action.run, vm_ids=None,
                           vm_names=None, vsphere="default")
+
+    def test_run(self):
+        action = self.get_action_instance(self.new_config)
+        action.establish_connection = mock.Mock()
+        action.si_content = mock.Mock()
+        collector = self.mock_property_collector(action.si_content, [
+            (mock.Mock(_moId='vm-1'), {'name': 'vm1', 'summary': 'summary1'}),
+            (mock.Mock(_moId='vm-2'), {'name': 'vm2', 'summary': 'summary2'}),
+            (mock.Mock(_moId='vm-3'), {'name': 'vm3', 'summary': 'summary3'}),
+        ])
+
+        result = action.run(vm_ids=['vm-1'], vm_names=['vm1', 'vm3'], vsphere="default")
+
+        self.assertEqual(result, {'vm1': 'summary1', 'vm3': 'summary3'})
+        self.assertEqual(collector.RetrievePropertiesEx.call_count, 1)
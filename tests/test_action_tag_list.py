@@ -48,6 +48,8 @@ class TagListTestCase(VsphereBaseActionTestCase):
         self.assertEqual(result, expected_result)
         action.tagging.tag_list.assert_called_with(None)
         mock_connect.assert_called_with(vsphere)
+        # the tag name index counters are logged once the action is done
+        action.tagging.index_stats.assert_called_once_with()
 
     @mock.patch("vmwarelib.actions.BaseAction.connect_rest")
     def test_run_category(self, mock_connect):
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 
 import mock
+from pyVmomi import vim  # pylint: disable-msg=E0611
 from vm_bestfit import BestFit
 from st2common.runners.base_action import Action
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
@@ -95,72 +96,64 @@ class BestFitTestCase(VsphereBaseActionTestCase):
         result = self._action.filter_datastores(test_name, 'include_matches', test_filters)
         self.assertEqual(expected_result, result)
 
-    @mock.patch('vmwarelib.inventory.get_managed_entities')
-    @mock.patch('vmwarelib.actions.BaseAction.get_vim_type')
-    def test_get_host_none_available(self, mock_vim_type, mock_entities):
-        test_cluster_name = "cls1"
-        test_vim_type = "vimType"
-        mock_vim_type.return_value = test_vim_type
-
-        # Mock function results
-        mock_host1 = mock.MagicMock()
-        mock_host1.parent.name = "cls2"
-
-        mock_host2 = mock.MagicMock()
-        mock_host2.parent.name = "cls1"
-        mock_host2.runtime.powerState = "poweredOff"
-
-        # Mock a list of 2 hosts that are unavailable
-        test_host_list = [mock_host1, mock_host2]
-        mock_host_list = mock.MagicMock(view=test_host_list)
-        mock_entities.return_value = mock_host_list
+    def mock_host(self, moid, power_state='poweredOn', maintenance=False, vms=0,
+                  datastores=None):
+        return (vim.HostSystem(moid), {'name': 'name-' + moid,
+                                       'runtime.powerState': power_state,
+                                       'runtime.inMaintenanceMode': maintenance,
+                                       'vm': ['vm'] * vms,
+                                       'datastore': [vim.Datastore(ds)
+                                                     for ds in datastores or []]})
+
+    def mock_datastores(self, *datastores):
+        return dict((moid, (vim.Datastore(moid), {'name': name,
+                                                  'summary.maintenanceMode': mode,
+                                                  'info.freeSpace': free}))
+                    for moid, name, mode, free in datastores)
+
+    @mock.patch('vmwarelib.inventory.find_managed_entities')
+    def test_get_cluster(self, mock_find):
+        datacenter = mock.Mock()
+        cluster = mock.Mock()
+        mock_find.side_effect = [[(datacenter, {})], [(cluster, {})]]
+
+        result = self._action.get_cluster('dc1', 'cls1')
+
+        self.assertEqual(result, cluster)
+        # the cluster is only searched for beneath its datacenter
+        mock_find.assert_called_with(self._action.si_content, vim.ComputeResource,
+                                     names=['cls1'], container=datacenter)
+
+    @mock.patch('vmwarelib.inventory.retrieve_type_properties')
+    def test_get_cluster_resources(self, mock_retrieve):
+        host = self.mock_host('host-1')
+        datastores = self.mock_datastores(('datastore-1', 'ds1', 'normal', 10))
+        mock_retrieve.return_value = [host, datastores['datastore-1']]
+
+        result = self._action.get_cluster_resources(vim.ClusterComputeResource('domain-c1'))
+
+        self.assertEqual(result, {'hosts': [host], 'datastores': datastores})
+        # hosts and datastores are read with a single property retrieval
+        self.assertEqual(mock_retrieve.call_count, 1)
+        type_path_sets = mock_retrieve.call_args[0][2]
+        self.assertEqual([t for t, paths in type_path_sets], [vim.HostSystem, vim.Datastore])
+
+    def test_get_host_none_available(self):
+        hosts = [self.mock_host('host-1', power_state='poweredOff'),
+                 self.mock_host('host-2', maintenance=True)]
 
         with self.assertRaises(Exception):
-            self._action.get_host(test_cluster_name)
+            self._action.get_host('cls1', hosts)
 
-            mock_entities.assert_called_with(self._action.si_content, test_vim_type)
+    def test_get_host(self):
+        hosts = [self.mock_host('host-1', vms=2),
+                 # This host will be the expected result since it has the fewest VMs
+                 self.mock_host('host-2', vms=1),
+                 self.mock_host('host-3', vms=0, maintenance=True)]
 
-    @mock.patch('vmwarelib.inventory.get_managed_entities')
-    @mock.patch('vmwarelib.actions.BaseAction.get_vim_type')
-    def test_get_host(self, mock_vim_type, mock_entities):
-        test_cluster_name = "cls1"
-        test_datacetner_name = "dc1"
-        test_vim_type = "vimType"
-        mock_vim_type.return_value = test_vim_type
+        result = self._action.get_host('cls1', hosts)
 
-        # Mock function results
-        mock_host1 = mock.MagicMock()
-        mock_host1.parent.name = "cls1"
-        mock_host1.parent.parent.parent.name = "dc1"
-        mock_host1.runtime.powerState = "poweredOn"
-        mock_host1.runtime.inMaintenanceMode = False
-        mock_host1.vm = ["vm1", "vm2"]
-
-        mock_host2 = mock.MagicMock()
-        mock_host2.parent.name = "cls1"
-        mock_host2.parent.parent.parent.name = "dc1"
-        mock_host2.runtime.powerState = "poweredOn"
-        mock_host2.runtime.inMaintenanceMode = False
-        # This host will be the expected result since it has the fewest VMs
-        mock_host2.vm = ["vm1"]
-
-        mock_host3 = mock.MagicMock()
-        mock_host3.parent.name = "cls1"
-        mock_host3.parent.parent.parent.name = "dc2"
-        mock_host3.runtime.powerState = "poweredOn"
-        mock_host3.runtime.inMaintenanceMode = False
-        # This host will be the expected result since it has the fewest VMs
-        mock_host3.vm = ["vm1"]
-
-        # Mock a list of 2 hosts that are unavailable
-        test_host_list = [mock_host1, mock_host2, mock_host3]
-        mock_host_list = mock.MagicMock(view=test_host_list)
-        mock_entities.return_value = mock_host_list
-
-        result = self._action.get_host(test_datacetner_name, test_cluster_name)
-
-        self.assertEqual(result, mock_host2)
-        mock_entities.assert_called_with(self._action.si_content, test_vim_type)
+        self.assertEqual(result, hosts[1])
 
     @mock.patch('vmwarelib.inventory.get_managed_entity')
     @mock.patch('vmwarelib.actions.BaseAction.get_vim_type')
@@ -168,14 +161,13 @@ class BestFitTestCase(VsphereBaseActionTestCase):
         test_vim_type = "vimType"
         mock_vim_type.return_value = test_vim_type
 
-        test_host = mock.MagicMock()
         test_datastore_filter = ["filter"]
         test_disks = [{"datastore": "fail"}]
 
         # invoke action with invalid names which don't match any objects
         mock_entity.side_effect = Exception("Inventory Error: Unable to Find Object in a test")
         with self.assertRaises(Exception):
-            self._action.get_storage(test_host,
+            self._action.get_storage({}, {},
                                      'exclude_matches',
                                      test_datastore_filter,
                                      test_disks)
@@ -191,59 +183,39 @@ class BestFitTestCase(VsphereBaseActionTestCase):
 
         expected_result = "result"
 
-        mock_host = mock.MagicMock()
-
         mock_entity.return_value = expected_result
 
-        result = self._action.get_storage(mock_host,
+        result = self._action.get_storage({}, {},
                                           'exclude_matches',
                                           test_datastore_filter,
                                           test_disks)
 
-        self.assertEqual(expected_result, result)
+        self.assertEqual((expected_result, "test-ds-1"), result)
         mock_entity.assert_called_with(self._action.si_content, test_vim_type, name="test-ds-1")
 
     @mock.patch('vm_bestfit.BestFit.filter_datastores')
-    @mock.patch('vmwarelib.actions.BaseAction.get_vim_type')
-    def test_get_storage_no_disk(self, mock_vim_type, mock_filter):
-        test_vim_type = "vimType"
-        mock_vim_type.return_value = test_vim_type
-
+    def test_get_storage_no_disk(self, mock_filter):
         test_datastore_filter = ["(?i)(filter)"]
         test_disks = None
 
-        # Mock datastore objects
-        mock_ds1 = mock.MagicMock()
-        type(mock_ds1).name = mock.PropertyMock(return_value="test-ds-1")
-        mock_ds1.summary.maintenanceMode = 'normal'
-        mock_ds1.info.freeSpace = 10
-
-        mock_ds2 = mock.MagicMock()
-        type(mock_ds2).name = mock.PropertyMock(return_value="test-ds-2")
-        mock_ds2.summary.maintenanceMode = 'normal'
-        mock_ds2.info.freeSpace = 20
+        datastores = self.mock_datastores(('ds-1', 'test-ds-1', 'normal', 10),
+                                          ('ds-2', 'test-ds-2', 'normal', 20),
+                                          # This datastore should get filtered out
+                                          ('ds-3', 'test-ds-filter', 'normal', 100),
+                                          # This datastore is not on the host
+                                          ('ds-4', 'test-ds-4', 'normal', 200))
+        host, host_props = self.mock_host('host-1', datastores=['ds-1', 'ds-2', 'ds-3'])
 
-        # This datastre should get filtered out from test_datastore_filter
-        mock_ds3 = mock.MagicMock()
-        type(mock_ds3).name = mock.PropertyMock(return_value="test-ds-filter")
-        mock_ds3.summary.maintenanceMode = 'normal'
-        mock_ds3.info.freeSpace = 100
-
-        # This is the result from filter_datastores function that filters out mock_ds3
+        # This is the result from filter_datastores function that filters out ds-3
         mock_filter.side_effect = [True, True, False]
 
-        # Mock a list of 2 hosts that are unavailable
-        test_ds_list = [mock_ds1, mock_ds2, mock_ds3]
-
-        # Mock host input
-        mock_host = mock.MagicMock(datastore=test_ds_list)
-
-        result = self._action.get_storage(mock_host,
+        result = self._action.get_storage(host_props,
+                                          datastores,
                                           'exclude_matches',
                                           test_datastore_filter,
                                           test_disks)
 
-        self.assertEqual(result, mock_ds2)
+        self.assertEqual(result, (datastores['ds-2'][0], 'test-ds-2'))
         mock_filter.assert_has_calls([mock.call("test-ds-1",
                                                 'exclude_matches',
                                                 test_datastore_filter),
@@ -255,47 +227,26 @@ class BestFitTestCase(VsphereBaseActionTestCase):
                                                 test_datastore_filter)])
 
     @mock.patch('vm_bestfit.BestFit.filter_datastores')
-    @mock.patch('vmwarelib.actions.BaseAction.get_vim_type')
-    def test_get_storage_skip_maintenance_mode(self, mock_vim_type, mock_filter):
-        test_vim_type = "vimType"
-        mock_vim_type.return_value = test_vim_type
-
+    def test_get_storage_skip_maintenance_mode(self, mock_filter):
         test_datastore_filter = []
         test_disks = None
 
-        # Mock datastore objects
-        mock_ds1 = mock.MagicMock()
-        mock_ds1.name = "test-ds-1"
-        mock_ds1.summary.maintenanceMode = 'enteringMaintenance'
-        mock_ds1.info.freeSpace = 10
-
-        mock_ds2 = mock.MagicMock()
-        mock_ds2.name = "test-ds-2"
-        mock_ds2.summary.maintenanceMode = 'inMaintenance'
-        mock_ds2.info.freeSpace = 20
-
-        # This datastore should get filtered out from test_datastore_filter
-        mock_ds3 = mock.MagicMock()
-        mock_ds3.name = "test-ds-3"
-        mock_ds3.summary.maintenanceMode = 'normal'
-        mock_ds3.info.freeSpace = 100
+        datastores = self.mock_datastores(('ds-1', 'test-ds-1', 'enteringMaintenance', 10),
+                                          ('ds-2', 'test-ds-2', 'inMaintenance', 20),
+                                          ('ds-3', 'test-ds-3', 'normal', 100))
+        host, host_props = self.mock_host('host-1', datastores=['ds-1', 'ds-2', 'ds-3'])
 
         # Don't filter anything by name
         mock_filter.side_effect = [True, True, True]
 
-        # Mock a list of 2 hosts that are unavailable
-        test_ds_list = [mock_ds1, mock_ds2, mock_ds3]
-
-        # Mock host input
-        mock_host = mock.MagicMock(datastore=test_ds_list)
-
-        result = self._action.get_storage(mock_host,
+        result = self._action.get_storage(host_props,
+                                          datastores,
                                           'exclude_matches',
                                           test_datastore_filter,
                                           test_disks)
 
-        # mock_ds3 is the only one where maintenanceMode == 'normal'
-        self.assertEqual(result, mock_ds3)
+        # ds-3 is the only one where maintenanceMode == 'normal'
+        self.assertEqual(result, (datastores['ds-3'][0], 'test-ds-3'))
 
         # we should have only called filter on one datastore, the maintenance mode
         # check should have kicked out before testing the other datastores
@@ -303,43 +254,30 @@ class BestFitTestCase(VsphereBaseActionTestCase):
                                                 'exclude_matches',
                                                 test_datastore_filter)])
 
-    @mock.patch('vm_bestfit.BestFit.get_storage')
-    @mock.patch('vm_bestfit.BestFit.get_host')
-    def test_run(self, mock_get_host, mock_get_storage):
+    @mock.patch('vm_bestfit.BestFit.get_cluster_resources')
+    @mock.patch('vm_bestfit.BestFit.get_cluster')
+    def test_run(self, mock_get_cluster, mock_get_resources):
         # Define test variables
         test_ds_filter = ["filter"]
-        test_disks = [{"datastore": "test-ds-1"}]
+        test_disks = [{"datastore": "automatic"}]
         test_vsphere = "vsphere"
 
         test_cluster_name = "test-cluster"
         test_datacenter_name = "test-datacenter"
-        test_host_name = "test-host"
-        test_host_id = "host-123"
-        test_ds_name = "test-ds"
-        test_ds_id = "ds-123"
 
         self._action.establish_connection = mock.Mock()
 
-        # Mock host and datastore result objects
-        mock_host = mock.MagicMock()
-        type(mock_host).name = mock.PropertyMock(return_value=test_host_name)
-        mock_host.parent.name = test_cluster_name
-        mock_host.parent.parent.parent.name = test_datacenter_name
-        mock_host._moId = test_host_id
-
-        mock_get_host.return_value = mock_host
-
-        mock_ds = mock.MagicMock()
-        type(mock_ds).name = mock.PropertyMock(return_value=test_ds_name)
-        mock_ds._moId = test_ds_id
-
-        mock_get_storage.return_value = mock_ds
+        datastores = self.mock_datastores(('ds-1', 'test-ds-1', 'normal', 10),
+                                          ('ds-2', 'test-ds-2', 'normal', 20))
+        hosts = [self.mock_host('host-1', vms=3, datastores=['ds-1', 'ds-2']),
+                 self.mock_host('host-2', vms=1, datastores=['ds-1'])]
+        mock_get_resources.return_value = {'hosts': hosts, 'datastores': datastores}
 
         expected_result = {'clusterName': test_cluster_name,
-                           'hostName': test_host_name,
-                           'hostID': test_host_id,
-                           'datastoreName': test_ds_name,
-                           'datastoreID': test_ds_id}
+                           'hostName': 'name-host-2',
+                           'hostID': 'host-2',
+                           'datastoreName': 'test-ds-1',
+                           'datastoreID': 'ds-1'}
 
         result = self._action.run(test_datacenter_name,
                                   test_cluster_name,
@@ -350,8 +288,134 @@ class BestFitTestCase(VsphereBaseActionTestCase):
 
         self.assertEqual(result, expected_result)
         self._action.establish_connection.assert_called_with(test_vsphere)
-        mock_get_host.assert_called_with(test_datacenter_name, test_cluster_name)
-        mock_get_storage.assert_called_with(mock_host,
-                                            'exclude_matches',
-                                            test_ds_filter,
-                                            test_disks)
+        mock_get_cluster.assert_called_with(test_datacenter_name, test_cluster_name)
+        mock_get_resources.assert_called_with(mock_get_cluster.return_value)
+
+    @mock.patch('vm_bestfit.BestFit.get_cluster_resources')
+    @mock.patch('vm_bestfit.BestFit.get_cluster')
+    def test_run_no_datastore(self, mock_get_cluster, mock_get_resources):
+        datastores = self.mock_datastores(('ds-1', 'test-ds-1', 'inMaintenance', 10))
+        mock_get_resources.return_value = {
+            'hosts': [self.mock_host('host-1', datastores=['ds-1'])],
+            'datastores': datastores}
+
+        with self.assertRaises(Exception):
+            self._action.run('dc1', 'cls1', 'exclude_matches', None, None)
+
+    def test_plan_placements(self):
+        gb = 1024 ** 3
+        datastores = self.mock_datastores(('ds-1', 'test-ds-1', 'normal', 100 * gb),
+                                          ('ds-2', 'test-ds-2', 'normal', 90 * gb))
+        hosts = [self.mock_host('host-1', vms=2, datastores=['ds-1', 'ds-2']),
+                 self.mock_host('host-2', vms=0, datastores=['ds-1', 'ds-2'])]
+        resources = {'hosts': hosts, 'datastores': datastores}
+        vms = [{'name': 'vm%d' % i, 'cpu': 1, 'memory_mb': 1024, 'disk_gb': 30}
+               for i in range(5)]
+
+        result = self._action.plan_placements('cls1', resources, vms, 'exclude_matches', None)
+
+        # the projected load and free space are updated after each placement
+        self.assertEqual([(vm['name'], host._moId, ds._moId)
+                          for vm, host, props, ds, name in result],
+                         [('vm0', 'host-2', 'ds-1'),
+                          ('vm1', 'host-2', 'ds-2'),
+                          ('vm2', 'host-1', 'ds-1'),
+                          ('vm3', 'host-2', 'ds-2'),
+                          ('vm4', 'host-1', 'ds-1')])
+
+    def test_plan_placements_no_space(self):
+        datastores = self.mock_datastores(('ds-1', 'test-ds-1', 'normal', 1024 ** 3))
+        resources = {'hosts': [self.mock_host('host-1', datastores=['ds-1'])],
+                     'datastores': datastores}
+
+        with self.assertRaises(Exception):
+            self._action.plan_placements('cls1', resources, [{'name': 'vm1', 'disk_gb': 2}],
+                                         'exclude_matches', None)
+
+    @mock.patch('vm_bestfit.BestFit.get_cluster_resources')
+    @mock.patch('vm_bestfit.BestFit.get_cluster')
+    def test_run_vms(self, mock_get_cluster, mock_get_resources):
+        datastores = self.mock_datastores(('ds-1', 'test-ds-1', 'normal', 1024 ** 4))
+        mock_get_resources.return_value = {
+            'hosts': [self.mock_host('host-1', datastores=['ds-1'])],
+            'datastores': datastores}
+
+        result = self._action.run('dc1', 'cls1', 'exclude_matches', None, None,
+                                  vms=[{'name': 'vm1', 'disk_gb': 10},
+                                       {'name': 'vm2', 'disk_gb': 10}])
+
+        self.assertEqual(result, [{'name': name,
+                                   'clusterName': 'cls1',
+                                   'hostName': 'name-host-1',
+                                   'hostID': 'host-1',
+                                   'datastoreName': 'test-ds-1',
+                                   'datastoreID': 'ds-1'} for name in ['vm1', 'vm2']])
+        # the whole batch is planned from a single snapshot of the cluster
+        self.assertEqual(mock_get_resources.call_count, 1)
+
+    def mock_host_usage(self, moid, cpu_usage, memory_usage, datastores=None, vms=0):
+        host, props = self.mock_host(moid, vms=vms, datastores=datastores)
+        # 4 cores of 1000 MHz and 1024 MB of memory
+        props.update({'summary.hardware.cpuMhz': 1000,
+                      'summary.hardware.numCpuCores': 4,
+                      'summary.hardware.memorySize': 1024 * 1024 ** 2,
+                      'summary.quickStats.overallCpuUsage': cpu_usage,
+                      'summary.quickStats.overallMemoryUsage': memory_usage})
+        return host, props
+
+    def test_score_host(self):
+        host, props = self.mock_host_usage('host-1', 1000, 256)
+
+        result = self._action.score_host(props, {'vms': 0, 'cpu': 1, 'memory_mb': 256})
+
+        # (1000 + 1 * 1000) / 4000 + (256 + 256) / 1024
+        self.assertEqual(result, 1.0)
+        self.assertEqual(self._action.score_host(props, {'vms': 0, 'cpu': 0, 'memory_mb': 0},
+                                                 {'cpu': 2, 'memory': 0}), 0.5)
+
+    def test_score_datastore(self):
+        props = {'summary.capacity': 100, 'summary.uncommitted': 30}
+
+        # 40 used and 30 more promised to thin provisioned disks
+        self.assertEqual(self._action.score_datastore(props, 60), 0.7)
+        self.assertEqual(self._action.score_datastore(props, 60, {'storage': 2}), 1.4)
+
+    def test_plan_placements_resources(self):
+        gb = 1024 ** 3
+        datastores = self.mock_datastores(('ds-1', 'test-ds-1', 'normal', 50 * gb),
+                                          ('ds-2', 'test-ds-2', 'normal', 40 * gb))
+        for moid, (ds, props) in datastores.items():
+            props['summary.capacity'] = 100 * gb
+            props['summary.uncommitted'] = 5 * gb if moid == 'ds-2' else 20 * gb
+        # host-1 has the fewest VMs, but host-2 has the most headroom
+        hosts = [self.mock_host_usage('host-1', 3000, 768, ['ds-1', 'ds-2'], vms=1),
+                 self.mock_host_usage('host-2', 0, 0, ['ds-1', 'ds-2'], vms=10)]
+        resources = {'hosts': hosts, 'datastores': datastores}
+        vms = [{'name': 'vm%d' % i, 'cpu': 1, 'memory_mb': 256, 'disk_gb': 10}
+               for i in range(3)]
+
+        result = self._action.plan_placements('cls1', resources, vms, 'exclude_matches', None,
+                                              scoring='resources')
+
+        # ds-1 is 70% provisioned and ds-2 65%, the datastore the last VM was placed
+        # on is the more provisioned one for the next VM
+        self.assertEqual([(vm['name'], host._moId, ds._moId)
+                          for vm, host, props, ds, name in result],
+                         [('vm0', 'host-2', 'ds-2'),
+                          ('vm1', 'host-2', 'ds-1'),
+                          ('vm2', 'host-2', 'ds-2')])
+
+    @mock.patch('vm_bestfit.BestFit.get_cluster_resources')
+    @mock.patch('vm_bestfit.BestFit.get_cluster')
+    def test_run_resources(self, mock_get_cluster, mock_get_resources):
+        datastores = self.mock_datastores(('ds-1', 'test-ds-1', 'normal', 10))
+        mock_get_resources.return_value = {
+            'hosts': [self.mock_host_usage('host-1', 3000, 768, ['ds-1'], vms=1),
+                      self.mock_host_usage('host-2', 1000, 256, ['ds-1'], vms=10)],
+            'datastores': datastores}
+
+        result = self._action.run('dc1', 'cls1', 'exclude_matches', None, None,
+                                  scoring='resources')
+
+        self.assertEqual(result['hostID'], 'host-2')
+        self.assertEqual(result['datastoreID'], 'ds-1')
@@ -36,9 +36,9 @@ class VMCheckToolsTestCase(VsphereBaseActionTestCase):
         self._action.establish_connection = mock.Mock()
         self._action.si_content = mock.Mock()
 
-    @mock.patch("vm_check_tools.json")
+    @mock.patch("vm_check_tools.DEFAULT_SERIALIZER")
     @mock.patch("vmwarelib.inventory.get_virtualmachine")
-    def test_run(self, mock_get_virtualmachine, mock_json):
+    def test_run(self, mock_get_virtualmachine, mock_serializer):
         test_vm_id = "test_vm"
         test_dict = {
             'test_option': 'value',
@@ -50,7 +50,7 @@ class VMCheckToolsTestCase(VsphereBaseActionTestCase):
         expected_result = test_dict
         expected_result['status'] = test_status
 
-        mock_json.loads.return_value = test_dict
+        mock_serializer.serialize.return_value = test_dict
         mock_runtime = mock.Mock(powerState='poweredOn')
         mock_guest = mock.Mock(toolsRunningStatus='guestToolsRunning',
                               toolsVersionStatus2='installed')
@@ -63,9 +63,9 @@ class VMCheckToolsTestCase(VsphereBaseActionTestCase):
         result_value = self._action.run(test_vm_id)
         self.assertEqual(result_value, expected_result)
 
-    @mock.patch("vm_check_tools.json")
+    @mock.patch("vm_check_tools.DEFAULT_SERIALIZER")
     @mock.patch("vmwarelib.inventory.get_virtualmachine")
-    def test_run_powered_off(self, mock_get_virtualmachine, mock_json):
+    def test_run_powered_off(self, mock_get_virtualmachine, mock_serializer):
         test_vm_id = "test_vm"
         test_dict = {
             'test_option': 'value',
@@ -76,7 +76,7 @@ class VMCheckToolsTestCase(VsphereBaseActionTestCase):
         expected_result = test_dict
         expected_result['status'] = 'poweredOff'
 
-        mock_json.loads.return_value = test_dict
+        mock_serializer.serialize.return_value = test_dict
         mock_runtime = mock.Mock(powerState='poweredOff')
         mock_guest = mock.Mock(toolsRunningStatus='guestToolsRunning',
                               toolsVersionStatus2='installed')
@@ -89,9 +89,9 @@ class VMCheckToolsTestCase(VsphereBaseActionTestCase):
         result_value = self._action.run(test_vm_id)
         self.assertEqual(result_value, expected_result)
 
-    @mock.patch("vm_check_tools.json")
+    @mock.patch("vm_check_tools.DEFAULT_SERIALIZER")
     @mock.patch("vmwarelib.inventory.get_virtualmachine")
-    def test_run_tools_not_installed(self, mock_get_virtualmachine, mock_json):
+    def test_run_tools_not_installed(self, mock_get_virtualmachine, mock_serializer):
         test_vm_id = "test_vm"
         test_dict = {
             'test_option': 'value',
@@ -102,7 +102,7 @@ class VMCheckToolsTestCase(VsphereBaseActionTestCase):
         expected_result = test_dict
         expected_result['status'] = 'guestToolsNotInstalled'
 
-        mock_json.loads.return_value = test_dict
+        mock_serializer.serialize.return_value = test_dict
         mock_runtime = mock.Mock(powerState='poweredOn')
         mock_guest = mock.Mock(toolsVersionStatus2='guestToolsNotInstalled')
         mock_vm = mock.Mock()
@@ -14,7 +14,6 @@
 
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
 from vm_config_info_get import GetVMConfigInfo
-from vmwarelib.serialize import MyJSONEncoder
 import mock
 
 
@@ -33,9 +32,9 @@ class GetVMConfigInfoTestCase(VsphereBaseActionTestCase):
         self.assertRaises(ValueError, action.run, vm_ids=None,
                           vm_names=None, vsphere="default")
 
-    @mock.patch('vm_config_info_get.json')
+    @mock.patch('vm_config_info_get.DEFAULT_SERIALIZER')
     @mock.patch('vmwarelib.inventory.get_virtualmachine')
-    def test_run_vm_ids(self, mock_inventory, mock_json):
+    def test_run_vm_ids(self, mock_inventory, mock_serializer):
         action = self.get_action_instance(self.new_config)
         action.si_content = mock.Mock()
         action.establish_connection = mock.Mock()
@@ -51,13 +50,12 @@ class GetVMConfigInfoTestCase(VsphereBaseActionTestCase):
         type(mock_vm2).name = mock.PropertyMock(return_value="mock-vm2-name")
         mock_vm2.config = 'guest2'
 
-        # Give return values to json functions
-        mock_json.dumps.side_effect = ['dumps1', 'dumps2']
-        mock_json.loads.side_effect = ['loads1', 'loads2']
+        # Give return values to the serializer
+        mock_serializer.serialize.side_effect = ['serialized1', 'serialized2']
 
         expected_result = {
-            'mock-vm1-name': 'loads1',
-            'mock-vm2-name': 'loads2'
+            'mock-vm1-name': 'serialized1',
+            'mock-vm2-name': 'serialized2'
         }
 
         mock_inventory.side_effect = [mock_vm1, mock_vm2]
@@ -72,14 +70,12 @@ class GetVMConfigInfoTestCase(VsphereBaseActionTestCase):
         action.establish_connection.assert_called_with("vsphere")
 
         # The values from the following calls are from the side effects above
-        mock_json.dumps.assert_has_calls([mock.call('guest1', cls=MyJSONEncoder),
-                                          mock.call('guest2', cls=MyJSONEncoder)])
-        mock_json.loads.assert_has_calls([mock.call('dumps1'),
-                                          mock.call('dumps2')])
+        mock_serializer.serialize.assert_has_calls([mock.call('guest1'),
+                                                   mock.call('guest2')])
 
-    @mock.patch('vm_config_info_get.json')
+    @mock.patch('vm_config_info_get.DEFAULT_SERIALIZER')
     @mock.patch('vmwarelib.inventory.get_virtualmachine')
-    def test_run_vm_names(self, mock_inventory, mock_json):
+    def test_run_vm_names(self, mock_inventory, mock_serializer):
         action = self.get_action_instance(self.new_config)
         action.si_content = mock.Mock()
         action.establish_connection = mock.Mock()
@@ -95,13 +91,12 @@ class GetVMConfigInfoTestCase(VsphereBaseActionTestCase):
         type(mock_vm2).name = mock.PropertyMock(return_value="mock-vm2-name")
         mock_vm2.config = 'guest2'
 
-        # Give return values to json functions
-        mock_json.dumps.side_effect = ['dumps1', 'dumps2']
-        mock_json.loads.side_effect = ['loads1', 'loads2']
+        # Give return values to the serializer
+        mock_serializer.serialize.side_effect = ['serialized1', 'serialized2']
 
         expected_result = {
-            'mock-vm1-name': 'loads1',
-            'mock-vm2-name': 'loads2'
+            'mock-vm1-name': 'serialized1',
+            'mock-vm2-name': 'serialized2'
         }
 
         mock_inventory.side_effect = [mock_vm1, mock_vm2]
@@ -116,7 +111,5 @@ class GetVMConfigInfoTestCase(VsphereBaseActionTestCase):
         action.establish_connection.assert_called_with("vsphere")
 
         # The values from the following calls are from the side effects above
-        mock_json.dumps.assert_has_calls([mock.call('guest1', cls=MyJSONEncoder),
-                                          mock.call('guest2', cls=MyJSONEncoder)])
-        mock_json.loads.assert_has_calls([mock.call('dumps1'),
-                                          mock.call('dumps2')])
+        mock_serializer.serialize.assert_has_calls([mock.call('guest1'),
+                                                   mock.call('guest2')])
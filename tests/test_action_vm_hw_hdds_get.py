@@ -18,7 +18,6 @@ import mock
 # from vmwarelib import inventory
 from vm_hw_hdds_get import VMGetHDDs
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
-from vmwarelib.serialize import MyJSONEncoder
 from pyVmomi import vim  # pylint: disable-msg=E0611
 
 __all__ = [
@@ -38,10 +37,10 @@ class VMGetHDDsTestCase(VsphereBaseActionTestCase):
         self._action.establish_connection = mock.Mock()
         self._action.si_content = mock.Mock()
 
-    @mock.patch("vm_hw_hdds_get.json")
+    @mock.patch("vm_hw_hdds_get.DEFAULT_SERIALIZER")
     @mock.patch("vmwarelib.checkinputs.one_of_two_strings")
     @mock.patch("vmwarelib.inventory.get_virtualmachine")
-    def test_run(self, mock_inventory, mock_check_inputs, mock_json):
+    def test_run(self, mock_inventory, mock_check_inputs, mock_serializer):
         # Define test variables
         test_vm_id = "vm-123"
         test_vm_name = "test.vm.name"
@@ -56,10 +55,8 @@ class VMGetHDDsTestCase(VsphereBaseActionTestCase):
         vm_mock = mock.Mock(config=config_mock)
         mock_inventory.return_value = vm_mock
 
-        json_string = "test json string"
-        mock_json.dumps.return_value = json_string
         expected_result = "result"
-        mock_json.loads.return_value = expected_result
+        mock_serializer.serialize.return_value = expected_result
 
         result = self._action.run(test_vm_id, test_vm_name, test_vsphere)
 
@@ -67,5 +64,4 @@ class VMGetHDDsTestCase(VsphereBaseActionTestCase):
         mock_check_inputs.assert_called_with(test_vm_id, test_vm_name, "ID or Name")
         mock_inventory.assert_called_with(self._action.si_content, test_vm_id, test_vm_name)
         self._action.establish_connection.assert_called_with(test_vsphere)
-        mock_json.dumps.assert_called_with(device, cls=MyJSONEncoder)
-        mock_json.loads.assert_called_with(json_string)
+        mock_serializer.serialize.assert_called_with(device)
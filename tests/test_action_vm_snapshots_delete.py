@@ -16,6 +16,7 @@ import mock
 from vm_snapshots_delete import VMSnapshotsDelete
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
 import re
+from six.moves import queue
 
 __all__ = [
     'VMSnapshotsDeleteTestCase'
@@ -59,140 +60,238 @@ class VMSnapshotsDeleteTestCase(VsphereBaseActionTestCase):
         result = self._action.matches_pattern_list(test_name, test_pattern_list)
         self.assertEqual(result, False)
 
+    def mock_snapshot(self, name, create_time=1, state='success', error=None, children=None):
+        snap = mock.MagicMock(createTime=create_time, childSnapshotList=children or [])
+        type(snap).name = mock.PropertyMock(return_value=name)
+        task = mock.Mock(_moId='task-' + name)
+        task.props = {'info.state': state, 'info.error': error}
+        snap.snapshot.RemoveSnapshot_Task.return_value = task
+        return snap
+
     @mock.patch('vm_snapshots_delete.datetime')
-    @mock.patch('vmwarelib.inventory.get_virtualmachines')
-    def test_delete_old_snapshots(self, mock_inventory, mock_datetime):
+    def test_find_old_snapshots(self, mock_datetime):
         # Define test variables
         test_max_age_days = 2
         test_name_ignore_regexes = [re.compile("^.*IGNORE$")]
 
         # Mock 3 snapshot objects and make one of them a child
-        mock_snap1 = mock.MagicMock(createTime=1)
-        type(mock_snap1).name = mock.PropertyMock(return_value="snap1")
-        mock_snap1.vm.name = "vm1"
-        mock_snap1.snapshot.RemoveSnapshot_Task.return_value = "test"
-
-        mock_snap2 = mock.MagicMock(createTime=1)
-        type(mock_snap2).name = mock.PropertyMock(return_value="snap2")
-        mock_snap2.vm.name = "vm2"
-        mock_snap2.snapshot.RemoveSnapshot_Task.return_value = "test"
-
-        mock_child_snap = mock.MagicMock(createTime=1)
-        type(mock_child_snap).name = mock.PropertyMock(return_value="ignore_snap IGNORE")
-        mock_child_snap.vm.name = "vm3"
-        mock_child_snap.snapshot.RemoveSnapshot_Task.return_value = "test"
-
-        mock_snap2.childSnapshotList = [mock_child_snap]
+        mock_snap1 = self.mock_snapshot("snap1")
+        mock_child_snap = self.mock_snapshot("ignore_snap IGNORE")
+        mock_snap2 = self.mock_snapshot("snap2", children=[mock_child_snap])
 
         mock_datetime.datetime.utcnow().replace.return_value = 3
         mock_datetime.timedelta.return_value = 1
 
-        # Mock a list of 3 "snapshots"
-        test_snap_list = [mock_snap1, mock_snap2]
-
-        expected_result = {'deleted_snapshots': ["vm1: snap1", "vm2: snap2"],
-                           'ignored_snapshots': ["vm3: ignore_snap IGNORE"]}
+        expected_result = {'old_snapshots': [mock_snap1, mock_snap2],
+                           'ignored_snapshots': ["vm1: ignore_snap IGNORE"]}
 
         # Run function and verify results
-        result = self._action.delete_old_snapshots(test_snap_list,
-                                                   test_max_age_days,
-                                                   test_name_ignore_regexes)
+        result = self._action.find_old_snapshots([mock_snap1, mock_snap2],
+                                                 test_max_age_days,
+                                                 test_name_ignore_regexes,
+                                                 "vm1")
 
         self.assertEqual(result, expected_result)
         mock_datetime.timedelta.assert_called_with(days=test_max_age_days)
-        mock_snap1.snapshot.RemoveSnapshot_Task.assert_called_with(removeChildren=False,
-                                                                   consolidate=True)
-        mock_snap2.snapshot.RemoveSnapshot_Task.assert_called_with(removeChildren=False,
-                                                                   consolidate=True)
+        # finding the snapshots does not remove them
+        self.assertFalse(mock_snap1.snapshot.RemoveSnapshot_Task.called)
 
     @mock.patch('vm_snapshots_delete.datetime')
-    @mock.patch('vmwarelib.inventory.get_virtualmachines')
-    def test_delete_old_snapshots_encoding(self, mock_inventory, mock_datetime):
-        # Define test variables
-        test_max_age_days = 2
+    def test_find_old_snapshots_encoding(self, mock_datetime):
         test_name_ignore_regexes = [re.compile("^.*IGNORE$")]
 
-        # Mock 3 snapshot objects and make one of them a child
-        mock_snap1 = mock.MagicMock(createTime=1)
-        type(mock_snap1).name = mock.PropertyMock(return_value="VM Snapshot 11%252f13%252f2019")
-        mock_snap1.vm.name = "vm1"
-        mock_snap1.snapshot.RemoveSnapshot_Task.return_value = "test"
-
-        mock_snap2 = mock.MagicMock(createTime=1)
-        type(mock_snap2).name = mock.PropertyMock(return_value="snap2")
-        mock_snap2.vm.name = "vm2"
-        mock_snap2.snapshot.RemoveSnapshot_Task.return_value = "test"
-
-        mock_child_snap = mock.MagicMock(createTime=1)
-        child_snap_name = "VM Snapshot 11%252f1325%252f2019 IGNORE"
-        type(mock_child_snap).name = mock.PropertyMock(return_value=child_snap_name)
-        mock_child_snap.vm.name = "vm3"
-        mock_child_snap.snapshot.RemoveSnapshot_Task.return_value = "test"
-
-        mock_snap2.childSnapshotList = [mock_child_snap]
+        mock_snap1 = self.mock_snapshot("VM Snapshot 11%252f13%252f2019")
+        mock_child_snap = self.mock_snapshot("VM Snapshot 11%252f1325%252f2019 IGNORE")
+        mock_snap2 = self.mock_snapshot("snap2", children=[mock_child_snap])
 
         mock_datetime.datetime.utcnow().replace.return_value = 3
         mock_datetime.timedelta.return_value = 1
 
-        # Mock a list of 3 "snapshots"
-        test_snap_list = [mock_snap1, mock_snap2]
+        result = self._action.find_old_snapshots([mock_snap1, mock_snap2], 2,
+                                                 test_name_ignore_regexes, "vm1")
+
+        self.assertEqual(result, {
+            'old_snapshots': [mock_snap1, mock_snap2],
+            'ignored_snapshots': ["vm1: VM Snapshot 11%252f1325%252f2019 IGNORE"]})
+
+    def mock_task_queue(self, mock_tracker, mock_queue):
+        """Completes the removal tasks in the order they were started, whenever the
+        action waits for the next one, and records how many ran at once. Each
+        completion takes 10 seconds of the mocked clock, and a wait on tasks that
+        never complete lasts the whole timeout
+        """
+        state = {'running': [], 'max_running': 0, 'max_per_datastore': 0, 'datastores': {},
+                 'now': 0}
+
+        def track(task):
+            state['running'].append(task)
+            state['max_running'] = max(state['max_running'], len(state['running']))
+            load = {}
+            for running in state['running']:
+                for ds in state['datastores'][running._moId]:
+                    load[ds] = load.get(ds, 0) + 1
+            state['max_per_datastore'] = max([state['max_per_datastore']] + list(load.values()))
+
+        def get(timeout=None):
+            state['timeout'] = timeout
+            done = [task for task in state['running'] if task.props is not None]
+            if not done:
+                self.assertIsNotNone(timeout, 'waiting forever for a stuck removal')
+                state['now'] += timeout
+                raise queue.Empty()
+            state['running'].remove(done[0])
+            state['now'] += 10
+            return done[0], done[0].props
+
+        mock_tracker.return_value.track.side_effect = track
+        mock_queue.return_value.get.side_effect = get
+        patcher = mock.patch('vm_snapshots_delete.time.time', side_effect=lambda: state['now'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return state
+
+    @mock.patch('vm_snapshots_delete.queue.Queue')
+    @mock.patch('vmwarelib.tasks.TaskTracker')
+    def test_delete_snapshots(self, mock_tracker, mock_queue):
+        state = self.mock_task_queue(mock_tracker, mock_queue)
+
+        vms = []
+        for i in range(6):
+            snaps = [self.mock_snapshot('vm%d-snap%d' % (i, j)) for j in range(2)]
+            vms.append({'name': 'vm%d' % i,
+                        'datastores': ['datastore-%d' % (i % 2)],
+                        'snapshots': snaps})
+            for snap in snaps:
+                task = snap.snapshot.RemoveSnapshot_Task.return_value
+                state['datastores'][task._moId] = vms[-1]['datastores']
+        vms[5]['snapshots'][1].snapshot.RemoveSnapshot_Task.return_value.props = {
+            'info.state': 'error', 'info.error': mock.Mock(msg='consolidation failed')}
+
+        result = self._action.delete_snapshots(vms, max_concurrent=3, max_per_datastore=2)
+
+        self.assertEqual(len(result), 12)
+        self.assertIsNone(state['timeout'])
+        self.assertEqual(state['max_running'], 3)
+        self.assertEqual(state['max_per_datastore'], 2)
+        # the snapshots of a VM are removed in order, one at a time
+        for vm in vms:
+            names = [r['snapshot'] for r in result if r['vm'] == vm['name']]
+            self.assertEqual(names, ['%s-snap0' % vm['name'], '%s-snap1' % vm['name']])
+        failed = [r for r in result if r['state'] != 'success']
+        self.assertEqual(failed, [{'vm': 'vm5', 'snapshot': 'vm5-snap1', 'state': 'error',
+                                   'duration': failed[0]['duration'],
+                                   'error': 'consolidation failed'}])
+        mock_tracker.return_value.stop.assert_called_with()
+
+    @mock.patch('vm_snapshots_delete.queue.Queue')
+    @mock.patch('vmwarelib.tasks.TaskTracker')
+    def test_delete_snapshots_task_error(self, mock_tracker, mock_queue):
+        state = self.mock_task_queue(mock_tracker, mock_queue)
+
+        snap1 = self.mock_snapshot('snap1')
+        snap1.snapshot.RemoveSnapshot_Task.side_effect = Exception('already deleted')
+        snap2 = self.mock_snapshot('snap2')
+        state['datastores']['task-snap2'] = ['datastore-1']
+
+        result = self._action.delete_snapshots([{'name': 'vm1',
+                                                 'datastores': ['datastore-1'],
+                                                 'snapshots': [snap1, snap2]}])
+
+        self.assertEqual([(r['snapshot'], r['state'], r.get('error')) for r in result],
+                         [('snap1', 'error', 'already deleted'), ('snap2', 'success', None)])
+
+    @mock.patch('vm_snapshots_delete.queue.Queue')
+    @mock.patch('vmwarelib.tasks.TaskTracker')
+    def test_delete_snapshots_timeout(self, mock_tracker, mock_queue):
+        state = self.mock_task_queue(mock_tracker, mock_queue)
+
+        vms = []
+        for i in range(3):
+            snaps = [self.mock_snapshot('vm%d-snap%d' % (i, j)) for j in range(2)]
+            vms.append({'name': 'vm%d' % i, 'datastores': ['datastore-1'], 'snapshots': snaps})
+            for snap in snaps:
+                state['datastores'][snap.snapshot.RemoveSnapshot_Task.return_value._moId] = \
+                    ['datastore-1']
+        # the removal of the first snapshot of vm1 never completes
+        vms[1]['snapshots'][0].snapshot.RemoveSnapshot_Task.return_value.props = None
+
+        stuck = vms[1]['snapshots'][0].snapshot.RemoveSnapshot_Task.return_value
+        stuck.CancelTask.side_effect = Exception('task cannot be cancelled')
+
+        result = self._action.delete_snapshots(vms, max_per_datastore=2, task_timeout=60)
+
+        # the other removals go on and only the stuck one waits for its own deadline,
+        # 60 seconds after it started while 40 seconds went by completing the others
+        self.assertEqual(state['timeout'], 20)
+        self.assertEqual([(r['snapshot'], r['state'], r.get('error')) for r in result],
+                         [('vm0-snap0', 'success', None),
+                          ('vm0-snap1', 'success', None),
+                          ('vm2-snap0', 'success', None),
+                          ('vm2-snap1', 'success', None),
+                          ('vm1-snap0', 'timeout',
+                           'snapshot removal did not complete within 60 seconds'),
+                          ('vm1-snap1', 'skipped',
+                           'an earlier snapshot removal of the VM timed out')])
+        self.assertEqual(result[4]['duration'], 60)
+        stuck.CancelTask.assert_called_once_with()
+        vms[1]['snapshots'][1].snapshot.RemoveSnapshot_Task.assert_not_called()
+        mock_tracker.return_value.stop.assert_called_with()
+
+    @mock.patch('vm_snapshots_delete.VMSnapshotsDelete.delete_snapshots')
+    @mock.patch('vm_snapshots_delete.datetime')
+    def test_delete_old_snapshots(self, mock_datetime, mock_delete):
+        mock_datetime.datetime.utcnow().replace.return_value = 3
+        mock_datetime.timedelta.return_value = 1
 
-        expected_result = {'deleted_snapshots': ["vm1: VM Snapshot 11%252f13%252f2019",
-                                                 "vm2: snap2"],
-                           'ignored_snapshots': ["vm3: VM Snapshot 11%252f1325%252f2019 IGNORE"]}
+        mock_snap1 = self.mock_snapshot("snap1")
+        mock_snap2 = self.mock_snapshot("snap2 IGNORE")
+        mock_delete.return_value = [
+            {'vm': 'vm1', 'snapshot': 'snap1', 'state': 'success', 'duration': 1.0}]
 
-        # Run function and verify results
-        result = self._action.delete_old_snapshots(test_snap_list,
-                                                   test_max_age_days,
-                                                   test_name_ignore_regexes)
+        vms = [{'name': 'vm1', 'datastores': ['datastore-1'],
+                'snapshots': [mock_snap1, mock_snap2]}]
+        result = self._action.delete_old_snapshots(vms, 2, [re.compile("^.*IGNORE$")],
+                                                   max_concurrent=5, max_per_datastore=1)
 
-        self.assertEqual(result, expected_result)
-        mock_datetime.timedelta.assert_called_with(days=test_max_age_days)
-        mock_snap1.snapshot.RemoveSnapshot_Task.assert_called_with(removeChildren=False,
-                                                                   consolidate=True)
-        mock_snap2.snapshot.RemoveSnapshot_Task.assert_called_with(removeChildren=False,
-                                                                   consolidate=True)
+        self.assertEqual(result, {'deleted_snapshots': ["vm1: snap1"],
+                                  'ignored_snapshots': ["vm1: snap2 IGNORE"],
+                                  'failed_snapshots': [],
+                                  'results': mock_delete.return_value})
+        mock_delete.assert_called_with([{'name': 'vm1', 'datastores': ['datastore-1'],
+                                         'snapshots': [mock_snap1]}], 5, 1, None)
 
     @mock.patch('vm_snapshots_delete.VMSnapshotsDelete.delete_old_snapshots')
-    @mock.patch('vmwarelib.inventory.get_virtualmachines')
+    @mock.patch('vmwarelib.inventory.get_entity_properties')
     def test_delete_all_old_snapshots(self, mock_inventory, mock_delete):
         # Define test variables
         test_max_age_days = 2
         test_name_ignore_regexes = ["^.*IGNORE$"]
 
-        expected_result = {'deleted_snapshots': ["snap1", "snap2"],
-                           'ignored_snapshots': []}
-
-        # Mock function results
-        mock_vm1 = mock.MagicMock()
-        mock_vm1.snapshot.rootSnapshotList = ["snap1"]
-
-        mock_vm2 = mock.MagicMock()
-        mock_vm2.snapshot.rootSnapshotList = ["snap2"]
-
-        mock_vm_no_snaps = mock.MagicMock()
-        vm_name_property = mock.PropertyMock(return_value="vm_name")
-        type(mock_vm_no_snaps).name = vm_name_property
-        mock_vm_no_snaps.snapshot = "vm_no_snaps"
-
-        # Mock a list of 2 VMs with "snapshots" and one without
-        test_vm_list = [mock_vm_no_snaps, mock_vm1, mock_vm2]
-        mock_vm_list = mock.MagicMock(view=test_vm_list)
-        mock_inventory.return_value = mock_vm_list
-
-        side_effect = [{'deleted_snapshots': ["snap1"], 'ignored_snapshots': []},
-                       {'deleted_snapshots': ["snap2"], 'ignored_snapshots': []}]
-        mock_delete.side_effect = side_effect
+        # Mock 2 VMs with "snapshots" and one without
+        mock_inventory.return_value = [
+            (mock.Mock(), {'name': 'vm_no_snaps', 'datastore': []}),
+            (mock.Mock(), {'name': 'vm1',
+                           'datastore': [mock.Mock(_moId='datastore-1')],
+                           'snapshot': mock.Mock(rootSnapshotList=['snap1'])}),
+            (mock.Mock(), {'name': 'vm2',
+                           'datastore': [mock.Mock(_moId='datastore-2')],
+                           'snapshot': mock.Mock(rootSnapshotList=['snap2'])}),
+        ]
+        mock_delete.return_value = 'result'
 
         # Run function and verify results
-        result = self._action.delete_all_old_snapshots(test_max_age_days, test_name_ignore_regexes)
+        result = self._action.delete_all_old_snapshots(test_max_age_days,
+                                                       test_name_ignore_regexes)
 
-        self.assertEqual(result, expected_result)
-        mock_inventory.assert_called_with(self._action.si_content)
+        self.assertEqual(result, 'result')
+        # the snapshot trees of every VM are read with a single query
+        self.assertEqual(mock_inventory.call_count, 1)
+        self.assertIn('snapshot', mock_inventory.call_args[1]['path_set'])
 
-        calls = [mock.call(["snap1"], test_max_age_days, test_name_ignore_regexes),
-                 mock.call(["snap2"], test_max_age_days, test_name_ignore_regexes)]
-        mock_delete.assert_has_calls(calls)
+        expected_vms = [{'name': 'vm1', 'datastores': ['datastore-1'], 'snapshots': ['snap1']},
+                        {'name': 'vm2', 'datastores': ['datastore-2'], 'snapshots': ['snap2']}]
+        mock_delete.assert_called_with(expected_vms, test_max_age_days,
+                                       test_name_ignore_regexes, 10, 2, None)
 
     @mock.patch('vm_snapshots_delete.VMSnapshotsDelete.compile_regexes')
     @mock.patch('vmwarelib.inventory.get_virtualmachine')
@@ -271,7 +370,8 @@ class VMSnapshotsDeleteTestCase(VsphereBaseActionTestCase):
 
         self.assertEqual(result, expected_result)
         mock_compile_regexes.assert_called_with(test_name_ignore_regexes)
-        mock_delete_all_snaps.assert_called_with(test_max_age_days, test_patterns)
+        mock_delete_all_snaps.assert_called_with(test_max_age_days, test_patterns, 10, 2,
+                                                 None)
 
     @mock.patch('vm_snapshots_delete.VMSnapshotsDelete.compile_regexes')
     @mock.patch('vm_snapshots_delete.VMSnapshotsDelete.delete_old_snapshots')
@@ -294,6 +394,8 @@ class VMSnapshotsDeleteTestCase(VsphereBaseActionTestCase):
         mock_vm = mock.MagicMock()
         mock_inventory.return_value = mock_vm
 
+        type(mock_vm).name = mock.PropertyMock(return_value=test_vm_name)
+        mock_vm.datastore = [mock.Mock(_moId='datastore-1')]
         mock_vm.snapshot.rootSnapshotList = test_snap_list
 
         # Run function and verify results
@@ -305,5 +407,9 @@ class VMSnapshotsDeleteTestCase(VsphereBaseActionTestCase):
 
         self.assertEqual(result, expected_result)
         mock_inventory.assert_called_with(self._action.si_content, moid=None, name=test_vm_name)
-        mock_delete_snaps.assert_called_with(test_snap_list, test_max_age_days, test_patterns)
+        expected_vms = [{'name': test_vm_name,
+                         'datastores': ['datastore-1'],
+                         'snapshots': test_snap_list}]
+        mock_delete_snaps.assert_called_with(expected_vms, test_max_age_days, test_patterns,
+                                             10, 2, None)
         mock_compile_regexes.assert_called_with(test_name_ignore_regexes)
@@ -12,7 +12,9 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 
+import datetime
 import mock
+import pytz  # pylint: disable=import-error
 from vm_snapshots_get import VMSnapshotsGet
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
 
@@ -127,3 +129,63 @@ class VMSnapshotsGetTestCase(VsphereBaseActionTestCase):
                                                  "id": 101,
                                                  "description": "snap_description2"}]}]
         self.assertEqual(result, expected_result)
+
+    def mock_fleet_snapshot(self, create_time, children=None):
+        return mock.Mock(createTime=create_time, childSnapshotList=children or [])
+
+    @mock.patch('vm_snapshots_get.datetime')
+    @mock.patch('vmwarelib.inventory.iter_entity_properties')
+    def test_run_fleet(self, mock_inventory, mock_datetime):
+        self._action = self.get_action_instance(self.new_config)
+        self._action.establish_connection = mock.Mock()
+        self._action.si_content = mock.Mock()
+
+        now = datetime.datetime(2020, 1, 11, tzinfo=pytz.UTC)
+        mock_datetime.datetime.utcnow.return_value.replace.return_value = now
+        oldest = datetime.datetime(2020, 1, 1, tzinfo=pytz.UTC)
+        newest = datetime.datetime(2020, 1, 6, tzinfo=pytz.UTC)
+        root = self.mock_fleet_snapshot(oldest, [self.mock_fleet_snapshot(newest)])
+
+        mock_inventory.return_value = iter([
+            (mock.Mock(_moId='vm-1'), {'name': 'vm1'}),
+            (mock.Mock(_moId='vm-2'), {'name': 'vm2',
+                                       'snapshot': mock.Mock(rootSnapshotList=[root]),
+                                       'layoutEx.file': self.generate_mock_vm().layoutEx.file}),
+        ])
+
+        result = self._action.run(vm_id=None, vm_name=None, flat=True)
+
+        self.assertEqual(result, [{'vm_moid': 'vm-2',
+                                   'vm_name': 'vm2',
+                                   'snapshot_count': 2,
+                                   'oldest_created': str(oldest),
+                                   'newest_created': str(newest),
+                                   'age_days': 10.0,
+                                   'size_gb': 5.0}])
+        # every VM is read with a single property retrieval
+        self.assertEqual(mock_inventory.call_count, 1)
+        self.assertEqual(mock_inventory.call_args[1]['path_set'],
+                         ['name', 'snapshot', 'layoutEx.file'])
+        self.assertIsNone(mock_inventory.call_args[1]['container'])
+
+    @mock.patch('vmwarelib.inventory.iter_entity_properties')
+    def test_run_fleet_cluster(self, mock_inventory):
+        self._action = self.get_action_instance(self.new_config)
+        self._action.establish_connection = mock.Mock()
+        self._action.si = mock.Mock()
+        self._action.si_content = mock.Mock()
+        mock_inventory.return_value = iter([])
+
+        result = self._action.run(vm_id=None, vm_name=None, flat=True, cluster_id='domain-c1')
+
+        self.assertEqual(result, [])
+        self.assertEqual(mock_inventory.call_args[1]['container']._moId, 'domain-c1')
+
+    def test_run_fleet_folder_and_cluster(self):
+        self._action = self.get_action_instance(self.new_config)
+        self._action.establish_connection = mock.Mock()
+        self._action.si = mock.Mock()
+
+        with self.assertRaises(ValueError):
+            self._action.run(vm_id=None, vm_name=None, flat=True,
+                             folder_id='group-v1', cluster_id='domain-c1')
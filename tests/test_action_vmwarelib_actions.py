@@ -12,9 +12,13 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 
+import threading
+
 import mock
+from pyVmomi import vim  # pylint: disable-msg=E0611
 from vsphere_base_action_test_case import VsphereBaseActionTestCase
 from get_objects_with_tag import GetObjectsWithTag
+from vmwarelib.actions import BaseAction, map_concurrently
 
 __all__ = [
     'BaseActionTestCase'
@@ -68,23 +72,66 @@ class BaseActionTestCase(VsphereBaseActionTestCase):
         with self.assertRaises(KeyError):
             action._get_connection_info(test_vsphere)
 
-    @mock.patch("vmwarelib.actions.atexit.register")
-    @mock.patch("vmwarelib.actions.connect.SmartConnect")
-    def test_connect(self, mock_connect, mock_register):
+    @mock.patch("vmwarelib.session.get_pool")
+    def test_connect(self, mock_get_pool):
         action = self.get_action_instance(self._new_config)
 
         # define test variables
         test_vsphere = "default"
 
-        expected_result = "expected result"
-        mock_connect.return_value = expected_result
-        mock_register.return_value = "test"
+        expected_result = mock.Mock()
+        expected_result._stub.sessionId = "session-123"
+        mock_pool = mock_get_pool.return_value
+        mock_pool.get.return_value = expected_result
+        mock_pool.idle_timeout = 900
 
         # invoke action with valid parameters
         result = action._connect(test_vsphere)
 
         self.assertEqual(result, expected_result)
+        mock_pool.get.assert_called_with(test_vsphere,
+                                         self._new_config['vsphere']['default'],
+                                         session_id=None, persistent=True,
+                                         verify=True)
+
+        # the session is stored so the next execution can resume it
+        action._connect(test_vsphere)
+        mock_pool.get.assert_called_with(test_vsphere,
+                                         self._new_config['vsphere']['default'],
+                                         session_id="session-123", persistent=True,
+                                         verify=True)
+
+    @mock.patch("vmwarelib.session.get_pool")
+    def test_connect_no_persist(self, mock_get_pool):
+        config = dict(self._new_config, session_pool={'persist': False})
+        action = self.get_action_instance(config)
+        action.action_service = mock.Mock()
 
+        expected_result = mock.Mock()
+        mock_get_pool.return_value.get.return_value = expected_result
+
+        result = action._connect(None)
+
+        self.assertEqual(result, expected_result)
+        mock_get_pool.return_value.get.assert_called_with("default",
+                                                          self._new_config['vsphere']['default'],
+                                                          session_id=None, persistent=False,
+                                                          verify=True)
+        self.assertFalse(action.action_service.get_value.called)
+        self.assertFalse(action.action_service.set_value.called)
+
+    def test_load_session_id_other_user(self):
+        action = self.get_action_instance(self._new_config)
+        connection = self._new_config['vsphere']['default']
+        action.action_service = mock.Mock()
+        action.action_service.get_value.return_value = \
+            '{"host": "%s", "user": "other", "session_id": "123"}' % connection['host']
+
+        result = action._load_session_id("vsphere.session.default", connection)
+
+        self.assertEqual(result, None)
+
+    @mock.patch.dict("vmwarelib.tagging.SESSION_ID_CACHE", clear=True)
     @mock.patch("vmwarelib.actions.requests.Session")
     def test_connect_rest(self, mock_session):
         action = self.get_action_instance(self._new_config)
@@ -117,6 +164,40 @@ class BaseActionTestCase(VsphereBaseActionTestCase):
         expected_result.post.assert_called_with(test_endpoint,
                                                 headers={"vmware-use-header-authn": "true"})
 
+    @mock.patch.dict("vmwarelib.tagging.SESSION_ID_CACHE", clear=True)
+    @mock.patch("vmwarelib.actions.requests.Session")
+    def test_connect_rest_reuses_session(self, mock_session):
+        action = self.get_action_instance(self._new_config)
+
+        mock_response = mock.MagicMock()
+        mock_response.content = '{"value": "123"}'
+        mock_session.return_value.headers = {}
+        mock_session.return_value.post.return_value = mock_response
+
+        action.connect_rest("default")
+        action.connect_rest("default")
+
+        # only the first connection logs in, the second reuses the cached session id
+        self.assertEqual(mock_session.return_value.post.call_count, 1)
+        self.assertEqual(mock_session.return_value.headers,
+                         {"vmware-api-session-id": "123"})
+
+    @mock.patch.dict("vmwarelib.tagging.SESSION_ID_CACHE", clear=True)
+    @mock.patch("vmwarelib.actions.requests.Session")
+    def test_connect_rest_datastore_session(self, mock_session):
+        action = self.get_action_instance(self._new_config)
+        connection = self._new_config['vsphere']['default']
+        action._save_session_id("vsphere.rest_session.default", connection, "456", 900)
+
+        mock_session.return_value.headers = {}
+
+        result = action.connect_rest("default")
+
+        self.assertEqual(result, mock_session.return_value)
+        self.assertFalse(mock_session.return_value.post.called)
+        self.assertEqual(mock_session.return_value.headers,
+                         {"vmware-api-session-id": "456"})
+
     @mock.patch("vmwarelib.actions.requests.Request")
     @mock.patch("vmwarelib.actions.BaseAction.connect_rest")
     def test_rest_api_call(self, mock_connect, mock_request):
@@ -139,6 +220,25 @@ class BaseActionTestCase(VsphereBaseActionTestCase):
         mock_request.assert_called_with(test_verb, test_url, json=None)
         mock_connect.assert_called_with(test_vsphere)
 
+    @mock.patch("vmwarelib.actions.requests.Request")
+    @mock.patch("vmwarelib.actions.BaseAction.connect_rest")
+    def test_rest_api_call_expired_session(self, mock_connect, mock_request):
+        action = self.get_action_instance(self._new_config)
+        action.tagging = mock.Mock()
+
+        expected_result = "expected result"
+        expired_response = mock.Mock(status_code=401)
+        valid_response = mock.Mock(status_code=200)
+        valid_response.json.return_value = expected_result
+        mock_connect.return_value = mock.MagicMock()
+        mock_connect.return_value.send.side_effect = [expired_response, valid_response]
+
+        result = action._rest_api_call("default", "/api/test/endpoint", "get")
+
+        self.assertEqual(result, expected_result)
+        action.tagging.login.assert_called_with()
+        self.assertEqual(mock_connect.return_value.send.call_count, 2)
+
     @mock.patch("vmwarelib.actions.vim")
     def test_get_vim_type(self, mock_vim):
         action = self.get_action_instance(self._new_config)
@@ -165,3 +265,85 @@ class BaseActionTestCase(VsphereBaseActionTestCase):
         # invoke action with an invalid config
         with self.assertRaises(AttributeError):
             action.get_vim_type(test_object_type)
+
+    @mock.patch('vmwarelib.tasks.wait_for_tasks')
+    def test_wait_for_task(self, mock_wait_for_tasks):
+        action = self.get_action_instance(self._new_config)
+        action.si_content = mock.Mock()
+        task = mock.Mock(_moId='task-1')
+        mock_wait_for_tasks.return_value = {'task-1': vim.TaskInfo.State.success}
+
+        result = action._wait_for_task(task, timeout=30)
+
+        self.assertTrue(result)
+        mock_wait_for_tasks.assert_called_with(action.si_content, [task], timeout=30)
+
+    @mock.patch('vmwarelib.tasks.wait_for_tasks')
+    def test_wait_for_tasks(self, mock_wait_for_tasks):
+        action = self.get_action_instance(self._new_config)
+        action.si_content = mock.Mock()
+        mock_wait_for_tasks.return_value = {'task-1': vim.TaskInfo.State.success,
+                                            'task-2': vim.TaskInfo.State.error}
+
+        result = action._wait_for_tasks([mock.Mock(), mock.Mock()])
+
+        self.assertEqual(result, {'task-1': True, 'task-2': False})
+
+    def test_map_concurrently(self):
+        # every call waits for two others, serial calls would break the barrier
+        barrier = threading.Barrier(3, timeout=5)
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def call(item):
+            with lock:
+                running.append(item)
+                max_running.append(len(running))
+            barrier.wait()
+            with lock:
+                running.remove(item)
+            return item * 2
+
+        result = list(map_concurrently(call, range(6), 3))
+
+        # the results keep the order of the items, at most max_workers run at once
+        self.assertEqual(result, [0, 2, 4, 6, 8, 10])
+        self.assertEqual(max(max_running), 3)
+
+    def test_run_on_vspheres(self):
+        action = self.get_action_instance(self._new_config)
+        connected = []
+        action.establish_connection = mock.Mock(side_effect=connected.append)
+
+        def get_name(action, suffix):
+            return 'hosts' + suffix
+
+        result = action.run_on_vspheres(['default', 'other'], get_name, '_1')
+
+        self.assertEqual(result, [('default', 'hosts_1'), ('other', 'hosts_1')])
+        self.assertEqual(sorted(connected), ['default', 'other'])
+
+    def test_run_on_vspheres_error(self):
+        action = self.get_action_instance(self._new_config)
+        action.establish_connection = mock.Mock(side_effect=KeyError('other'))
+
+        with self.assertRaises(Exception) as context:
+            action.run_on_vspheres(['other'], mock.Mock())
+        self.assertIn('vsphere other', str(context.exception))
+
+    @mock.patch('vmwarelib.session._pool')
+    def test_run_not_authenticated_not_retried(self, mock_pool):
+        class ExpiringAction(BaseAction):
+            def run(self, vsphere=None):
+                self.establish_connection(vsphere)
+                raise vim.fault.NotAuthenticated()
+
+        action = self.get_action_instance(self.new_config)
+        action.__class__ = ExpiringAction
+        action._load_session_id = mock.Mock(return_value=None)
+
+        # the action may have changed things before the error, it is not run again
+        self.assertRaises(vim.fault.NotAuthenticated, action.run, vsphere='default')
+        self.assertEqual(mock_pool.get.call_count, 1)
+        self.assertFalse(mock_pool.invalidate.called)
@@ -0,0 +1,138 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+from vmwarelib import inventory
+from vsphere_base_action_test_case import VsphereBaseActionTestCase
+
+__all__ = [
+    'InventoryTestCase'
+]
+
+
+class InventoryTestCase(VsphereBaseActionTestCase):
+    __test__ = True
+
+    def setUp(self):
+        super(InventoryTestCase, self).setUp()
+        self.content = mock.Mock()
+
+    def test_get_entity_properties(self):
+        vm_1 = mock.Mock(_moId='vm-1')
+        vm_2 = mock.Mock(_moId='vm-2')
+        self.mock_property_collector(self.content, [(vm_1, {'name': 'vm1'}),
+                                                    (vm_2, {'name': 'vm2'})])
+
+        result = inventory.get_entity_properties(self.content, 'vimtype')
+
+        self.assertEqual(result, [(vm_1, {'name': 'vm1'}), (vm_2, {'name': 'vm2'})])
+        self.content.viewManager.CreateContainerView.assert_called_with(
+            self.content.rootFolder, ['vimtype'], True)
+        self.content.viewManager.CreateContainerView.return_value.Destroy.assert_called_with()
+
+    def test_get_entity_properties_paged(self):
+        vm_1 = mock.Mock(_moId='vm-1')
+        vm_2 = mock.Mock(_moId='vm-2')
+        collector = self.mock_property_collector(self.content, [(vm_1, {'name': 'vm1'})])
+        first_page = collector.RetrievePropertiesEx.return_value
+        first_page.token = 'token-1'
+        second_page = mock.Mock(objects=[mock.Mock(obj=vm_2, propSet=[])], token=None)
+        collector.ContinueRetrievePropertiesEx.return_value = second_page
+
+        result = inventory.get_entity_properties(self.content, 'vimtype',
+                                                 path_set=['summary'])
+
+        self.assertEqual(result, [(vm_1, {'name': 'vm1'}), (vm_2, {})])
+        collector.ContinueRetrievePropertiesEx.assert_called_once_with('token-1')
+
+    def test_get_entity_properties_empty(self):
+        collector = self.mock_property_collector(self.content, [])
+        collector.RetrievePropertiesEx.return_value = None
+
+        result = inventory.get_entity_properties(self.content, 'vimtype')
+
+        self.assertEqual(result, [])
+
+    def test_iter_entity_properties_pages(self):
+        vm_1 = mock.Mock(_moId='vm-1')
+        collector = self.mock_property_collector(self.content, [(vm_1, {'name': 'vm1'})])
+        collector.RetrievePropertiesEx.return_value.token = 'token-1'
+        view = self.content.viewManager.CreateContainerView.return_value
+
+        entities = inventory.iter_entity_properties(self.content, 'vimtype')
+
+        # pages are only requested as the entities are consumed
+        self.assertEqual(next(entities), (vm_1, {'name': 'vm1'}))
+        self.assertFalse(collector.ContinueRetrievePropertiesEx.called)
+        self.assertFalse(view.Destroy.called)
+
+        entities.close()
+        view.Destroy.assert_called_with()
+
+    def test_retrieve_type_properties(self):
+        host = mock.Mock(_moId='host-1')
+        datastore = mock.Mock(_moId='datastore-1')
+        collector = self.mock_property_collector(self.content, [(host, {'name': 'host1'}),
+                                                                (datastore, {'name': 'ds1'})])
+
+        result = inventory.retrieve_type_properties(self.content, ['spec'],
+                                                    [('HostSystem', ['name']),
+                                                     ('Datastore', ['name'])])
+
+        self.assertEqual(result, [(host, {'name': 'host1'}), (datastore, {'name': 'ds1'})])
+        # both types are read with a single query
+        self.assertEqual(collector.RetrievePropertiesEx.call_count, 1)
+
+    def test_find_managed_entities(self):
+        vm_1 = mock.Mock(_moId='vm-1')
+        vm_2 = mock.Mock(_moId='vm-2')
+        vm_3 = mock.Mock(_moId='vm-3')
+        collector = self.mock_property_collector(self.content,
+                                                 [(vm_1, {'name': 'vm1'}),
+                                                  (vm_2, {'name': 'vm2'}),
+                                                  (vm_3, {'name': 'vm3'})])
+
+        result = inventory.find_managed_entities(self.content, 'vimtype',
+                                                 moids=['vm-3', 'vm-1'],
+                                                 names=['vm1', 'vm2'])
+
+        self.assertEqual([entity for entity, _ in result], [vm_3, vm_1, vm_2])
+        self.assertEqual(collector.RetrievePropertiesEx.call_count, 1)
+
+    def test_find_managed_entities_none_requested(self):
+        result = inventory.find_managed_entities(self.content, 'vimtype')
+
+        self.assertEqual(result, [])
+        self.assertFalse(self.content.propertyCollector.RetrievePropertiesEx.called)
+
+    def test_find_managed_entities_not_found(self):
+        self.mock_property_collector(self.content, [(mock.Mock(_moId='vm-1'), {'name': 'vm1'})])
+
+        self.assertRaises(Exception, inventory.find_managed_entities, self.content,
+                          'vimtype', moids=['vm-2'])
+        self.assertRaises(Exception, inventory.find_managed_entities, self.content,
+                          'vimtype', names=['vm2'])
+
+    def test_find_managed_entities_duplicate_names(self):
+        vm_1 = mock.Mock(_moId='vm-1')
+        self.mock_property_collector(self.content, [(vm_1, {'name': 'vm'}),
+                                                    (mock.Mock(_moId='vm-2'), {'name': 'vm'})])
+
+        # the first entity with the name is used unless names must be unique
+        result = inventory.find_managed_entities(self.content, 'vimtype', names=['vm'])
+        self.assertEqual([entity for entity, _ in result], [vm_1])
+        self.assertRaises(Exception, inventory.find_managed_entities, self.content,
+                          'vimtype', names=['vm'], unique_names=True)
@@ -0,0 +1,91 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import unittest
+
+from pyVmomi import vim  # pylint: disable-msg=E0611
+
+from vmwarelib import serialize
+
+__all__ = [
+    'SerializeTestCase'
+]
+
+
+class SerializeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(SerializeTestCase, self).setUp()
+        self.summary = vim.host.Summary(
+            host=vim.HostSystem('host-1'),
+            overallStatus='green',
+            config=vim.host.Summary.ConfigSummary(
+                name='esx1', port=443, product=vim.AboutInfo(name='ESXi', version='8.0')),
+            quickStats=vim.host.Summary.QuickStats(overallCpuUsage=10, uptime=5),
+            runtime=vim.host.RuntimeInfo(bootTime=datetime.datetime(2020, 1, 1)))
+
+    def test_serialize(self):
+        result = serialize.HOST_GET_SERIALIZER.serialize(self.summary)
+
+        self.assertEqual(result['overallStatus'], 'green')
+        self.assertEqual(type(result['overallStatus']), str)
+        self.assertEqual(result['host'], {'_moId': 'host-1', '_stub': None, '_serverGuid': None})
+        self.assertEqual(result['config']['name'], 'esx1')
+        self.assertEqual(result['config']['product']['version'], '8.0')
+        self.assertEqual(result['quickStats']['overallCpuUsage'], 10)
+        self.assertEqual(result['dynamicProperty'], [])
+        # types that are not expanded are replaced with their class name
+        self.assertEqual(result['runtime'], '__vim.host.RuntimeInfo__')
+
+    def test_serialize_field_order(self):
+        result = serialize.HOST_GET_SERIALIZER.serialize(self.summary)
+
+        expected = [prop.name for prop in vim.host.Summary._GetPropertyList()]
+        self.assertEqual(list(result.keys()), expected)
+        self.assertIn(vim.host.Summary, serialize._FIELD_PLANS)
+
+    def test_serialize_primitives(self):
+        serializer = serialize.Serializer()
+
+        self.assertEqual(serializer.serialize(None), None)
+        self.assertEqual(serializer.serialize({1: ('a', 2.5, True)}), {'1': ['a', 2.5, True]})
+        self.assertEqual(serializer.serialize(datetime.datetime(2020, 1, 1)), '__datetime__')
+
+    def test_serialize_max_depth(self):
+        result = serialize.to_dict(self.summary, serialize.HOST_GET_NON_JSON_SERILIZABLE_TYPES,
+                                   max_depth=1)
+
+        self.assertEqual(result['config']['name'], 'esx1')
+        self.assertEqual(result['config']['product'], '__vim.AboutInfo__')
+
+    def test_serialize_include_exclude(self):
+        serializer = serialize.Serializer(serialize.HOST_GET_NON_JSON_SERILIZABLE_TYPES,
+                                          include=['config.product.name', 'quickStats'],
+                                          exclude=['quickStats.uptime'])
+
+        result = serializer.serialize(self.summary)
+
+        self.assertEqual(set(result.keys()), set(['config', 'quickStats']))
+        self.assertEqual(result['config'], {'product': {'name': 'ESXi'}})
+        self.assertEqual(result['quickStats']['overallCpuUsage'], 10)
+        self.assertNotIn('uptime', result['quickStats'])
+
+    def test_path_tree(self):
+        self.assertEqual(serialize._path_tree(None), None)
+        self.assertEqual(serialize._path_tree(['a.b', 'a.c.d', 'e']),
+                         {'a': {'b': None, 'c': {'d': None}}, 'e': None})
+        # a shorter path covers everything below it
+        self.assertEqual(serialize._path_tree(['a', 'a.b']), {'a': None})
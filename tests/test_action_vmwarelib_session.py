@@ -0,0 +1,233 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+import threading
+import unittest
+from pyVmomi import vim  # pylint: disable-msg=E0611
+
+from vmwarelib import session
+from vmwarelib.session import SessionPool
+
+__all__ = [
+    'SessionPoolTestCase'
+]
+
+CONNECTION = {'host': 'vsphere.domain.tld', 'port': 443, 'user': 'user', 'passwd': 'pass'}
+
+
+class SessionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(SessionPoolTestCase, self).setUp()
+        self.pool = SessionPool(idle_timeout=900, keepalive_interval=300)
+
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_reuses_session(self, mock_connect):
+        result_1 = self.pool.get("default", CONNECTION)
+        result_2 = self.pool.get("default", CONNECTION)
+
+        self.assertEqual(result_1, mock_connect.return_value)
+        self.assertIs(result_1, result_2)
+        mock_connect.assert_called_once_with(host='vsphere.domain.tld', port=443,
+                                             user='user', pwd='pass')
+
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_separate_names(self, mock_connect):
+        mock_connect.side_effect = [mock.Mock(), mock.Mock()]
+
+        result_1 = self.pool.get("default", CONNECTION)
+        result_2 = self.pool.get("other", CONNECTION)
+
+        self.assertIsNot(result_1, result_2)
+        self.assertEqual(mock_connect.call_count, 2)
+
+    @mock.patch("vmwarelib.session.connect.Disconnect")
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_connection_changed(self, mock_connect, mock_disconnect):
+        si_1 = mock.Mock()
+        si_2 = mock.Mock()
+        mock_connect.side_effect = [si_1, si_2]
+
+        self.pool.get("default", CONNECTION)
+        result = self.pool.get("default", dict(CONNECTION, user='other'))
+
+        self.assertIs(result, si_2)
+        mock_disconnect.assert_called_once_with(si_1)
+
+    @mock.patch("vmwarelib.session.time.time")
+    @mock.patch("vmwarelib.session.connect.Disconnect")
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_idle_expired(self, mock_connect, mock_disconnect, mock_time):
+        si_1 = mock.Mock()
+        si_2 = mock.Mock()
+        mock_connect.side_effect = [si_1, si_2]
+        mock_time.side_effect = [1000, 2000]
+
+        self.pool.get("default", CONNECTION)
+        result = self.pool.get("default", CONNECTION)
+
+        self.assertIs(result, si_2)
+        mock_disconnect.assert_called_once_with(si_1)
+
+    @mock.patch("vmwarelib.session.time.time")
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_keepalive_not_authenticated(self, mock_connect, mock_time):
+        si_1 = mock.Mock()
+        si_1.content.sessionManager.currentSession = None
+        si_2 = mock.Mock()
+        mock_connect.side_effect = [si_1, si_2]
+        mock_time.side_effect = [1000, 1400]
+
+        self.pool.get("default", CONNECTION)
+        result = self.pool.get("default", CONNECTION)
+
+        # the expired session is replaced with a new login
+        self.assertIs(result, si_2)
+        self.assertEqual(mock_connect.call_count, 2)
+
+    @mock.patch("vmwarelib.session.time.time")
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_keepalive_authenticated(self, mock_connect, mock_time):
+        mock_time.side_effect = [1000, 1400]
+
+        result_1 = self.pool.get("default", CONNECTION)
+        result_2 = self.pool.get("default", CONNECTION)
+
+        self.assertIs(result_1, result_2)
+        self.assertEqual(mock_connect.call_count, 1)
+
+    @mock.patch("vmwarelib.session.time.time")
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_verify(self, mock_connect, mock_time):
+        si_1 = mock.Mock()
+        si_2 = mock.Mock()
+        mock_connect.side_effect = [si_1, si_2]
+        mock_time.side_effect = [1000, 1010]
+
+        self.pool.get("default", CONNECTION)
+        si_1.content.sessionManager.currentSession = None
+        result = self.pool.get("default", CONNECTION, verify=True)
+
+        # the session is checked although it was checked 10 seconds ago
+        self.assertIs(result, si_2)
+
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_resume_session_id(self, mock_connect):
+        result = self.pool.get("default", CONNECTION, session_id="session-123")
+
+        self.assertEqual(result, mock_connect.return_value)
+        mock_connect.assert_called_once_with(host='vsphere.domain.tld', port=443,
+                                             sessionId="session-123")
+
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_resume_session_id_expired(self, mock_connect):
+        si_1 = mock.Mock()
+        si_1.content.sessionManager.currentSession = None
+        si_2 = mock.Mock()
+        mock_connect.side_effect = [si_1, si_2]
+
+        result = self.pool.get("default", CONNECTION, session_id="session-123")
+
+        self.assertIs(result, si_2)
+        si_1._stub.DropConnections.assert_called_with()
+        mock_connect.assert_called_with(host='vsphere.domain.tld', port=443,
+                                        user='user', pwd='pass')
+
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_invalidate(self, mock_connect):
+        mock_connect.side_effect = [mock.Mock(), mock.Mock()]
+
+        result_1 = self.pool.get("default", CONNECTION)
+        self.pool.invalidate("default")
+        result_2 = self.pool.get("default", CONNECTION)
+
+        self.assertIsNot(result_1, result_2)
+
+    @mock.patch("vmwarelib.session.time.time")
+    @mock.patch("vmwarelib.session.connect.Disconnect")
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_keepalive(self, mock_connect, mock_disconnect, mock_time):
+        si_idle = mock.Mock()
+        si_dead = mock.Mock()
+        si_dead.content.sessionManager.currentSession = None
+        si_alive = mock.Mock()
+        mock_connect.side_effect = [si_idle, si_dead, si_alive]
+        mock_time.side_effect = [0, 800, 800, 1200]
+
+        self.pool.get("idle", CONNECTION)
+        self.pool.get("dead", CONNECTION)
+        self.pool.get("alive", CONNECTION)
+        self.pool.keepalive()
+
+        mock_disconnect.assert_called_once_with(si_idle)
+        self.assertEqual(list(self.pool._sessions.keys()), ["alive"])
+
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_get_logins_do_not_wait_for_each_other(self, mock_connect):
+        # each login waits for the other one, logins under one lock would
+        # break the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        mock_connect.side_effect = lambda **kwargs: mock.Mock(wait=barrier.wait())
+        results = {}
+
+        def get(name):
+            results[name] = self.pool.get(name, CONNECTION)
+        threads = [threading.Thread(target=get, args=(name,)) for name in ("default", "other")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), ["default", "other"])
+        self.assertEqual(sorted(self.pool._sessions), ["default", "other"])
+
+    @mock.patch("vmwarelib.session.connect.Disconnect")
+    @mock.patch("vmwarelib.session.connect.SmartConnect")
+    def test_clear(self, mock_connect, mock_disconnect):
+        si_1 = mock.Mock()
+        si_2 = mock.Mock()
+        mock_connect.side_effect = [si_1, si_2]
+
+        self.pool.get("default", CONNECTION)
+        self.pool.get("persistent", CONNECTION, persistent=True)
+        self.pool.clear()
+
+        # persistent sessions stay logged in so they can be resumed later
+        mock_disconnect.assert_called_once_with(si_1)
+        si_2._stub.DropConnections.assert_called_with()
+        self.assertEqual(self.pool._sessions, {})
+
+    @mock.patch("vmwarelib.session._pool")
+    def test_retry_not_authenticated(self, mock_pool):
+        obj = mock.Mock(_session_name="default")
+        func = mock.Mock(side_effect=[vim.fault.NotAuthenticated(), "result"])
+
+        result = session.retry_not_authenticated(obj, func, "arg")
+
+        # the expired session is dropped so the second call logs in again
+        self.assertEqual(result, "result")
+        mock_pool.invalidate.assert_called_once_with("default")
+        func.assert_called_with("arg")
+        self.assertEqual(func.call_count, 2)
+
+    @mock.patch("vmwarelib.session._pool")
+    def test_retry_not_authenticated_not_connected(self, mock_pool):
+        obj = mock.Mock(spec=[])
+        func = mock.Mock(side_effect=vim.fault.NotAuthenticated())
+
+        self.assertRaises(vim.fault.NotAuthenticated, session.retry_not_authenticated,
+                          obj, func)
+        self.assertFalse(mock_pool.invalidate.called)
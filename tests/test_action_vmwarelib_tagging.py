@@ -6,6 +6,13 @@ import unittest
 
 class TaggingTestCase(unittest.TestCase):
 
+    def setUp(self):
+        super(TaggingTestCase, self).setUp()
+        # the name indexes are shared by every instance in the process
+        patcher = mock.patch.dict("vmwarelib.tagging.NAME_INDEX_CACHE", clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def create_class_object(self):
         mock_session = mock.MagicMock()
         tagging = VmwareTagging(server='vsphere.domain.tld',
@@ -243,6 +250,70 @@ class TaggingTestCase(unittest.TestCase):
         self.assertEqual(result, expected_cookies)
         self.assertEqual(action.session.headers, expected_headers)
 
+    def test_login_on_login(self):
+        action = self.create_class_object()
+        action.on_login = mock.Mock()
+
+        mock_response = mock.MagicMock()
+        mock_response.content = '{"value": "123"}'
+        action.session.headers = {}
+        action.session.post.return_value = mock_response
+
+        with mock.patch.dict("vmwarelib.tagging.SESSION_ID_CACHE", clear=True) as cache:
+            action.login()
+
+            action.on_login.assert_called_with("123")
+            self.assertEqual(cache, {("https://vsphere.domain.tld", "user"): "123"})
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.login")
+    def test_resume_session_cached(self, mock_login):
+        action = self.create_class_object()
+        action.session.headers = {}
+
+        with mock.patch.dict("vmwarelib.tagging.SESSION_ID_CACHE",
+                             {("https://vsphere.domain.tld", "user"): "123"}):
+            action.resume_session("456")
+
+        self.assertFalse(mock_login.called)
+        self.assertEqual(action.session.headers, {"vmware-api-session-id": "123"})
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.login")
+    def test_resume_session_given(self, mock_login):
+        action = self.create_class_object()
+        action.session.headers = {}
+
+        with mock.patch.dict("vmwarelib.tagging.SESSION_ID_CACHE", clear=True):
+            action.resume_session("456")
+
+        self.assertFalse(mock_login.called)
+        self.assertEqual(action.session.headers, {"vmware-api-session-id": "456"})
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.login")
+    def test_resume_session_login(self, mock_login):
+        action = self.create_class_object()
+
+        with mock.patch.dict("vmwarelib.tagging.SESSION_ID_CACHE", clear=True):
+            action.resume_session()
+
+        mock_login.assert_called_with()
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.login")
+    def test_get_expired_session(self, mock_login):
+        action = self.create_class_object()
+        action.session.headers = {"vmware-api-session-id": "123"}
+        expected = {"value": "data"}
+
+        expired_response = mock.MagicMock(status_code=401)
+        valid_response = mock.MagicMock(status_code=200)
+        valid_response.json.return_value = expected
+        action.session.get.side_effect = [expired_response, valid_response]
+
+        result = action.get("/fake/get/endpoint")
+
+        mock_login.assert_called_with()
+        self.assertEqual(action.session.get.call_count, 2)
+        self.assertEqual(result, expected)
+
     ############################################################################
 
     # Category Functions
@@ -327,6 +398,101 @@ class TaggingTestCase(unittest.TestCase):
         # assert
         self.assertEqual(result, None)
 
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_get")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_list")
+    def test_category_find_by_name_cached(self, mock_category_list, mock_category_get):
+        # setup
+        action = self.create_class_object()
+
+        # mock
+        mock_category_list.return_value = ["1", "2", "3"]
+        mock_category_get.side_effect = [{"name": "a", "value": "x"},
+                                         {"name": "b", "value": "xx"},
+                                         {"name": "c", "value": "xxx"}]
+
+        # execute
+        result_1 = action.category_find_by_name("b")
+        # the scan stops at the first match
+        self.assertEqual(mock_category_get.call_count, 2)
+        result_2 = action.category_find_by_name("a")
+        result_3 = action.category_find_by_name("c")
+
+        # assert
+        self.assertEqual(result_1, {"name": "b", "value": "xx"})
+        self.assertEqual(result_2, {"name": "a", "value": "x"})
+        self.assertEqual(result_3, {"name": "c", "value": "xxx"})
+        self.assertEqual(mock_category_list.call_count, 1)
+        self.assertEqual(mock_category_get.call_count, 3)
+        self.assertEqual(action.index_stats()["categories"],
+                         {"hits": 1, "misses": 2, "size": 3})
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_get")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_list")
+    def test_category_find_by_name_cached_not_found(self, mock_category_list,
+                                                    mock_category_get):
+        # setup
+        action = self.create_class_object()
+
+        # mock
+        mock_category_list.side_effect = [["1"], ["1", "2"]]
+        mock_category_get.side_effect = [{"name": "a", "value": "x"},
+                                         {"name": "b", "value": "xx"}]
+
+        # execute
+        result_1 = action.category_find_by_name("a")
+        result_2 = action.category_find_by_name("b")
+
+        # assert
+        # a name missing from the cached index lists the ids again in case it was
+        # created since, only the new ids are fetched
+        self.assertEqual(result_1, {"name": "a", "value": "x"})
+        self.assertEqual(result_2, {"name": "b", "value": "xx"})
+        mock_category_get.assert_called_with("2")
+        self.assertEqual(mock_category_get.call_count, 2)
+        self.assertEqual(action.index_stats()["categories"],
+                         {"hits": 0, "misses": 2, "size": 2})
+
+    @mock.patch("vmwarelib.tagging.time.time")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_get")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_list")
+    def test_category_find_by_name_expired(self, mock_category_list, mock_category_get,
+                                           mock_time):
+        # setup
+        action = self.create_class_object()
+
+        # mock
+        mock_time.side_effect = [1000, 2000, 2000]
+        mock_category_list.return_value = ["1"]
+        mock_category_get.return_value = {"name": "a", "value": "x"}
+
+        # execute
+        action.category_find_by_name("a")
+        action.category_find_by_name("a")
+
+        # assert
+        self.assertEqual(mock_category_list.call_count, 2)
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.post")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_get")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_list")
+    def test_category_create_invalidates_index(self, mock_category_list, mock_category_get,
+                                               mock_post):
+        # setup
+        action = self.create_class_object()
+
+        # mock
+        mock_category_list.return_value = ["1"]
+        mock_category_get.return_value = {"name": "a", "value": "x"}
+        mock_post.return_value = {"value": "2"}
+
+        # execute
+        action.category_find_by_name("a")
+        action.category_create("b")
+        action.category_find_by_name("a")
+
+        # assert
+        self.assertEqual(mock_category_list.call_count, 2)
+
     def test_category_create_spec(self):
         action = self.create_class_object()
         create_spec = action.category_create_spec()
@@ -559,6 +725,46 @@ class TaggingTestCase(unittest.TestCase):
                                       any_order=True)
         self.assertEqual(result, None)
 
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_get")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_list")
+    def test_tag_find_by_name_cached(self, mock_tag_list, mock_tag_get):
+        # setup
+        action = self.create_class_object()
+
+        # mock
+        mock_tag_list.return_value = ["1", "2"]
+        mock_tag_get.side_effect = [{"name": "a", "category_id": "c1"},
+                                    {"name": "b", "category_id": "c1"}]
+
+        # execute
+        result_1 = action.tag_find_by_name("b", "c1")
+        result_2 = action.tag_find_by_name("a", "c1")
+
+        # assert
+        self.assertEqual(result_1, {"name": "b", "category_id": "c1"})
+        self.assertEqual(result_2, {"name": "a", "category_id": "c1"})
+        mock_tag_list.assert_called_once_with("c1")
+        self.assertEqual(action.index_stats()["tags"], {"hits": 1, "misses": 1, "size": 2})
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.delete")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_get")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_list")
+    def test_tag_delete_invalidates_index(self, mock_tag_list, mock_tag_get, mock_delete):
+        # setup
+        action = self.create_class_object()
+
+        # mock
+        mock_tag_list.return_value = ["1"]
+        mock_tag_get.return_value = {"name": "a", "category_id": "c1"}
+
+        # execute
+        action.tag_find_by_name("a", "c1")
+        action.tag_delete("1")
+        action.tag_find_by_name("a", "c1")
+
+        # assert
+        self.assertEqual(mock_tag_list.call_count, 2)
+
     def test_tag_create_spec(self):
         action = self.create_class_object()
         create_spec = action.tag_create_spec()
@@ -752,3 +958,161 @@ class TaggingTestCase(unittest.TestCase):
                                                        "vm",
                                                        "vm-789")
         self.assertEqual(results, "expected")
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.post")
+    def test_tag_association_attach_objects(self, mock_post):
+        action = self.create_class_object()
+        action.batch_size = 2
+        mock_post.return_value = {"value": {"success": True, "error_messages": []}}
+
+        action.tag_association_attach_objects("123", "VirtualMachine",
+                                              ["vm-1", "vm-2", "vm-3"])
+
+        url = "/rest/com/vmware/cis/tagging/tag-association/id:123"
+        params = {"~action": "attach-tag-to-multiple-objects"}
+        mock_post.assert_has_calls([
+            mock.call(url, params=params,
+                      payload={"object_ids": [{"id": "vm-1", "type": "VirtualMachine"},
+                                              {"id": "vm-2", "type": "VirtualMachine"}]}),
+            mock.call(url, params=params,
+                      payload={"object_ids": [{"id": "vm-3", "type": "VirtualMachine"}]}),
+        ])
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.post")
+    def test_tag_association_detach_objects_error(self, mock_post):
+        action = self.create_class_object()
+        mock_post.return_value = {"value": {"success": False, "error_messages": ["err"]}}
+
+        with self.assertRaises(ValueError):
+            action.tag_association_detach_objects("123", "VirtualMachine", ["vm-1"])
+
+        mock_post.assert_called_with("/rest/com/vmware/cis/tagging/tag-association/id:123",
+                                     params={"~action": "detach-tag-from-multiple-objects"},
+                                     payload={"object_ids": [{"id": "vm-1",
+                                                              "type": "VirtualMachine"}]})
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.post")
+    def test_tag_association_list_attached_tags_on_objects(self, mock_post):
+        action = self.create_class_object()
+        mock_post.return_value = {"value": [
+            {"object_id": {"id": "vm-1", "type": "VirtualMachine"}, "tag_ids": ["t1", "t2"]},
+        ]}
+
+        result = action.tag_association_list_attached_tags_on_objects("VirtualMachine",
+                                                                      ["vm-1", "vm-2"])
+
+        self.assertEqual(result, {"vm-1": ["t1", "t2"], "vm-2": []})
+        mock_post.assert_called_with("/rest/com/vmware/cis/tagging/tag-association",
+                                     params={"~action": "list-attached-tags-on-objects"},
+                                     payload={"object_ids": [
+                                         {"id": "vm-1", "type": "VirtualMachine"},
+                                         {"id": "vm-2", "type": "VirtualMachine"}]})
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_association_detach_objects")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_get")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_association_list_attached_tags_on_objects")
+    def test_tag_association_action_bulk_detach(self, mock_list_attached, mock_tag_get,
+                                                mock_detach_objects):
+        action = self.create_class_object()
+        mock_list_attached.return_value = {"vm-1": ["t1", "t2"], "vm-2": ["t1"], "vm-3": []}
+        tags = {"t1": {"id": "t1", "category_id": "c1"},
+                "t2": {"id": "t2", "category_id": "c2"}}
+        mock_tag_get.side_effect = lambda tag_id: tags[tag_id]
+
+        result = action.tag_association_action_bulk({"id": "c1"}, {"id": "t1"},
+                                                    "VirtualMachine",
+                                                    ["vm-1", "vm-2", "vm-3"], "detach")
+
+        self.assertEqual(result, {"vm-1": [tags["t1"]], "vm-2": [tags["t1"]], "vm-3": []})
+        # each tag is only looked up once no matter how many objects it is attached to
+        self.assertEqual(mock_tag_get.call_count, 2)
+        mock_detach_objects.assert_called_once_with("t1", "VirtualMachine", ["vm-1", "vm-2"])
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_association_attach_objects")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_association_detach_objects")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_get")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_association_list_attached_tags_on_objects")
+    def test_tag_association_action_bulk_replace(self, mock_list_attached, mock_tag_get,
+                                                 mock_detach_objects, mock_attach_objects):
+        action = self.create_class_object()
+        mock_list_attached.return_value = {"vm-1": ["t1"], "vm-2": ["t2"], "vm-3": []}
+        tags = {"t1": {"id": "t1", "category_id": "c1"},
+                "t2": {"id": "t2", "category_id": "c1"}}
+        mock_tag_get.side_effect = lambda tag_id: tags[tag_id]
+
+        result = action.tag_association_action_bulk({"id": "c1"}, {"id": "t1"},
+                                                    "VirtualMachine",
+                                                    ["vm-1", "vm-2", "vm-3"], "replace")
+
+        self.assertEqual(result, {"vm-1": None, "vm-2": None, "vm-3": None})
+        mock_detach_objects.assert_called_once_with("t2", "VirtualMachine", ["vm-2"])
+        mock_attach_objects.assert_called_once_with("t1", "VirtualMachine", ["vm-2", "vm-3"])
+
+    def test_tag_association_action_bulk_invalid(self):
+        action = self.create_class_object()
+
+        with self.assertRaises(ValueError):
+            action.tag_association_action_bulk({"id": "c1"}, {"id": "t1"},
+                                               "VirtualMachine", ["vm-1"], "junk")
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_association_attach_objects")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.object_find")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_tag_create")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.object_find_by_name")
+    def test_tag_bulk(self, mock_object_find_by_name, mock_category_tag_create,
+                      mock_object_find, mock_attach_objects):
+        action = self.create_class_object()
+        mock_object_find_by_name.return_value = "domain-c1"
+        mock_category_tag_create.return_value = ({"id": "c1"}, {"id": "t1"})
+        mock_object_find.return_value = [{"vm": "vm-1", "name": "vm1"},
+                                         {"vm": "vm-2", "name": "vm2"}]
+
+        result = action.tag_bulk("ClusterComputeResource", "cluster1", "VirtualMachine",
+                                 "category", "tag", "SINGLE", "attach")
+
+        mock_object_find.assert_called_with("VirtualMachine",
+                                            params={"filter.clusters.1": "domain-c1"})
+        mock_attach_objects.assert_called_once_with("t1", "VirtualMachine", ["vm-1", "vm-2"])
+        self.assertEqual(result, [
+            {"id": "vm-1", "name": "vm1", "type": "VirtualMachine", "response": None},
+            {"id": "vm-2", "name": "vm2", "type": "VirtualMachine", "response": None},
+        ])
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.tag_get")
+    def test_tag_get_cached(self, mock_tag_get):
+        action = self.create_class_object()
+        mock_tag_get.return_value = {"id": "t1"}
+
+        result_1 = action.tag_get_cached("t1")
+        result_2 = action.tag_get_cached("t1")
+
+        self.assertEqual(result_1, {"id": "t1"})
+        self.assertEqual(result_2, {"id": "t1"})
+        mock_tag_get.assert_called_once_with("t1")
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_get")
+    def test_category_get_cached(self, mock_category_get):
+        action = self.create_class_object()
+        mock_category_get.return_value = {"id": "c1"}
+
+        action.category_get_cached("c1")
+        result = action.category_get_cached("c1")
+
+        self.assertEqual(result, {"id": "c1"})
+        mock_category_get.assert_called_once_with("c1")
+
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_get")
+    @mock.patch("vmwarelib.tagging.VmwareTagging.category_list")
+    def test_category_index_shared_per_vcenter(self, mock_category_list, mock_category_get):
+        mock_category_list.return_value = ["1"]
+        mock_category_get.return_value = {"name": "a", "value": "x"}
+
+        # a later instance for the same vCenter, ex: in another action step
+        self.create_class_object().category_find_by_name("a")
+        action = self.create_class_object()
+        result = action.category_find_by_name("a")
+
+        self.assertEqual(result, {"name": "a", "value": "x"})
+        self.assertEqual(mock_category_get.call_count, 1)
+        self.assertEqual(action.index_stats()["categories"],
+                         {"hits": 1, "misses": 1, "size": 1})
@@ -0,0 +1,137 @@
+# Licensed to the StackStorm, Inc ('StackStorm') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+import unittest
+
+from pyVmomi import vim  # pylint: disable-msg=E0611
+
+from vmwarelib import tasks
+
+__all__ = [
+    'TasksTestCase'
+]
+
+
+class TasksTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(TasksTestCase, self).setUp()
+        patcher = mock.patch('vmwarelib.tasks.vmodl')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.content = mock.Mock()
+        self.collector = self.content.propertyCollector.CreatePropertyCollector.return_value
+
+    def mock_update(self, version, changes):
+        object_set = []
+        for obj, name, val in changes:
+            change = mock.Mock(op='assign', val=val)
+            change.name = name
+            object_set.append(mock.Mock(obj=obj, changeSet=[change]))
+        return mock.Mock(version=version, filterSet=[mock.Mock(objectSet=object_set)])
+
+    def test_wait_for_tasks(self):
+        task_1 = mock.Mock(_moId='task-1')
+        task_2 = mock.Mock(_moId='task-2')
+        self.collector.WaitForUpdatesEx.side_effect = [
+            self.mock_update('1', [(task_1, 'info.state', vim.TaskInfo.State.running),
+                                   (task_2, 'info.state', vim.TaskInfo.State.queued)]),
+            None,
+            self.mock_update('2', [(task_1, 'info.state', vim.TaskInfo.State.success)]),
+            self.mock_update('3', [(task_2, 'info.state', vim.TaskInfo.State.error)]),
+        ]
+
+        result = tasks.wait_for_tasks(self.content, [task_1, task_2])
+
+        self.assertEqual(result, {'task-1': vim.TaskInfo.State.success,
+                                  'task-2': vim.TaskInfo.State.error})
+        # each call continues from the version of the previous update
+        versions = [c[0][0] for c in self.collector.WaitForUpdatesEx.call_args_list]
+        self.assertEqual(versions, ['', '1', '1', '2'])
+        self.assertEqual(self.collector.CreateFilter.call_count, 1)
+        self.collector.DestroyPropertyCollector.assert_called_with()
+
+    def test_wait_for_tasks_empty(self):
+        self.assertEqual(tasks.wait_for_tasks(self.content, []), {})
+        self.assertFalse(self.content.propertyCollector.CreatePropertyCollector.called)
+
+    @mock.patch('vmwarelib.tasks.time')
+    def test_wait_for_tasks_timeout(self, mock_time):
+        mock_time.time.side_effect = [0, 0, 11]
+        task = mock.Mock(_moId='task-1')
+        self.collector.WaitForUpdatesEx.return_value = None
+
+        self.assertRaises(tasks.WaitTimeoutError, tasks.wait_for_tasks,
+                          self.content, [task], timeout=10)
+        self.assertEqual(self.collector.WaitForUpdatesEx.call_count, 1)
+        self.collector.DestroyPropertyCollector.assert_called_with()
+
+    def test_wait_for_property(self):
+        vm = mock.Mock(_moId='vm-1')
+        running = vim.vm.GuestInfo.ToolsRunningStatus.guestToolsRunning
+        self.collector.WaitForUpdatesEx.side_effect = [
+            self.mock_update('1', [(vm, 'guest.toolsRunningStatus', 'guestToolsStarting')]),
+            self.mock_update('2', [(vm, 'guest.toolsRunningStatus', running)]),
+        ]
+
+        result = tasks.wait_for_property(self.content, vm, 'guest.toolsRunningStatus',
+                                         lambda status: status == running)
+
+        self.assertEqual(result, running)
+        self.assertEqual(self.collector.WaitForUpdatesEx.call_count, 2)
+
+    @mock.patch('vmwarelib.tasks.threading.Thread')
+    def test_task_tracker(self, mock_thread):
+        on_complete = mock.Mock()
+        tracker = tasks.TaskTracker(self.content, on_complete, path_set=['info.key'])
+        task_1 = mock.Mock(_moId='task-1')
+        task_2 = mock.Mock(_moId='task-2')
+        filter_1 = mock.Mock()
+        filter_2 = mock.Mock()
+        self.collector.CreateFilter.side_effect = [filter_1, filter_2]
+
+        tracker.track(task_1)
+        tracker.track(task_2)
+        tracker.track(task_1)
+
+        # one collector, one filter per task and a single thread for all of them
+        self.assertEqual(self.content.propertyCollector.CreatePropertyCollector.call_count, 1)
+        self.assertEqual(self.collector.CreateFilter.call_count, 2)
+        self.assertEqual(mock_thread.call_count, 1)
+        mock_thread.return_value.start.assert_called_with()
+        self.assertEqual(tracker.pending(), 2)
+
+        tracker._process_update(self.mock_update('1', [
+            (task_1, 'info.state', vim.TaskInfo.State.running),
+            (task_2, 'info.state', vim.TaskInfo.State.queued)]))
+        self.assertFalse(on_complete.called)
+
+        tracker._process_update(self.mock_update('2', [
+            (task_2, 'info.state', vim.TaskInfo.State.success)]))
+
+        on_complete.assert_called_once_with(task_2, {'info.state': vim.TaskInfo.State.success})
+        filter_2.DestroyPropertyFilter.assert_called_with()
+        self.assertFalse(filter_1.DestroyPropertyFilter.called)
+        self.assertEqual(tracker.pending(), 1)
+
+        tracker.stop()
+
+        self.collector.CancelWaitForUpdates.assert_called_with()
+        self.collector.DestroyPropertyCollector.assert_called_with()
+        self.assertEqual(tracker.pending(), 0)
+        tracker.track(mock.Mock(_moId='task-3'))
+        self.assertEqual(self.collector.CreateFilter.call_count, 2)
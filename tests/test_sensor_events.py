@@ -0,0 +1,183 @@
+import json
+import mock
+import yaml
+
+from st2tests.base import BaseSensorTestCase
+from events_sensor import EventsSensor
+
+from pyVim import connect
+from pyVmomi import vim
+from datetime import datetime, timedelta, timezone
+from vmwarelib import session
+
+
+class EventsSensorTestCase(BaseSensorTestCase):
+    sensor_cls = EventsSensor
+
+    def setUp(self):
+        super(EventsSensorTestCase, self).setUp()
+
+        self.cfg_new = yaml.safe_load(self.get_fixture_content('cfg_new.yaml'))
+        self.cfg_new['sensors']['events'] = {'page_size': 2}
+
+        # replace the processing to connect vSphere by mock, without reusing
+        # the service instance pooled by other tests
+        connect.SmartConnect = mock.Mock()
+        session.get_pool().clear()
+
+    def get_sensor(self, events=None):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+        sensor.setup()
+        sensor._collector = mock.Mock()
+        sensor._collector.ReadNextEvents = mock.Mock(side_effect=events or [[]])
+        return sensor
+
+    def mock_event(self, key, created_time=None):
+        return vim.event.VmCreatedEvent(
+            key=key, chainId=key, userName='admin',
+            createdTime=created_time or datetime.now(),
+            fullFormattedMessage='Created virtual machine vm%d' % key,
+            vm=vim.event.VmEventArgument(vm=vim.VirtualMachine('vm-%d' % key),
+                                         name='vm%d' % key),
+            datacenter=vim.event.DatacenterEventArgument(
+                datacenter=vim.Datacenter('datacenter-1'), name='dc1'))
+
+    def test_setup_filter(self):
+        self.cfg_new['sensors']['events'] = {
+            'event_types': ['VmCreatedEvent', 'VmMigratedEvent'],
+            'entity': {'type': 'Datacenter', 'id': 'datacenter-1'},
+        }
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+
+        sensor.setup()
+
+        event_manager = sensor.si_content.eventManager
+        filter_spec = event_manager.CreateCollectorForEvents.call_args[1]['filter']
+        self.assertEqual(filter_spec.eventTypeId, ['VmCreatedEvent', 'VmMigratedEvent'])
+        self.assertEqual(filter_spec.entity.entity._moId, 'datacenter-1')
+        self.assertEqual(filter_spec.entity.recursion, 'all')
+        self.assertEqual(sensor._page_size, 1000)
+
+    def test_dispatching_events(self):
+        sensor = self.get_sensor([[self.mock_event(1), self.mock_event(2)],
+                                  [self.mock_event(3)]])
+
+        sensor.poll()
+
+        # the collector is drained until a page comes back short
+        self.assertEqual(sensor._collector.ReadNextEvents.call_count, 2)
+        contexts = self.get_dispatched_triggers()
+        self.assertEqual([c['payload']['key'] for c in contexts], [1, 2, 3])
+        payload = contexts[0]['payload']
+        self.assertEqual(contexts[0]['trigger'], 'vsphere.event')
+        self.assertEqual(payload['type'], 'VmCreatedEvent')
+        self.assertEqual(payload['user_name'], 'admin')
+        self.assertEqual(payload['message'], 'Created virtual machine vm1')
+        self.assertEqual(payload['vm'], {'id': 'vm-1', 'name': 'vm1'})
+        self.assertEqual(payload['datacenter'], {'id': 'datacenter-1', 'name': 'dc1'})
+        self.assertEqual(payload['host'], None)
+        self.assertNotEqual(payload['created_time'], '')
+
+    def test_dispatching_event_batches(self):
+        self.cfg_new['sensors']['events']['batch_size'] = 2
+        sensor = self.get_sensor([[self.mock_event(1), self.mock_event(2)],
+                                  [self.mock_event(3)]])
+
+        sensor.poll()
+
+        contexts = self.get_dispatched_triggers()
+        self.assertEqual(len(contexts), 2)
+        self.assertEqual(contexts[0]['trigger'], 'vsphere.event_batch')
+        self.assertEqual([e['key'] for e in contexts[0]['payload']['events']], [1, 2])
+        self.assertEqual([e['key'] for e in contexts[1]['payload']['events']], [3])
+
+    def test_no_dispatching_events(self):
+        sensor = self.get_sensor()
+
+        sensor.poll()
+
+        self.assertEqual(self.get_dispatched_triggers(), [])
+
+    def test_resume_from_cursor(self):
+        created_time = datetime.now() - timedelta(minutes=5)
+        sensor = self.get_sensor([[self.mock_event(1, created_time)]])
+
+        sensor.poll()
+
+        cursor = json.loads(self.sensor_service.get_value('events.cursor.default'))
+        self.assertEqual(cursor, {'key': 1, 'created_time': created_time.isoformat()})
+
+        # a restarted sensor starts its collector at the cursor and skips the
+        # events it already dispatched
+        restarted = self.get_sensor_instance(config=self.cfg_new)
+        restarted.setup()
+
+        event_manager = restarted.si_content.eventManager
+        filter_spec = event_manager.CreateCollectorForEvents.call_args[1]['filter']
+        self.assertEqual(filter_spec.time.beginTime, created_time)
+
+        restarted._collector = mock.Mock()
+        restarted._collector.ReadNextEvents = mock.Mock(
+            return_value=[self.mock_event(1, created_time)])
+        restarted.poll()
+
+        contexts = self.get_dispatched_triggers()
+        self.assertEqual([c['payload']['key'] for c in contexts], [1])
+
+    def test_resume_from_cursor_with_offset(self):
+        # vSphere returns timezone aware times, their isoformat has an offset
+        created_time = datetime(2024, 1, 2, 3, 4, 5, 678000,
+                                tzinfo=timezone(timedelta(hours=2)))
+        self.sensor_service.set_value('events.cursor.default', json.dumps(
+            {'key': 1, 'created_time': created_time.isoformat()}))
+
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+        sensor.setup()
+
+        event_manager = sensor.si_content.eventManager
+        filter_spec = event_manager.CreateCollectorForEvents.call_args[1]['filter']
+        self.assertEqual(filter_spec.time.beginTime, created_time)
+
+    def test_poll_recreates_collector_after_relogin(self):
+        sensor = self.get_sensor()
+        old_collector = sensor._collector
+
+        sensor.establish_connection = mock.Mock(return_value=True)
+        sensor.si_content = mock.Mock()
+        new_collector = sensor.si_content.eventManager.CreateCollectorForEvents.return_value
+        new_collector.ReadNextEvents.return_value = []
+
+        sensor.poll()
+
+        self.assertEqual(sensor._collector, new_collector)
+        old_collector.DestroyCollector.assert_called_once_with()
+
+    def test_poll_destroys_collector_after_error(self):
+        sensor = self.get_sensor()
+        broken_collector = sensor._collector
+        broken_collector.ReadNextEvents.side_effect = Exception('collector is gone')
+        sensor.establish_connection = mock.Mock(return_value=False)
+
+        self.assertRaises(Exception, sensor.poll)
+
+        broken_collector.DestroyCollector.assert_called_once_with()
+        self.assertIsNone(sensor._collector)
+
+        # the next poll reads from a new collector
+        new_collector = mock.Mock()
+        new_collector.ReadNextEvents.return_value = []
+        sensor.si_content.eventManager.CreateCollectorForEvents.return_value = new_collector
+
+        sensor.poll()
+
+        self.assertEqual(sensor._collector, new_collector)
+        new_collector.ReadNextEvents.assert_called_with(sensor._page_size)
+
+    def test_cleanup_destroys_collector(self):
+        sensor = self.get_sensor()
+        collector = sensor._collector
+
+        sensor.cleanup()
+
+        collector.DestroyCollector.assert_called_once_with()
+        self.assertIsNone(sensor._collector)
@@ -0,0 +1,149 @@
+import mock
+import yaml
+
+from st2tests.base import BaseSensorTestCase
+from inventory_sensor import InventorySensor
+
+from pyVim import connect
+from pyVmomi import vim
+from vmwarelib import session
+
+
+class InventorySensorTestCase(BaseSensorTestCase):
+    sensor_cls = InventorySensor
+
+    def setUp(self):
+        super(InventorySensorTestCase, self).setUp()
+
+        self.cfg_new = yaml.safe_load(self.get_fixture_content('cfg_new.yaml'))
+
+        # replace the processing to connect vSphere by mock, without reusing
+        # the service instance pooled by other tests
+        connect.SmartConnect = mock.Mock()
+        session.get_pool().clear()
+
+        # pyVmomi specs don't accept mock objects
+        for target in ['inventory_sensor.vmodl', 'vmwarelib.inventory.vmodl']:
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_sensor(self):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+        sensor.setup()
+        self.collector = sensor._collector
+        return sensor
+
+    def mock_update(self, version, objects, truncated=False):
+        object_set = []
+        for moid, kind, changes in objects:
+            obj = mock.Mock(_moId=moid, _wsdlName='VirtualMachine')
+            change_set = []
+            for name, val in changes.items():
+                change = mock.Mock(op='assign', val=val)
+                change.name = name
+                change_set.append(change)
+            object_set.append(mock.Mock(obj=obj, kind=kind, changeSet=change_set))
+        return mock.Mock(version=version, truncated=truncated,
+                         filterSet=[mock.Mock(objectSet=object_set)])
+
+    def test_setup(self):
+        sensor = self.get_sensor()
+
+        content = sensor.si_content
+        types = content.viewManager.CreateContainerView.call_args[0][1]
+        self.assertEqual(len(types), 3)
+        self.assertEqual(self.collector,
+                         content.propertyCollector.CreatePropertyCollector.return_value)
+        self.assertEqual(self.collector.CreateFilter.call_count, 1)
+
+    def test_setup_invalid_type(self):
+        self.cfg_new['sensors']['inventory'] = {'objects': [{'type': 'NoSuchType'}]}
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+
+        self.assertRaises(ValueError, sensor.setup)
+
+    def test_poll_dispatches_changes(self):
+        sensor = self.get_sensor()
+        self.collector.WaitForUpdatesEx.side_effect = [
+            # the initial update reports the current state without dispatching
+            self.mock_update('1', [('vm-1', 'enter', {'name': 'vm1',
+                                                      'runtime.powerState': 'poweredOff'})],
+                             truncated=True),
+            self.mock_update('2', [('vm-2', 'enter', {'name': 'vm2',
+                                                      'runtime.powerState': 'poweredOn'})]),
+            self.mock_update('3', [('vm-1', 'modify', {'runtime.powerState': 'poweredOn'}),
+                                   ('vm-2', 'leave', {})]),
+            None,
+        ]
+
+        sensor.poll()
+        self.assertEqual(self.get_dispatched_triggers(), [])
+
+        sensor.poll()
+        sensor.poll()
+
+        contexts = self.get_dispatched_triggers()
+        self.assertEqual(len(contexts), 2)
+        self.assertEqual(contexts[0]['payload'], {
+            'vsphere': 'default',
+            'object_type': 'VirtualMachine',
+            'object_id': 'vm-1',
+            'name': 'vm1',
+            'kind': 'modify',
+            'changes': {'runtime.powerState': 'poweredOn'},
+        })
+        self.assertEqual(contexts[1]['payload']['object_id'], 'vm-2')
+        self.assertEqual(contexts[1]['payload']['name'], 'vm2')
+        self.assertEqual(contexts[1]['payload']['kind'], 'leave')
+
+        # every wait continues from the version of the previous update
+        versions = [c[0][0] for c in self.collector.WaitForUpdatesEx.call_args_list]
+        self.assertEqual(versions, ['', '1', '2', '3'])
+
+    def test_poll_recreates_collector_after_error(self):
+        sensor = self.get_sensor()
+        self.collector.WaitForUpdatesEx.side_effect = Exception('ManagedObjectNotFound')
+
+        sensor.poll()
+
+        self.collector.DestroyPropertyCollector.assert_called_with()
+        self.assertEqual(sensor._collector, None)
+
+        sensor.poll()
+
+        content = sensor.si_content
+        self.assertEqual(content.propertyCollector.CreatePropertyCollector.call_count, 2)
+
+    @mock.patch('vmwarelib.session._pool')
+    def test_poll_relogin_not_authenticated(self, mock_pool):
+        sensor = self.get_sensor()
+        expired_collector = self.collector
+        expired_collector.WaitForUpdatesEx.side_effect = vim.fault.NotAuthenticated()
+        sensor.establish_connection = mock.Mock(side_effect=[False, True])
+        sensor.si_content = mock.Mock()
+        new_collector = sensor.si_content.propertyCollector.CreatePropertyCollector.return_value
+        new_collector.WaitForUpdatesEx.return_value = None
+
+        sensor.poll()
+
+        # the expired session is dropped and the poll runs again with a new one
+        mock_pool.invalidate.assert_called_once_with('default')
+        expired_collector.DestroyPropertyCollector.assert_called_with()
+        self.assertEqual(sensor._collector, new_collector)
+        new_collector.WaitForUpdatesEx.assert_called_with('', mock.ANY)
+
+    def test_poll_empty_inventory(self):
+        sensor = self.get_sensor()
+        # nothing matches yet, the first wait expires without any update
+        self.collector.WaitForUpdatesEx.side_effect = [
+            None,
+            self.mock_update('1', [('vm-1', 'enter', {'name': 'vm1'})]),
+        ]
+
+        sensor.poll()
+        sensor.poll()
+
+        # the first object created is a change
+        contexts = self.get_dispatched_triggers()
+        self.assertEqual([c['payload']['object_id'] for c in contexts], ['vm-1'])
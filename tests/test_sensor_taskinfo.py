@@ -1,13 +1,15 @@
+import copy
+import json
 import mock
 import yaml
-import time
 
 from st2tests.base import BaseSensorTestCase
+from base import parse_isoformat
 from taskinfo_sensor import TaskInfoSensor
 
 from pyVim import connect
 from pyVmomi import vim
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 
 class TaskInfoSensorTestCase(BaseSensorTestCase):
@@ -63,14 +65,25 @@ class TaskInfoSensorTestCase(BaseSensorTestCase):
         sensor.setup()
 
         # replace TaskHistoryCollector object by mock that returns dummy TaskInfo object
+        taskinfo = self.MockUncompletedTaskInfo('task-1')
         sensor._collector = mock.Mock()
-        sensor._collector.ReadNextTasks = mock.Mock(
-            return_value=[self.MockUncompletedTaskInfo('task-1')])
+        sensor._collector.ReadNextTasks = mock.Mock(return_value=[taskinfo])
+        sensor._tracker = mock.Mock()
 
         sensor.poll()
 
-        # wait until dummy processing completes
-        time.sleep(2)
+        # the running task is handed to the tracker instead of a thread per task
+        sensor._tracker.track.assert_called_with(taskinfo.task)
+
+        # the tracker reports the task once its state changes to success
+        sensor._on_task_complete(taskinfo.task, {
+            'info.key': 'task-1',
+            'info.descriptionId': 'VirtualMachine.clone',
+            'info.queueTime': taskinfo.queueTime,
+            'info.startTime': taskinfo.startTime,
+            'info.completeTime': datetime.now(),
+            'info.state': vim.TaskInfo.State.success,
+        })
 
         contexts = self.get_dispatched_triggers()
 
@@ -87,6 +100,211 @@ class TaskInfoSensorTestCase(BaseSensorTestCase):
         self.assertEqual(contexts[1]['payload']['state'], 'success')
         self.assertNotEqual(contexts[1]['payload']['complete_time'], '')
 
+    def test_poll_recreates_collector_after_relogin(self):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+
+        sensor.setup()
+
+        old_collector = mock.Mock()
+        old_collector.ReadNextTasks = mock.Mock(return_value=[])
+        sensor._collector = old_collector
+
+        # the pooled session was replaced by a new login
+        sensor.establish_connection = mock.Mock(return_value=True)
+        sensor.si_content = mock.Mock()
+        new_collector = sensor.si_content.taskManager.CreateCollectorForTasks.return_value
+        new_collector.ReadNextTasks.return_value = []
+
+        old_tracker = mock.Mock()
+        sensor._tracker = old_tracker
+
+        sensor.poll()
+
+        sensor.establish_connection.assert_called_with('default')
+        self.assertIsNot(sensor._collector, old_collector)
+        self.assertEqual(sensor._collector, new_collector)
+        old_tracker.stop.assert_called_with()
+        self.assertIsNot(sensor._tracker, old_tracker)
+        old_collector.DestroyCollector.assert_called_once_with()
+
+    @mock.patch('vmwarelib.session._pool')
+    def test_poll_relogin_not_authenticated(self, mock_pool):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+        sensor.setup()
+
+        expired_collector = mock.Mock()
+        expired_collector.ReadNextTasks.side_effect = vim.fault.NotAuthenticated()
+        sensor._collector = expired_collector
+        sensor.establish_connection = mock.Mock(side_effect=[False, True])
+        sensor.si_content = mock.Mock()
+        new_collector = sensor.si_content.taskManager.CreateCollectorForTasks.return_value
+        new_collector.ReadNextTasks.return_value = []
+
+        sensor.poll()
+
+        # the expired session is dropped and the poll runs again with a new one
+        mock_pool.invalidate.assert_called_once_with('default')
+        self.assertEqual(sensor._collector, new_collector)
+        new_collector.ReadNextTasks.assert_called_with(sensor._page_size)
+
+    def test_poll_destroys_collector_after_error(self):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+        sensor.setup()
+
+        broken_collector = mock.Mock()
+        broken_collector.ReadNextTasks.side_effect = Exception('collector is gone')
+        sensor._collector = broken_collector
+        sensor.establish_connection = mock.Mock(return_value=False)
+
+        self.assertRaises(Exception, sensor.poll)
+
+        broken_collector.DestroyCollector.assert_called_once_with()
+        self.assertIsNone(sensor._collector)
+
+        # the next poll reads from a new collector
+        new_collector = mock.Mock()
+        new_collector.ReadNextTasks.return_value = []
+        sensor.si_content.taskManager.CreateCollectorForTasks.return_value = new_collector
+
+        sensor.poll()
+
+        self.assertEqual(sensor._collector, new_collector)
+        new_collector.ReadNextTasks.assert_called_with(sensor._page_size)
+
+    def test_cleanup_destroys_collector(self):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+        sensor.setup()
+        collector = sensor._collector = mock.Mock()
+        sensor._tracker = mock.Mock()
+
+        sensor.cleanup()
+
+        collector.DestroyCollector.assert_called_once_with()
+        sensor._tracker.stop.assert_called_with()
+
+    def test_poll_drains_collector(self):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+
+        sensor.setup()
+
+        pages = [[self.MockTaskInfo('task-%d' % i) for i in range(5)],
+                 [self.MockTaskInfo('task-%d' % i) for i in range(5, 15)],
+                 [self.MockTaskInfo('task-15')]]
+        sensor._collector = mock.Mock()
+        sensor._collector.ReadNextTasks = mock.Mock(side_effect=pages)
+
+        sensor.poll()
+
+        contexts = self.get_dispatched_triggers()
+        self.assertEqual(len(contexts), 16)
+        # the page size doubles while pages come back full, then shrinks again
+        self.assertEqual([c[0][0] for c in sensor._collector.ReadNextTasks.call_args_list],
+                         [5, 10, 20])
+        self.assertEqual(sensor._page_size, 10)
+
+    @mock.patch('taskinfo_sensor.get_driver')
+    def test_poll_reports_lag(self, mock_get_driver):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+
+        sensor.setup()
+
+        taskinfo = self.MockTaskInfo('task-0')
+        taskinfo.queueTime = datetime.now() - timedelta(seconds=120)
+        sensor._collector = mock.Mock()
+        sensor._collector.ReadNextTasks = mock.Mock(return_value=[taskinfo])
+
+        sensor.poll()
+
+        key, lag = mock_get_driver.return_value.set_gauge.call_args[0]
+        self.assertEqual(key, 'vsphere.taskinfo.lag')
+        self.assertTrue(120 <= lag < 130)
+
+    def test_poll_resumes_from_cursor(self):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+
+        sensor.setup()
+
+        taskinfos = [self.MockTaskInfo('task-1'), self.MockTaskInfo('task-2')]
+        taskinfos[1].queueTime = taskinfos[0].queueTime
+        sensor._collector = mock.Mock()
+        sensor._collector.ReadNextTasks = mock.Mock(return_value=taskinfos)
+
+        sensor.poll()
+
+        cursor = json.loads(self.sensor_service.get_value('taskinfo.cursor.default'))
+        self.assertEqual(cursor, {'queue_time': taskinfos[0].queueTime.isoformat(),
+                                  'keys': ['task-1', 'task-2']})
+
+        # a restarted sensor starts its collector at the cursor and skips the
+        # tasks it already dispatched
+        restarted = self.get_sensor_instance(config=self.cfg_new)
+        restarted.setup()
+
+        filter_spec = restarted.si_content.taskManager.CreateCollectorForTasks.call_args[1]
+        self.assertEqual(filter_spec['filter'].time.beginTime, taskinfos[0].queueTime)
+
+        newer = self.MockTaskInfo('task-3')
+        restarted._collector = mock.Mock()
+        restarted._collector.ReadNextTasks = mock.Mock(return_value=taskinfos + [newer])
+
+        restarted.poll()
+
+        contexts = self.get_dispatched_triggers()
+        self.assertEqual([c['payload']['task_id'] for c in contexts],
+                         ['task-1', 'task-2', 'task-3'])
+
+    def test_fan_out_vspheres(self):
+        config = copy.deepcopy(self.cfg_new)
+        config['vsphere']['other'] = dict(config['vsphere']['default'], host='192.168.0.2')
+        config['sensors']['taskinfo']['vspheres'] = ['*']
+        sensor = self.get_sensor_instance(config=config)
+
+        sensor.setup()
+
+        # one child sensor watches each of the configured vspheres
+        self.assertEqual([child._vsphere for child in sensor._children], ['default', 'other'])
+        for child in sensor._children:
+            child._collector = mock.Mock()
+            child._collector.ReadNextTasks = mock.Mock(
+                return_value=[self.MockTaskInfo('task-%s' % child._vsphere)])
+
+        sensor.poll()
+
+        contexts = self.get_dispatched_triggers()
+        self.assertEqual(sorted((c['payload']['vsphere'], c['payload']['task_id'])
+                                for c in contexts),
+                         [('default', 'task-default'), ('other', 'task-other')])
+
+        for child in sensor._children:
+            child._tracker = mock.Mock()
+        sensor.cleanup()
+        for child in sensor._children:
+            child._tracker.stop.assert_called_with()
+
+    def test_parse_isoformat(self):
+        utc = timezone.utc
+        for value in [datetime(2024, 1, 2, 3, 4, 5),
+                      datetime(2024, 1, 2, 3, 4, 5, 600000),
+                      datetime(2024, 1, 2, 3, 4, 5, tzinfo=utc),
+                      datetime(2024, 1, 2, 3, 4, 5, 6, tzinfo=timezone(timedelta(hours=-5)))]:
+            self.assertEqual(parse_isoformat(value.isoformat()), value)
+
+    def test_is_read_compares_times(self):
+        sensor = self.get_sensor_instance(config=self.cfg_new)
+        sensor._cursor = {'queue_time': '2024-01-02T09:00:00+00:00', 'keys': ['task-1']}
+
+        # queued before the cursor, although its isoformat sorts after it
+        earlier = self.MockTaskInfo('task-0')
+        earlier.queueTime = datetime(2024, 1, 2, 10, 30, tzinfo=timezone(timedelta(hours=2)))
+        same = self.MockTaskInfo('task-1')
+        same.queueTime = datetime(2024, 1, 2, 9, 0, tzinfo=timezone.utc)
+        later = self.MockTaskInfo('task-2')
+        later.queueTime = datetime(2024, 1, 2, 9, 0, 0, 1, tzinfo=timezone.utc)
+
+        self.assertTrue(sensor._is_read(earlier))
+        self.assertTrue(sensor._is_read(same))
+        self.assertFalse(sensor._is_read(later))
+
     class MockTaskInfo(object):
         def __init__(self, taskid='Task-1', op_name='VirtualMachine.clone'):
             self.key = taskid
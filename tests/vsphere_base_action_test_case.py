@@ -80,3 +80,32 @@ class VsphereBaseActionTestCase(BaseActionTestCase):
         action.si_content.viewManager.CreateContainerView.return_value =\
             container
         return (action, mock_vm)
+
+    def mock_property_collector(self, content, entities):
+        """
+        Configure a mock ServiceContent so that PropertyCollector queries made
+        through vmwarelib.inventory return the given entities in a single page.
+
+        Args:
+        - content: the mock ServiceContent
+        - entities: list of (entity, dict of property path -> value) tuples
+
+        Returns:
+        - the mock PropertyCollector
+        """
+        patcher = mock.patch('vmwarelib.inventory.vmodl')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        objects = []
+        for entity, properties in entities:
+            prop_set = []
+            for path, value in properties.items():
+                prop = mock.Mock(val=value)
+                prop.name = path
+                prop_set.append(prop)
+            objects.append(mock.Mock(obj=entity, propSet=prop_set))
+
+        collector = content.propertyCollector
+        collector.RetrievePropertiesEx.return_value = mock.Mock(objects=objects, token=None)
+        return collector